@@ -0,0 +1,27 @@
+"""
+ASGI-точка входа приложения.
+
+Позволяет запускать приложение под ASGI-сервером, например:
+    uvicorn asgi:asgi_app --host 0.0.0.0 --port 5000
+
+Главная страница обрабатывается асинхронным вариантом (WEATHER_ASYNC_VIEWS=1 по умолчанию).
+Запросы выполняются в пуле из ASGI_WORKERS потоков (a2wsgi), поэтому один процесс
+обрабатывает несколько запросов одновременно.
+"""
+import os
+
+# Точка входа ASGI рассчитана на асинхронный вариант главной страницы, если в окружении не задано другое
+os.environ.setdefault('WEATHER_ASYNC_VIEWS', '1')
+
+from a2wsgi import WSGIMiddleware
+
+from config import asgi_workers
+from main import app, main_models
+from prefetch import prefetch_scheduler
+
+main_models()
+
+if prefetch_scheduler is not None:
+    prefetch_scheduler.start()
+
+asgi_app = WSGIMiddleware(app, workers=asgi_workers)
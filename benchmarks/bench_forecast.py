@@ -0,0 +1,83 @@
+"""
+Микро-бенчмарк сборки почасового прогноза.
+
+Сравнивает прежнюю сборку словаря через pandas.DataFrame.iterrows() с векторизованной
+build_weather_data на одинаковых данных (7 дней почасовых значений, как отдает Open-Meteo).
+
+Запуск из корня репозитория: python -m benchmarks.bench_forecast
+"""
+import time
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from get_weather import build_weather_data, get_weather_code, get_is_day, HOURLY_VARIABLES
+
+
+def make_hourly(hours: int = 168) -> dict:
+    rng = np.random.default_rng(0)
+    start = int(time.time()) // 3600 * 3600 - 3600
+
+    hourly = {"time": np.arange(start, start + hours * 3600, 3600, dtype=np.int64)}
+    hourly["temperature_2m"] = rng.uniform(-30, 30, hours).astype(np.float32)
+    hourly["relative_humidity_2m"] = rng.uniform(0, 100, hours).astype(np.float32)
+    hourly["wind_speed_10m"] = rng.uniform(0, 20, hours).astype(np.float32)
+    hourly["precipitation_probability"] = rng.uniform(0, 100, hours).astype(np.float32)
+    hourly["is_day"] = rng.integers(0, 2, hours).astype(np.float32)
+    hourly["weather_code"] = rng.choice([0, 2, 3, 45, 61, 71, 95], hours).astype(np.float32)
+
+    return hourly
+
+
+def legacy_weather_data(hourly: dict) -> dict:
+    """Прежняя реализация: DataFrame, фильтрация и построчный цикл iterrows()."""
+    times = hourly["time"]
+    hourly_data = {"date": pd.date_range(
+        start=pd.to_datetime(times[0], unit="s", utc=True),
+        end=pd.to_datetime(times[-1] + 3600, unit="s", utc=True),
+        freq=pd.Timedelta(seconds=3600),
+        inclusive="left"
+    )}
+    for name in HOURLY_VARIABLES:
+        hourly_data[name] = hourly[name]
+
+    hourly_dataframe = pd.DataFrame(data=hourly_data)
+
+    current_time = pd.Timestamp.now(tz="UTC")
+    end_time = current_time + pd.DateOffset(hours=24)
+
+    filtered_data = hourly_dataframe[
+        (hourly_dataframe['date'] >= current_time) & (hourly_dataframe['date'] <= end_time)]
+
+    weather_data = {}
+
+    for index, row in filtered_data.iterrows():
+        is_day = int(row['is_day'])
+        weather_data.update({row['date'].strftime('%H'): {
+            "Temperature": f"{int(row['temperature_2m'])}°",
+            "Relative Humidity": f"{int(row['relative_humidity_2m'])}%",
+            "Wind Speed": f"{int(row['wind_speed_10m'])} m/s",
+            "Precipitation Probability": f"{int(row['precipitation_probability'])}%",
+            "Is Day": get_is_day(is_day),
+            'weather_code': get_weather_code(int(row['weather_code']), is_day)
+        }})
+
+    return weather_data
+
+
+def main(number: int = 200) -> None:
+    hourly = make_hourly()
+
+    assert legacy_weather_data(hourly) == build_weather_data(hourly), 'results differ'
+
+    legacy = min(timeit.repeat(lambda: legacy_weather_data(hourly), number=number, repeat=5)) / number
+    vectorized = min(timeit.repeat(lambda: build_weather_data(hourly), number=number, repeat=5)) / number
+
+    print(f'iterrows:   {legacy * 1e6:10.1f} us per forecast')
+    print(f'vectorized: {vectorized * 1e6:10.1f} us per forecast')
+    print(f'speedup:    {legacy / vectorized:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
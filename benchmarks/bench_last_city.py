@@ -0,0 +1,81 @@
+"""
+Бенчмарк поиска последнего города пользователя (get_last_searched_city) при росте search_history.
+
+Для каждого размера истории заполняет временную базу и измеряет среднее время запроса
+с индексом (user_id, id) и без него - для пользователей с историей и для новых пользователей,
+которых нет в таблице (без индекса для них просматривается вся таблица).
+Время с индексом должно оставаться почти постоянным.
+
+Запуск из корня репозитория: python -m benchmarks.bench_last_city [размеры через пробел]
+Например: python -m benchmarks.bench_last_city 10000 100000 1000000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import models
+from models import close_pool, get_connection, get_last_searched_city
+
+USERS = 10_000
+BATCH = 50_000
+LOOKUPS = 2_000
+
+LAST_CITY_QUERY = "SELECT city FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT 1"
+
+
+def fill_history(rows: int) -> None:
+    rng = random.Random(0)
+
+    with get_connection() as conn:
+        for start in range(0, rows, BATCH):
+            conn.executemany(
+                "INSERT INTO search_history (user_id, city, search_date) VALUES (?, ?, ?)",
+                [(f'10.0.{rng.randrange(USERS)}', 'Москва', '2024-01-01T00:00:00')
+                 for _ in range(min(BATCH, rows - start))]
+            )
+
+
+def time_lookups(lookup, lookups: int, prefix: str = '10.0') -> float:
+    rng = random.Random(1)
+    users = [f'{prefix}.{rng.randrange(USERS)}' for _ in range(lookups)]
+
+    started = time.perf_counter()
+    for user_id in users:
+        lookup(user_id)
+
+    return (time.perf_counter() - started) / lookups
+
+
+def main(sizes: list[int]) -> None:
+    print(f'{"rows":>10} {"indexed, us":>12} {"no index, us":>13} {"new user indexed, us":>21} '
+          f'{"new user no index, us":>22}')
+
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch('models.db_path', os.path.join(tmp_dir, 'bench.db')), \
+                patch('models.logger.disabled', True):
+            fill_history(rows)
+
+            indexed = time_lookups(get_last_searched_city, LOOKUPS)
+            new_indexed = time_lookups(get_last_searched_city, LOOKUPS, prefix='10.1')
+
+            with get_connection() as conn:
+                conn.execute("DROP INDEX idx_search_history_user_id")
+
+                def scan(user_id):
+                    return conn.execute(LAST_CITY_QUERY, (user_id,)).fetchall()
+
+                not_indexed = time_lookups(scan, max(10, LOOKUPS * 1000 // rows))
+                new_not_indexed = time_lookups(scan, max(5, LOOKUPS * 100 // rows), prefix='10.1')
+
+            close_pool()
+
+        print(f'{rows:>10} {indexed * 1e6:>12.1f} {not_indexed * 1e6:>13.1f} {new_indexed * 1e6:>21.1f} '
+              f'{new_not_indexed * 1e6:>22.1f}')
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
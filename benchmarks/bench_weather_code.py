@@ -0,0 +1,91 @@
+"""
+Микро-бенчмарк выбора иконки по коду погоды.
+
+Сравнивает прежнюю get_weather_code (словарь создается и изменяется при каждом вызове,
+плюс запись в лог) с поиском по таблице 2x100 - поэлементно и сразу для массива из 24 часов.
+
+Запуск из корня репозитория: python -m benchmarks.bench_weather_code
+"""
+import logging
+import timeit
+
+import numpy as np
+
+from get_weather import get_weather_code, get_weather_icons
+
+logger = logging.getLogger('get_weather')
+
+
+def legacy_weather_code(weather_cod: int, is_day: int) -> str:
+    """Прежняя реализация get_weather_code."""
+    logger.info('Start get_weather_code')
+
+    weather_codes = {
+        0: '../static/img/clear_day-1.svg',
+        1: '../static/img/clear_day-1.svg',
+        2: '../static/img/clear_day-1.svg',
+        3: '../static/img/clear_day-1.svg',
+        45: '../static/img/fog-1.svg',
+        48: '../static/img/fog-1.svg',
+        51: '../static/img/cloud-1.svg',
+        53: '../static/img/cloud-1.svg',
+        55: '../static/img/cloud-1.svg',
+        56: '../static/img/rainy-1.svg',
+        57: '../static/img/rainy-1.svg',
+        61: '../static/img/rainy-1.svg',
+        63: '../static/img/rainy-1.svg',
+        65: '../static/img/rainy-1.svg',
+        66: '../static/img/rainy-1.svg',
+        67: '../static/img/rainy-1.svg',
+        71: '../static/img/cloudy_snowing-1.svg',
+        73: '../static/img/cloudy_snowing-1.svg',
+        75: '../static/img/cloudy_snowing-1.svg',
+        77: '../static/img/cloudy_snowing-1.svg',
+        80: '../static/img/rainy-1.svg',
+        81: '../static/img/rainy-1.svg',
+        82: '../static/img/rainy-1.svg',
+        85: '../static/img/cloudy_snowing-1.svg',
+        86: '../static/img/ac_unit-1.svg',
+        95: '../static/img/thunderstorm-1.svg',
+        96: '../static/img/thunderstorm-1.svg',
+        99: '../static/img/thunderstorm-1.svg'
+    }
+
+    if weather_cod in weather_codes:
+        if weather_cod < 4 and is_day == 0:
+            for i in range(4):
+                weather_codes[i] = '../static/img/bedtime-1.svg'
+        elif weather_cod < 4 and is_day == 1:
+            for i in range(4):
+                weather_codes[i] = '../static/img/clear_day-1.svg'
+
+        return weather_codes[weather_cod]
+    else:
+        return '../static/img/clear_day-1.svg'
+
+
+def main(number: int = 2000) -> None:
+    rng = np.random.default_rng(0)
+    codes = rng.choice([0, 1, 2, 3, 45, 61, 71, 95, 4], 24)
+    is_day = rng.integers(0, 2, 24)
+    pairs = list(zip(codes.tolist(), is_day.tolist()))
+
+    expected = [legacy_weather_code(code, day) for code, day in pairs]
+    assert [get_weather_code(code, day) for code, day in pairs] == expected
+    assert get_weather_icons(codes, is_day).tolist() == expected
+
+    timings = {
+        'legacy get_weather_code x24': lambda: [legacy_weather_code(code, day) for code, day in pairs],
+        'table get_weather_code x24': lambda: [get_weather_code(code, day) for code, day in pairs],
+        'table get_weather_icons (24)': lambda: get_weather_icons(codes, is_day),
+    }
+
+    baseline = None
+    for name, func in timings.items():
+        per_call = min(timeit.repeat(func, number=number, repeat=5)) / number
+        baseline = baseline or per_call
+        print(f'{name:30s} {per_call * 1e6:8.2f} us  x{baseline / per_call:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Локальные заглушки Open-Meteo и Nominatim для нагрузочного тестирования.
+
+Заглушка Open-Meteo отвечает настоящими сообщениями WeatherApiResponse в формате flatbuffers
+(так же, как api.open-meteo.com с параметром format=flatbuffers), поэтому ответ проходит
+весь путь декодирования приложения. Заглушка Nominatim возвращает JSON в формате /search.
+Координаты и значения прогноза детерминированы: зависят только от запроса.
+
+Каждый сервер отвечает с настраиваемой задержкой (сек), чтобы моделировать время ответа внешнего API.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import flatbuffers
+import numpy as np
+from openmeteo_sdk.Variable import Variable
+
+# Поддерживаемые почасовые переменные и диапазоны их значений
+_VARIABLES = {
+    "temperature_2m": (Variable.temperature, (-30, 30)),
+    "relative_humidity_2m": (Variable.relative_humidity, (0, 100)),
+    "wind_speed_10m": (Variable.wind_speed, (0, 20)),
+    "precipitation_probability": (Variable.precipitation_probability, (0, 100)),
+    "is_day": (Variable.is_day, None),
+    "weather_code": (Variable.weather_code, None),
+}
+_WEATHER_CODES = np.array([0, 1, 2, 3, 45, 51, 61, 71, 80, 95], dtype=np.float32)
+
+FORECAST_HOURS = 168
+
+
+def _seed(*parts) -> int:
+    return int.from_bytes(hashlib.sha1('|'.join(map(str, parts)).encode('utf-8')).digest()[:8], 'little')
+
+
+def build_forecast_message(lat: float, long: float, start: int, hourly: list[str],
+                           hours: int = FORECAST_HOURS) -> bytes:
+    """
+    Собирает сообщение WeatherApiResponse с почасовыми переменными.
+
+    Поля таблиц задаются по номерам слотов схемы openmeteo_sdk (в пакете нет функций сборки).
+
+    :param lat: Широта в градусах.
+    :param long: Долгота в градусах.
+    :param start: Время начала первого часа (unix time, UTC).
+    :param hourly: Названия переменных (из _VARIABLES) в порядке запроса.
+    :param hours: Количество часов прогноза.
+    :return: Bytes: Сообщение с 4-байтовым префиксом длины, как в ответе Open-Meteo.
+    """
+    rng = np.random.default_rng(_seed(round(lat, 4), round(long, 4), start))
+    builder = flatbuffers.Builder(hours * 4 * len(hourly) + 1024)
+
+    variables = []
+    for name in hourly:
+        variable, bounds = _VARIABLES[name]
+
+        if name == "is_day":
+            values = ((np.arange(hours) + 3) % 24 < 15).astype(np.float32)
+        elif name == "weather_code":
+            values = rng.choice(_WEATHER_CODES, hours)
+        else:
+            values = rng.uniform(*bounds, hours).astype(np.float32)
+
+        values_offset = builder.CreateNumpyVector(values)
+        builder.StartObject(13)
+        builder.PrependUint8Slot(0, variable, 0)
+        builder.PrependUOffsetTRelativeSlot(3, values_offset, 0)
+        variables.append(builder.EndObject())
+
+    builder.StartVector(4, len(variables), 4)
+    for offset in reversed(variables):
+        builder.PrependUOffsetTRelative(offset)
+    variables_offset = builder.EndVector()
+
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + hours * 3600, 0)
+    builder.PrependInt32Slot(2, 3600, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variables_offset, 0)
+    hourly_offset = builder.EndObject()
+
+    timezone = builder.CreateString("Europe/Moscow")
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(0, lat, 0)
+    builder.PrependFloat32Slot(1, long, 0)
+    builder.PrependInt32Slot(6, 3 * 3600, 0)
+    builder.PrependUOffsetTRelativeSlot(7, timezone, 0)
+    builder.PrependUOffsetTRelativeSlot(11, hourly_offset, 0)
+    builder.Finish(builder.EndObject())
+
+    message = builder.Output()
+
+    return len(message).to_bytes(4, 'little') + bytes(message)
+
+
+def fake_location(query: str) -> tuple[float, float] | None:
+    """
+    Возвращает детерминированные координаты для названия города.
+
+    :param query: Название города.
+    :return: Кортеж (широта, долгота) в пределах России или None, если название начинается
+        с 'nowhere' - так можно проверить ответ "город не найден".
+    """
+    if query.strip().lower().startswith('nowhere'):
+        return None
+
+    seed = _seed(query.strip().lower())
+
+    return 42 + (seed % 2600) / 100, 30 + (seed // 2600 % 13000) / 100
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: 'FakeUpstream'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        with self.server.stats_lock:
+            self.server.requests += 1
+
+        status, content_type, body = self.server.respond(url.path, params)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    """
+    HTTP-сервер заглушки, работающий в фоновом потоке.
+
+    :ivar latency: Задержка ответа (сек).
+    :ivar requests: Количество обработанных запросов.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.requests = 0
+        self.stats_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> str:
+        """Адрес сервера в виде 'host:port'."""
+        host, port = self.server_address[:2]
+        return f'{host}:{port}'
+
+    def respond(self, path: str, params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        raise NotImplementedError
+
+    def start(self) -> 'FakeUpstream':
+        self._thread = threading.Thread(target=self.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class FakeOpenMeteo(FakeUpstream):
+    """
+    Заглушка Open-Meteo: /v1/forecast?latitude=...&longitude=...&hourly=...&format=flatbuffers.
+
+    Для нескольких точек (повторяющиеся параметры или значения через запятую)
+    возвращает по сообщению на каждую точку в том же порядке.
+    """
+
+    def respond(self, path: str, params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        latitudes = [float(value) for item in params.get('latitude', []) for value in item.split(',')]
+        longitudes = [float(value) for item in params.get('longitude', []) for value in item.split(',')]
+        hourly = [name for item in params.get('hourly', []) for name in item.split(',')]
+        hours = int(params.get('forecast_days', ['7'])[0]) * 24
+
+        if not latitudes or len(latitudes) != len(longitudes):
+            return self.error('Parameter latitude and longitude must have the same number of elements')
+
+        unknown = [name for name in hourly if name not in _VARIABLES]
+        if unknown:
+            return self.error(f'Cannot initialize WeatherVariable from invalid String value {unknown[0]}')
+
+        start = int(time.time()) // 3600 * 3600 - 3600
+        body = b''.join(build_forecast_message(lat, long, start, hourly, hours)
+                        for lat, long in zip(latitudes, longitudes))
+
+        return 200, 'application/octet-stream', body
+
+    @staticmethod
+    def error(reason: str) -> tuple[int, str, bytes]:
+        return 400, 'application/json', json.dumps({'error': True, 'reason': reason}).encode('utf-8')
+
+
+class FakeNominatim(FakeUpstream):
+    """
+    Заглушка Nominatim: /search?q=...&format=json.
+    """
+
+    def respond(self, path: str, params: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        query = params.get('q', [''])[0]
+        location = fake_location(query)
+
+        if location is None:
+            return 200, 'application/json', b'[]'
+
+        lat, long = location
+        body = json.dumps([{
+            'place_id': _seed(query) % 10 ** 9,
+            'lat': f'{lat:.7f}',
+            'lon': f'{long:.7f}',
+            'display_name': f'{query}, Россия',
+            'boundingbox': [f'{lat - 0.1:.7f}', f'{lat + 0.1:.7f}', f'{long - 0.1:.7f}', f'{long + 0.1:.7f}'],
+        }], ensure_ascii=False).encode('utf-8')
+
+        return 200, 'application/json', body
@@ -0,0 +1,301 @@
+"""
+Нагрузочный тест маршрутов прогноза с локальными заглушками Open-Meteo и Nominatim.
+
+Запускает заглушки внешних API (см. benchmarks/fake_upstreams.py) с заданными задержками,
+направляет на них приложение через переменные окружения, а базу данных, HTTP-кэш и журнал
+размещает во временном каталоге. Затем несколько потоков одновременно отправляют в main.app
+GET- и POST-запросы главной страницы и запросы /api/forecast. Города выбираются с частотой,
+убывающей с номером города (популярные города запрашиваются чаще), часть городов отсутствует
+в офлайн-справочнике и геокодируется через Nominatim.
+
+Для каждого вида запроса и каждого этапа обработки (гистограмма weather_stage_duration_seconds)
+выводятся p50/p95/p99 (мс) и количество в секунду. Результат можно сохранить как базовый
+(--save-baseline) и сравнить с ним (--check): при ухудшении p95/p99 или пропускной способности
+больше чем на --tolerance скрипт завершается с кодом 1.
+
+Запуск из корня репозитория: python -m benchmarks.load_test [параметры]
+Например: python -m benchmarks.load_test --requests 3000 --concurrency 16 --check
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.fake_upstreams import FakeNominatim, FakeOpenMeteo
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'load_test.json')
+
+SCENARIOS = ('get', 'post', 'api', 'home')
+
+# Изменения меньше этой величины (мс) не считаются ухудшением: для этапов, занимающих
+# доли миллисекунды, относительный разброс между запусками слишком велик
+MIN_REGRESSION_MS = 2.0
+
+# Минимальное количество значений для сравнения перцентилей: по нескольким десяткам значений
+# p99 фактически совпадает с максимумом
+MIN_SAMPLES = 100
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """
+    Разбирает доли видов запросов из строки вида 'get=0.5,post=0.3,api=0.15,home=0.05'.
+
+    :param value: Строка с парами вид=доля через запятую.
+    :return: Dict: Доля каждого вида запроса.
+    """
+    mix = {}
+
+    for item in value.split(','):
+        name, _, share = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'unknown request kind: {name.strip()}')
+        mix[name.strip()] = float(share)
+
+    return mix
+
+
+def configure_environment(tmp_dir: str, open_meteo: FakeOpenMeteo, nominatim: FakeNominatim) -> None:
+    """
+    Направляет приложение на заглушки. Вызывается до импорта модулей приложения,
+    так как настройки читаются из переменных окружения при импорте config.
+    """
+    os.environ.update({
+        'OPEN_METEO_URL': f'http://{open_meteo.address}/v1/forecast',
+        'OPEN_METEO_HTTP_CACHE': os.path.join(tmp_dir, 'http_cache'),
+        'NOMINATIM_DOMAIN': nominatim.address,
+        'NOMINATIM_SCHEME': 'http',
+        'NOMINATIM_BUDGET_PER_MINUTE': '0',
+        'CACHE_BACKEND_PATH': os.path.join(tmp_dir, 'shared_cache.db'),
+        'LOG_FILE': os.path.join(tmp_dir, 'weather_log.log'),
+        'PREFETCH_ENABLED': '0',
+        'METRICS_ENABLED': '1',
+    })
+
+
+def make_city_pool(size: int, unknown_share: float, rng: random.Random) -> list[str]:
+    """
+    Составляет список городов: из офлайн-справочника и вымышленные (геокодируются через Nominatim,
+    каждый десятый из них заглушка не находит).
+    """
+    from config import gazetteer_path
+
+    with open(gazetteer_path, encoding='utf-8') as file:
+        known = [line.split('\t', 1)[0] for line in file if line.strip() and not line.startswith('#')]
+
+    unknown_count = round(size * unknown_share)
+    cities = rng.sample(known, size - unknown_count)
+    cities += [f'Nowhere-{i}' if i % 10 == 9 else f'Loadtest-{i}' for i in range(unknown_count)]
+    rng.shuffle(cities)
+
+    return cities
+
+
+def percentiles(samples: list[float], elapsed: float) -> dict:
+    values = np.asarray(samples) * 1000
+
+    return {
+        'count': len(samples),
+        'rps': round(len(samples) / elapsed, 1),
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def run_load(app, cities: list[str], requests: int, concurrency: int, mix: dict[str, float], users: int,
+             seed: int) -> tuple[dict[str, list[float]], dict[str, int], float]:
+    """
+    Отправляет requests запросов из concurrency потоков.
+
+    :return: Кортеж (время ответа по видам запросов, количество ошибок по видам запросов, время теста в секундах).
+    """
+    weights = [1 / (rank + 1) for rank in range(len(cities))]
+    kinds, shares = zip(*mix.items())
+    latencies: dict[str, list[float]] = {kind: [] for kind in kinds}
+    errors: dict[str, int] = {kind: 0 for kind in kinds}
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker(index: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        client = app.test_client()
+
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+
+            kind = rng.choices(kinds, shares)[0]
+            city = rng.choices(cities, weights)[0]
+            environ = {'REMOTE_ADDR': f'10.{index}.{rng.randrange(users) // 256}.{rng.randrange(users) % 256}'}
+
+            started = time.perf_counter()
+            if kind == 'get':
+                response = client.get('/', query_string={'city': city}, environ_base=environ)
+            elif kind == 'post':
+                response = client.post('/', data={'city': city}, environ_base=environ)
+            elif kind == 'api':
+                response = client.get('/api/forecast', query_string={'city': city},
+                                      headers={'Accept-Encoding': 'gzip'}, environ_base=environ)
+            else:
+                response = client.get('/', environ_base=environ)
+            duration = time.perf_counter() - started
+
+            failed = response.status_code >= 500 or b'An error occurred' in response.data
+
+            with lock:
+                latencies[kind].append(duration)
+                errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies, errors, time.perf_counter() - started
+
+
+def print_report(results: dict[str, dict], errors: dict[str, int], upstream_requests: dict[str, int]) -> None:
+    print(f'{"":36} {"count":>7} {"req/s":>9} {"p50, ms":>9} {"p95, ms":>9} {"p99, ms":>9}')
+
+    for name, result in results.items():
+        print(f'{name:36} {result["count"]:>7} {result["rps"]:>9} {result["p50"]:>9} {result["p95"]:>9} '
+              f'{result["p99"]:>9}')
+
+    print('errors: ' + ', '.join(f'{kind}={count}' for kind, count in errors.items()))
+    print('upstream requests: ' + ', '.join(f'{name}={count}' for name, count in upstream_requests.items()))
+
+
+def check_baseline(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """
+    Сравнивает результаты с базовыми.
+
+    :return: List: Описания ухудшений (пустой список, если ухудшений нет).
+    """
+    regressions = []
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or min(result['count'], base['count']) < MIN_SAMPLES:
+            continue
+
+        for key in ('p95', 'p99'):
+            if result[key] > base[key] * (1 + tolerance) and result[key] - base[key] > MIN_REGRESSION_MS:
+                regressions.append(f'{name}: {key} {base[key]} -> {result[key]} ms')
+
+        # Пропускная способность этапов зависит от доли видов запросов, поэтому сравнивается
+        # только для видов запросов и теста в целом
+        if not name.startswith('stage:') and result['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: req/s {base["rps"]} -> {result["rps"]}')
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--requests', type=int, default=2000, help='количество запросов')
+    parser.add_argument('--warmup', type=int, default=100, help='количество запросов перед измерением')
+    parser.add_argument('--concurrency', type=int, default=8, help='количество одновременных клиентов')
+    parser.add_argument('--cities', type=int, default=200, help='количество разных городов')
+    parser.add_argument('--unknown-share', type=float, default=0.2,
+                        help='доля городов, отсутствующих в офлайн-справочнике')
+    parser.add_argument('--users', type=int, default=1000, help='количество разных пользователей (IP-адресов)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('get=0.5,post=0.3,api=0.15,home=0.05'),
+                        help='доли видов запросов')
+    parser.add_argument('--open-meteo-latency', type=float, default=0.05, help='задержка Open-Meteo (сек)')
+    parser.add_argument('--nominatim-latency', type=float, default=0.1, help='задержка Nominatim (сек)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='файл базовых результатов')
+    parser.add_argument('--save-baseline', action='store_true', help='сохранить результат как базовый')
+    parser.add_argument('--check', action='store_true', help='сравнить результат с базовым')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='допустимое относительное ухудшение p95/p99 и req/s')
+    args = parser.parse_args()
+
+    open_meteo = FakeOpenMeteo(args.open_meteo_latency).start()
+    nominatim = FakeNominatim(args.nominatim_latency).start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        configure_environment(tmp_dir, open_meteo, nominatim)
+
+        import metrics
+        import models
+        from history_writer import search_history_writer
+        from main import app
+
+        models.db_path = os.path.join(tmp_dir, 'weather.db')
+        models.main_models()
+
+        cities = make_city_pool(args.cities, args.unknown_share, random.Random(args.seed))
+
+        if args.warmup:
+            run_load(app, cities, args.warmup, args.concurrency, args.mix, args.users, args.seed + 1)
+
+        stages: dict[str, list[float]] = {}
+        observe = metrics.stage_duration.observe
+
+        def record(value: float, *label_values) -> None:
+            stages.setdefault(label_values[0], []).append(value)
+            observe(value, *label_values)
+
+        with patch.object(metrics.stage_duration, 'observe', record):
+            latencies, errors, elapsed = run_load(app, cities, args.requests, args.concurrency, args.mix,
+                                                  args.users, args.seed)
+
+        if search_history_writer is not None:
+            search_history_writer.stop(5)
+        models.close_pool()
+
+    open_meteo.stop()
+    nominatim.stop()
+
+    results = {'total': percentiles([value for values in latencies.values() for value in values], elapsed)}
+    results.update((kind, percentiles(values, elapsed)) for kind, values in latencies.items() if values)
+    results.update((f'stage:{stage}', percentiles(values, elapsed)) for stage, values in sorted(stages.items()))
+
+    print_report(results, errors, {'open_meteo': open_meteo.requests, 'nominatim': nominatim.requests})
+
+    params = {name: value for name, value in vars(args).items()
+              if name not in ('baseline', 'save_baseline', 'check', 'tolerance')}
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({'params': params, 'results': results}, file, ensure_ascii=False, indent=2)
+            file.write('\n')
+        print(f'baseline saved to {args.baseline}')
+
+    status = 1 if any(errors.values()) else 0
+
+    if args.check:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+
+        if baseline['params'] != params:
+            print('warning: baseline was recorded with different parameters', file=sys.stderr)
+
+        regressions = check_baseline(results, baseline['results'], args.tolerance)
+
+        for regression in regressions:
+            print(f'regression: {regression}', file=sys.stderr)
+
+        if regressions:
+            status = 1
+        else:
+            print('no regressions against baseline')
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+import atexit
+import logging.config
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (cache_backend, cache_backend_path, cache_backend_size, open_meteo_budget_per_minute,
+                    nominatim_budget_per_minute)
+from logging_config import dict_config
+from models import ConnectionPool, count_round_trip
+from resilience import UpstreamUnavailable
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('cache_backends')
+
+# Бюджеты запросов к внешним API: название -> максимальное количество запросов в минуту (0 - без ограничения)
+UPSTREAM_BUDGETS = {
+    'open_meteo': open_meteo_budget_per_minute,
+    'nominatim': nominatim_budget_per_minute,
+}
+BUDGET_WINDOW = 60
+
+
+class UpstreamBudgetExceeded(UpstreamUnavailable):
+    """
+    Бюджет запросов к внешнему API на текущее окно исчерпан.
+    """
+
+    def __init__(self, upstream: str, retry_after: float | None = None):
+        super().__init__(upstream, 'request budget exceeded', retry_after)
+
+
+class CacheBackend:
+    """
+    Хранилище второго уровня для кэшей прогнозов и геокодирования.
+
+    Хранит байтовые значения по строковому ключу до момента expires_at (unix time)
+    и считает запросы к внешним API в окнах фиксированной длины. Реализация, общая
+    для нескольких процессов, позволяет рабочим процессам gunicorn использовать один
+    прогретый кэш и один бюджет запросов.
+    """
+
+    def get(self, key: str, now: float | None = None) -> bytes | None:
+        """
+        Возвращает значение, действующее в момент now.
+
+        :param key: Ключ.
+        :param now: Момент времени (unix time). По умолчанию используется time.time().
+        :return: Bytes или None, если записи нет или она устарела.
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        """
+        Сохраняет значение.
+
+        :param key: Ключ.
+        :param value: Значение.
+        :param expires_at: Время устаревания записи (unix time).
+        :return: None
+        """
+        raise NotImplementedError
+
+    def acquire(self, budget: str, limit: int, window: float = BUDGET_WINDOW, now: float | None = None) -> bool:
+        """
+        Учитывает один запрос в бюджете budget.
+
+        :param budget: Название бюджета (например, внешнего API).
+        :param limit: Максимальное количество запросов за окно.
+        :param window: Длина окна (сек).
+        :param now: Текущее время (unix time). По умолчанию используется time.time().
+        :return: Bool: True, если запрос укладывается в бюджет текущего окна.
+        """
+        raise NotImplementedError
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков хранилища.
+
+        :return: Dict: Количество попаданий, промахов, записей и ошибок.
+        """
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи и счетчики бюджетов.
+
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Хранилище в памяти процесса с вытеснением по LRU. Не разделяется между процессами.
+    """
+
+    def __init__(self, max_entries: int = cache_backend_size):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._budgets: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'errors': 0}
+
+    def get(self, key: str, now: float | None = None) -> bytes | None:
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[1] <= now:
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            self._stats['sets'] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def acquire(self, budget: str, limit: int, window: float = BUDGET_WINDOW, now: float | None = None) -> bool:
+        if now is None:
+            now = time.time()
+
+        current = int(now // window)
+
+        with self._lock:
+            window_index, used = self._budgets.get(budget, (current, 0))
+            used = used + 1 if window_index == current else 1
+            self._budgets[budget] = (current, used)
+
+        return used <= limit
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._budgets.clear()
+
+
+def init_cache_schema(conn: sqlite3.Connection) -> None:
+    """
+    Создает таблицы общего хранилища, если их нет.
+
+    :param conn: Соединение с базой данных.
+    :return: None
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires_at ON cache_entries (expires_at)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache_budgets (
+            name TEXT PRIMARY KEY,
+            window_index INTEGER NOT NULL,
+            used INTEGER NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Хранилище в файле SQLite в режиме WAL, общее для всех процессов на сервере.
+
+    Чтение в режиме WAL не блокируется записью других процессов. Бюджет учитывается одним
+    выражением INSERT ... ON CONFLICT DO UPDATE ... RETURNING, поэтому одновременные запросы
+    разных процессов не превышают его. Устаревшие записи удаляются не чаще раза в purge_interval
+    секунд. Ошибки SQLite не прерывают обработку запроса: чтение считается промахом, запись
+    пропускается, а бюджет не ограничивает запросы.
+    """
+
+    def __init__(self, path: str = cache_backend_path, purge_interval: float = 60):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._pool: ConnectionPool | None = None
+        self._pool_pid: int | None = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'errors': 0, 'purged': 0}
+        self._next_purge = 0.0
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def _get_pool(self) -> ConnectionPool:
+        # Соединения SQLite нельзя использовать после fork, поэтому пул создается в каждом процессе
+        pool = self._pool
+        if pool is not None and self._pool_pid == os.getpid():
+            return pool
+
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                logger.info('Open shared cache %s', self.path)
+                self._pool = ConnectionPool(self.path, init=init_cache_schema)
+                self._pool_pid = os.getpid()
+
+            return self._pool
+
+    def _connection(self):
+        # Обращения к общему хранилищу учитываются вместе с обращениями к основной базе (X-DB-Round-Trips)
+        count_round_trip()
+
+        return self._get_pool().connection()
+
+    def get(self, key: str, now: float | None = None) -> bytes | None:
+        if now is None:
+            now = time.time()
+
+        try:
+            with self._connection() as conn:
+                row = conn.execute("SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?",
+                                   (key, now)).fetchone()
+        except sqlite3.Error as e:
+            logger.error('Shared cache read error: %s', e)
+            self._count('errors')
+            return None
+
+        self._count('hits' if row is not None else 'misses')
+
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: bytes, expires_at: float) -> None:
+        now = time.time()
+
+        try:
+            with self._connection() as conn:
+                conn.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, sqlite3.Binary(value), expires_at))
+
+                if now >= self._next_purge:
+                    self._next_purge = now + self.purge_interval
+                    purged = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+                    self._count('purged', purged)
+        except sqlite3.Error as e:
+            logger.error('Shared cache write error: %s', e)
+            self._count('errors')
+            return
+
+        self._count('sets')
+
+    def acquire(self, budget: str, limit: int, window: float = BUDGET_WINDOW, now: float | None = None) -> bool:
+        if now is None:
+            now = time.time()
+
+        try:
+            with self._connection() as conn:
+                used, = conn.execute("""
+                    INSERT INTO cache_budgets (name, window_index, used) VALUES (?, ?, 1)
+                    ON CONFLICT (name) DO UPDATE SET
+                        used = CASE WHEN window_index = excluded.window_index THEN used + 1 ELSE 1 END,
+                        window_index = excluded.window_index
+                    RETURNING used
+                """, (budget, int(now // window))).fetchone()
+        except sqlite3.Error as e:
+            logger.error('Shared cache budget error: %s', e)
+            self._count('errors')
+            return True
+
+        return used <= limit
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache_entries")
+            conn.execute("DELETE FROM cache_budgets")
+
+    def close(self) -> None:
+        """
+        Закрывает соединения текущего процесса.
+
+        :return: None
+        """
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.close()
+            self._pool = None
+            self._pool_pid = None
+
+
+def create_cache_backend(name: str = cache_backend) -> CacheBackend | None:
+    """
+    Создает хранилище по названию.
+
+    :param name: 'none', 'memory' или 'sqlite'.
+    :return: CacheBackend или None для 'none'.
+    """
+    if name == 'none':
+        return None
+    if name == 'memory':
+        return MemoryCacheBackend()
+    if name == 'sqlite':
+        return SQLiteCacheBackend()
+
+    raise ValueError(f'Unknown cache backend: {name}')
+
+
+shared_cache = create_cache_backend()
+
+if isinstance(shared_cache, SQLiteCacheBackend):
+    atexit.register(shared_cache.close)
+
+# Если общего хранилища нет, бюджет запросов учитывается в памяти процесса
+_budget_backend = shared_cache if shared_cache is not None else MemoryCacheBackend(max_entries=0)
+
+
+def consume_upstream_budget(upstream: str, now: float | None = None) -> None:
+    """
+    Учитывает запрос к внешнему API в его бюджете (UPSTREAM_BUDGETS).
+
+    :param upstream: Название внешнего API.
+    :param now: Текущее время (unix time). По умолчанию используется time.time().
+    :return: None
+    :raises UpstreamBudgetExceeded: Если бюджет на текущую минуту исчерпан.
+    """
+    if now is None:
+        now = time.time()
+
+    limit = UPSTREAM_BUDGETS.get(upstream, 0)
+
+    if limit and not _budget_backend.acquire(upstream, limit, BUDGET_WINDOW, now):
+        logger.warning('%s request budget exceeded', upstream)
+        raise UpstreamBudgetExceeded(upstream, BUDGET_WINDOW - now % BUDGET_WINDOW)
@@ -0,0 +1,42 @@
+import gzip
+
+from config import api_compress_min_size, api_gzip_level, api_brotli_quality
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость, без нее используется только gzip
+    brotli = None
+
+
+def get_supported_encodings() -> list[str]:
+    """
+    Возвращает поддерживаемые кодировки сжатия в порядке предпочтения.
+
+    :return: List: ['br', 'gzip'], если установлен пакет brotli, иначе ['gzip'].
+    """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress_body(body: bytes, accept_encodings) -> tuple[bytes, str | None]:
+    """
+    Сжимает тело ответа лучшей кодировкой, которую принимает клиент.
+
+    Небольшие тела (меньше api_compress_min_size байт) не сжимаются: выигрыш не окупает
+    затраты на сжатие и распаковку.
+
+    :param body: Тело ответа.
+    :param accept_encodings: Заголовок Accept-Encoding в разобранном виде (request.accept_encodings).
+    :return: Кортеж (тело, кодировка), где кодировка - 'br', 'gzip' или None, если тело не сжато.
+    """
+    if len(body) < api_compress_min_size:
+        return body, None
+
+    encoding = accept_encodings.best_match(get_supported_encodings())
+
+    if encoding == 'br':
+        return brotli.compress(body, quality=api_brotli_quality), encoding
+
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=api_gzip_level, mtime=0), encoding
+
+    return body, None
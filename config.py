@@ -1,2 +1,147 @@
+import os
+
 user_agent_api = 'Mozilla/5.0 (X11; Linux x86_64)'
 ' AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 YaBrowser/24.6.0.0 Safari/537.36'
+
+# Адрес сервиса геокодирования Nominatim (можно переопределить переменными окружения,
+# например, для нагрузочного тестирования с локальной заглушкой)
+nominatim_domain = os.environ.get('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')
+nominatim_scheme = os.environ.get('NOMINATIM_SCHEME', 'https')
+
+# Таймаут запроса к Nominatim (сек)
+nominatim_timeout = float(os.environ.get('NOMINATIM_TIMEOUT', '3'))
+
+# Защита от сбоев внешних API: после circuit_breaker_failures ошибок подряд запросы к API
+# не выполняются circuit_breaker_reset_timeout секунд (сразу возвращается ошибка), затем
+# выполняется один пробный запрос. Одновременно выполняется не более open_meteo_concurrency
+# запросов к Open-Meteo и nominatim_concurrency к Nominatim, остальные ждут не дольше
+# upstream_queue_timeout секунд
+circuit_breaker_failures = int(os.environ.get('CIRCUIT_BREAKER_FAILURES', '5'))
+circuit_breaker_reset_timeout = float(os.environ.get('CIRCUIT_BREAKER_RESET_TIMEOUT', '30'))
+open_meteo_concurrency = int(os.environ.get('OPEN_METEO_CONCURRENCY', '8'))
+nominatim_concurrency = int(os.environ.get('NOMINATIM_CONCURRENCY', '2'))
+upstream_queue_timeout = float(os.environ.get('UPSTREAM_QUEUE_TIMEOUT', '0.5'))
+
+# Время жизни записей кэша геокодирования (в секундах): найденные города храним месяц,
+# ненайденные - сутки, чтобы опечатки не блокировали город надолго.
+geocode_cache_ttl = 30 * 24 * 3600
+geocode_cache_negative_ttl = 24 * 3600
+
+# Офлайн-справочник координат городов из static/js/cities.txt
+gazetteer_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.tsv')
+
+# Настройки клиента Open-Meteo (можно переопределить переменными окружения)
+open_meteo_url = os.environ.get('OPEN_METEO_URL', 'https://api.open-meteo.com/v1/forecast')
+open_meteo_pool_size = int(os.environ.get('OPEN_METEO_POOL_SIZE', '10'))
+open_meteo_connect_timeout = float(os.environ.get('OPEN_METEO_CONNECT_TIMEOUT', '3'))
+open_meteo_read_timeout = float(os.environ.get('OPEN_METEO_READ_TIMEOUT', '10'))
+open_meteo_retries = int(os.environ.get('OPEN_METEO_RETRIES', '2'))
+open_meteo_backoff_factor = float(os.environ.get('OPEN_METEO_BACKOFF_FACTOR', '0.2'))
+open_meteo_http_cache_path = os.environ.get('OPEN_METEO_HTTP_CACHE', '.cache')
+open_meteo_http_cache_expire = 3600
+
+# Кэш декодированных прогнозов: количество записей, время жизни (сек), шаг сетки координат (град)
+# и за сколько секунд до устаревания запись обновляется в фоне
+forecast_cache_size = int(os.environ.get('FORECAST_CACHE_SIZE', '1024'))
+forecast_cache_ttl = int(os.environ.get('FORECAST_CACHE_TTL', '3600'))
+forecast_cache_grid = float(os.environ.get('FORECAST_CACHE_GRID', '0.1'))
+forecast_cache_refresh_margin = int(os.environ.get('FORECAST_CACHE_REFRESH_MARGIN', '300'))
+
+# Сколько секунд после загрузки прогноз можно показывать (с пометкой об устаревании),
+# если Open-Meteo недоступен
+forecast_cache_max_stale = int(os.environ.get('FORECAST_CACHE_MAX_STALE', str(6 * 3600)))
+
+# Максимальное количество городов в одном пакетном запросе прогноза
+batch_max_cities = int(os.environ.get('BATCH_MAX_CITIES', '50'))
+
+# Асинхронный режим главной страницы: независимые шаги запроса выполняются одновременно
+async_views = os.environ.get('WEATHER_ASYNC_VIEWS', '0') == '1'
+
+# Количество потоков ASGI-адаптера (asgi.py), то есть запросов, обрабатываемых одним процессом одновременно
+asgi_workers = int(os.environ.get('ASGI_WORKERS', '16'))
+
+# Хранилище второго уровня для кэшей прогнозов и геокодирования: 'none' - не используется,
+# 'memory' - в памяти процесса, 'sqlite' - файл SQLite в режиме WAL, общий для всех процессов
+# на сервере (по умолчанию при запуске под gunicorn); путь к файлу и количество записей в памяти
+cache_backend = os.environ.get('CACHE_BACKEND', 'none')
+cache_backend_path = os.environ.get('CACHE_BACKEND_PATH', 'shared_cache.db')
+cache_backend_size = int(os.environ.get('CACHE_BACKEND_SIZE', '4096'))
+
+# Бюджет запросов к внешним API в минуту (0 - без ограничения). При CACHE_BACKEND=sqlite бюджет
+# общий для всех процессов на сервере. Правила Nominatim допускают не более одного запроса в секунду
+open_meteo_budget_per_minute = int(os.environ.get('OPEN_METEO_BUDGET_PER_MINUTE', '0'))
+nominatim_budget_per_minute = int(os.environ.get('NOMINATIM_BUDGET_PER_MINUTE', '60'))
+
+# Пул соединений SQLite: максимальное количество свободных соединений, ожидание блокировки (сек)
+# и размер кэша подготовленных выражений на соединение
+db_pool_size = int(os.environ.get('DB_POOL_SIZE', '8'))
+db_busy_timeout = float(os.environ.get('DB_BUSY_TIMEOUT', '5'))
+db_cached_statements = 128
+
+# Отложенная запись истории поиска: размер очереди, размер пачки, интервал записи (сек)
+# и политика при переполнении очереди ('block', 'drop' или 'sync')
+search_history_write_behind = os.environ.get('SEARCH_HISTORY_WRITE_BEHIND', '1') == '1'
+search_history_queue_size = int(os.environ.get('SEARCH_HISTORY_QUEUE_SIZE', '10000'))
+search_history_batch_size = int(os.environ.get('SEARCH_HISTORY_BATCH_SIZE', '200'))
+search_history_flush_interval = float(os.environ.get('SEARCH_HISTORY_FLUSH_INTERVAL', '1'))
+search_history_overflow_policy = os.environ.get('SEARCH_HISTORY_OVERFLOW_POLICY', 'sync')
+
+# Кэш последнего искомого города по пользователям: количество пользователей и время жизни записи (сек)
+last_city_cache_size = int(os.environ.get('LAST_CITY_CACHE_SIZE', '10000'))
+last_city_cache_ttl = int(os.environ.get('LAST_CITY_CACHE_TTL', '300'))
+
+# Кэш отрисованных фрагментов прогноза: количество записей (город + час)
+page_cache_size = int(os.environ.get('PAGE_CACHE_SIZE', '2048'))
+
+# Сжатие ответов JSON API: минимальный размер тела (байт) и уровни сжатия gzip и brotli
+api_compress_min_size = int(os.environ.get('API_COMPRESS_MIN_SIZE', '512'))
+api_gzip_level = int(os.environ.get('API_GZIP_LEVEL', '6'))
+api_brotli_quality = int(os.environ.get('API_BROTLI_QUALITY', '5'))
+
+# Фоновый прогрев кэша прогнозов для популярных городов из city_counts: количество городов,
+# интервал между запусками и случайная добавка к нему (сек), количество параллельных запросов,
+# количество городов в одном запросе к Open-Meteo и бюджет запросов к Open-Meteo на один запуск
+prefetch_enabled = os.environ.get('PREFETCH_ENABLED', '1') == '1'
+prefetch_top_n = int(os.environ.get('PREFETCH_TOP_N', '50'))
+prefetch_interval = float(os.environ.get('PREFETCH_INTERVAL', '600'))
+prefetch_jitter = float(os.environ.get('PREFETCH_JITTER', '60'))
+prefetch_concurrency = int(os.environ.get('PREFETCH_CONCURRENCY', '2'))
+prefetch_batch_size = int(os.environ.get('PREFETCH_BATCH_SIZE', '10'))
+prefetch_budget = int(os.environ.get('PREFETCH_BUDGET', '10'))
+
+# Загрузка тяжелых библиотек (requests_cache, openmeteo_requests, geopy) при запуске приложения.
+# По умолчанию они загружаются при первом обращении к Open-Meteo и Nominatim, что ускоряет запуск;
+# '1' имеет смысл, если процесс запускается заранее (например, gunicorn с preload_app)
+eager_imports = os.environ.get('WEATHER_EAGER_IMPORTS', '0') == '1'
+
+# Логирование: файл журнала ('-' - stderr, по умолчанию под gunicorn), его максимальный размер (байт) и количество архивных файлов,
+# размер очереди записей, общий уровень и уровни отдельных логгеров ('main=WARNING,models=ERROR')
+log_file = os.environ.get('LOG_FILE', 'weather_log.log')
+log_max_bytes = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+log_backup_count = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+log_queue_size = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+log_levels = os.environ.get('LOG_LEVELS', '')
+
+# Метрики времени выполнения этапов обработки запроса (маршрут /metrics)
+metrics_enabled = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Запуск под gunicorn (gunicorn.conf.py): адрес, количество процессов и потоков в каждом процессе,
+# время обработки запроса (сек), после которого процесс перезапускается, время на завершение
+# текущих запросов при остановке (сек), время ожидания следующего запроса в соединении (сек)
+# и количество запросов, после которого процесс перезапускается (0 - не перезапускать)
+web_bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+web_workers = int(os.environ.get('WEB_WORKERS', str(min(2 * (os.cpu_count() or 1) + 1, 8))))
+web_threads = int(os.environ.get('WEB_THREADS', '4'))
+web_timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+web_graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '20'))
+web_keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))
+web_max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+web_max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', '0'))
+web_preload_app = os.environ.get('WEB_PRELOAD_APP', '0') == '1'
+
+# Режим отладки встроенного сервера Flask (python main.py); только для разработки
+flask_debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+
+# Отладочные заголовки ответа (X-DB-Round-Trips); включены также в режиме отладки
+debug_headers = os.environ.get('DEBUG_HEADERS', '0') == '1' or flask_debug
@@ -0,0 +1,401 @@
+import json
+import logging.config
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+from cache_backends import CacheBackend, shared_cache
+from config import (forecast_cache_size, forecast_cache_ttl, forecast_cache_grid, forecast_cache_refresh_margin,
+                    forecast_cache_max_stale, circuit_breaker_reset_timeout)
+from logging_config import dict_config
+from resilience import UpstreamUnavailable, mark_stale
+from singleflight import SingleFlight
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('forecast_cache')
+
+HourlyLoader = Callable[[float, float], dict]
+
+
+class ForecastEntry:
+    """
+    Запись кэша: почасовые массивы одного прогноза в компактном виде.
+
+    Время хранится одним массивом int64, все переменные - одной матрицей float32
+    (строка на переменную). Массивы доступны только для чтения, поэтому одну запись
+    можно безопасно отдавать нескольким потокам без копирования.
+    """
+
+    __slots__ = ('names', 'times', 'values', 'fetched_at', 'expires_at')
+
+    def __init__(self, hourly: dict, fetched_at: float, expires_at: float):
+        self.names = tuple(name for name in hourly if name != 'time')
+        self.times = np.array(hourly['time'], dtype=np.int64)
+        self.values = np.vstack([np.asarray(hourly[name], dtype=np.float32) for name in self.names])
+        self.times.flags.writeable = False
+        self.values.flags.writeable = False
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+
+    def as_hourly(self) -> dict:
+        """
+        Возвращает почасовые данные в том же виде, что и decode_hourly.
+
+        :return: Dict: Словарь с ключом 'time' и массивами переменных (представления без копирования).
+        """
+        hourly = {'time': self.times}
+
+        for index, name in enumerate(self.names):
+            hourly[name] = self.values[index]
+
+        return hourly
+
+    def to_bytes(self) -> bytes:
+        """
+        Сериализует запись для общего хранилища: длина заголовка, заголовок JSON
+        (выровненный до 8 байт) и массивы времени и значений в машинном представлении.
+
+        :return: Bytes: Сериализованная запись.
+        """
+        header = json.dumps({'names': self.names, 'hours': len(self.times), 'fetched_at': self.fetched_at,
+                             'expires_at': self.expires_at}).encode('utf-8')
+        header += b' ' * (-(len(header) + 4) % 8)
+
+        return struct.pack('<I', len(header)) + header + self.times.tobytes() + self.values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ForecastEntry':
+        """
+        Восстанавливает запись, сериализованную to_bytes. Массивы ссылаются на data без копирования.
+
+        :param data: Сериализованная запись.
+        :return: ForecastEntry: Запись (массивы только для чтения).
+        """
+        header_size, = struct.unpack_from('<I', data)
+        header = json.loads(data[4:4 + header_size])
+        offset = 4 + header_size
+        hours = header['hours']
+
+        entry = cls.__new__(cls)
+        entry.names = tuple(header['names'])
+        entry.times = np.frombuffer(data, dtype=np.int64, count=hours, offset=offset)
+        entry.values = np.frombuffer(data, dtype=np.float32, count=hours * len(entry.names),
+                                     offset=offset + hours * 8).reshape(len(entry.names), hours)
+        entry.fetched_at = header['fetched_at']
+        entry.expires_at = header['expires_at']
+
+        return entry
+
+
+class ForecastCache:
+    """
+    Кэш декодированных почасовых прогнозов с ключом (ячейка сетки координат, час прогноза).
+
+    Координаты округляются до шага сетки, поэтому близкие запросы попадают в одну запись.
+    Записи вытесняются по LRU при превышении max_entries и устаревают через ttl секунд
+    (но не позже конца часа, к которому относятся). Если к записи обращаются менее чем
+    за refresh_margin секунд до устаревания, прогноз обновляется в фоновом потоке.
+    Одновременные промахи по одной записи загружают и сохраняют прогноз один раз.
+
+    Если задано общее хранилище backend, загруженные записи сохраняются и в нем, а при промахе
+    в памяти процесса запись ищется в хранилище, прежде чем загружать прогноз, - так процессы
+    используют прогнозы, загруженные друг другом. Найденная в хранилище запись сохраняется
+    только в памяти процесса: в хранилище пишет лишь тот, кто загрузил прогноз.
+
+    Для каждой ячейки хранится последний загруженный прогноз. Если Open-Meteo недоступен
+    (UpstreamUnavailable), вместо ошибки возвращается он, если загружен не раньше чем max_stale
+    секунд назад, а обновление выполняется в фоне (не чаще раза в stale_retry секунд).
+    """
+
+    def __init__(self, max_entries: int = forecast_cache_size, ttl: float = forecast_cache_ttl,
+                 grid_step: float = forecast_cache_grid, refresh_margin: float = forecast_cache_refresh_margin,
+                 backend: CacheBackend | None = None, max_stale: float = forecast_cache_max_stale,
+                 stale_retry: float = circuit_breaker_reset_timeout):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.grid_step = grid_step
+        self.refresh_margin = refresh_margin
+        self.backend = backend
+        self.max_stale = max_stale
+        self.stale_retry = stale_retry
+
+        self._entries: OrderedDict[tuple, ForecastEntry] = OrderedDict()
+        self._last_good: OrderedDict[tuple[float, float], ForecastEntry] = OrderedDict()
+        self._stale_retry_at: dict[tuple[float, float], float] = {}
+        self._refreshing: set[tuple] = set()
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'refreshes': 0,
+                       'refresh_errors': 0, 'stale_hits': 0}
+
+    def cell(self, lat: float, long: float) -> tuple[float, float]:
+        """
+        Округляет координаты до центра ячейки сетки.
+
+        :param lat: Широта в градусах.
+        :param long: Долгота в градусах.
+        :return: Кортеж (широта, долгота) ячейки.
+        """
+        return (round(round(lat / self.grid_step) * self.grid_step, 6),
+                round(round(long / self.grid_step) * self.grid_step, 6))
+
+    def lookup(self, lat: float, long: float, loader: HourlyLoader | None = None,
+               now: float | None = None) -> dict | None:
+        """
+        Ищет почасовые данные для координат в кэше, не загружая их при промахе.
+
+        :param lat: Широта в градусах.
+        :param long: Долгота в градусах.
+        :param loader: Функция для фонового обновления записи, близкой к устареванию.
+            Если не задана, фоновое обновление не выполняется.
+        :param now: Текущее время (unix time). По умолчанию используется time.time().
+        :return: Почасовые данные в формате decode_hourly или None при промахе.
+        """
+        if now is None:
+            now = time.time()
+
+        cell = self.cell(lat, long)
+        key = (*cell, int(now // 3600))
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+
+        if entry is None:
+            entry = self._lookup_shared(key, now)
+
+            if entry is None:
+                with self._lock:
+                    self._stats['misses'] += 1
+                return None
+
+        if loader is not None and entry.expires_at - now <= self.refresh_margin:
+            self._schedule_refresh(cell, now + self.refresh_margin, loader)
+
+        return entry.as_hourly()
+
+    def get(self, lat: float, long: float, loader: HourlyLoader, now: float | None = None) -> dict:
+        """
+        Возвращает почасовые данные для координат, загружая их через loader при промахе.
+
+        :param lat: Широта в градусах.
+        :param long: Долгота в градусах.
+        :param loader: Функция loader(lat, long), возвращающая почасовые массивы для центра ячейки.
+        :param now: Текущее время (unix time). По умолчанию используется time.time().
+        :return: Dict: Почасовые данные в формате decode_hourly (устаревшие, если loader
+            завершился UpstreamUnavailable, см. get_stale).
+        """
+        if now is None:
+            now = time.time()
+
+        hourly = self.lookup(lat, long, loader, now)
+
+        if hourly is not None:
+            return hourly
+
+        cell = self.cell(lat, long)
+
+        try:
+            # Загружает и сохраняет запись только первый из одновременных вызовов, остальные получают ее же
+            return self._flight.do((*cell, int(now // 3600)), self._load, cell, loader, now).as_hourly()
+        except UpstreamUnavailable:
+            hourly = self.get_stale(cell, now, loader)
+
+            if hourly is None:
+                raise
+
+            return hourly
+
+    def get_stale(self, cell: tuple[float, float], now: float | None = None,
+                  loader: HourlyLoader | None = None) -> dict | None:
+        """
+        Возвращает последний загруженный прогноз для ячейки, даже если его запись устарела,
+        и отмечает в текущем контексте, что прогноз устаревший (resilience.mark_stale).
+
+        :param cell: Ячейка сетки (результат cell()).
+        :param now: Текущее время (unix time). По умолчанию используется time.time().
+        :param loader: Функция для фонового обновления прогноза. Если не задана, обновление не выполняется.
+        :return: Почасовые данные в формате decode_hourly или None, если прогноза нет
+            или он загружен раньше чем max_stale секунд назад.
+        """
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            entry = self._last_good.get(cell)
+
+            if entry is None or now - entry.fetched_at > self.max_stale:
+                return None
+
+            self._stats['stale_hits'] += 1
+            refresh = loader is not None and self._stale_retry_at.get(cell, 0) <= now
+            if refresh:
+                self._stale_retry_at[cell] = now + self.stale_retry
+
+        mark_stale(now - entry.fetched_at)
+
+        if refresh:
+            self._schedule_refresh(cell, now, loader)
+
+        return entry.as_hourly()
+
+    def is_fresh(self, cell: tuple[float, float], at: float) -> bool:
+        """
+        Проверяет, что для ячейки есть запись, действующая в момент времени at.
+
+        В отличие от lookup не меняет счетчики и порядок вытеснения.
+
+        :param cell: Ячейка сетки (результат cell()).
+        :param at: Момент времени (unix time).
+        :return: Bool: True, если запись для часа at существует и не устареет к моменту at.
+        """
+        key = (*cell, int(at // 3600))
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry.expires_at > at:
+                return True
+
+        return self.backend is not None and self.backend.get(self._shared_key(key), at) is not None
+
+    def put(self, cell: tuple[float, float], hourly: dict, now: float | None = None) -> ForecastEntry:
+        """
+        Сохраняет почасовые данные для ячейки и часа, к которому относится время now.
+
+        :param cell: Ячейка сетки (результат cell()).
+        :param hourly: Почасовые массивы в формате decode_hourly.
+        :param now: Время, для часа которого сохраняется запись. По умолчанию - текущее.
+        :return: ForecastEntry: Сохраненная запись.
+        """
+        fetched_at = time.time()
+        if now is None:
+            now = fetched_at
+
+        key = (*cell, int(now // 3600))
+        entry = ForecastEntry(hourly, fetched_at, min(fetched_at + self.ttl, (key[2] + 1) * 3600))
+
+        self._store(key, entry)
+
+        if self.backend is not None:
+            self.backend.set(self._shared_key(key), entry.to_bytes(), entry.expires_at)
+
+        return entry
+
+    def _store(self, key: tuple, entry: ForecastEntry) -> None:
+        cell = key[:2]
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+            last_good = self._last_good.get(cell)
+            if last_good is None or last_good.fetched_at <= entry.fetched_at:
+                self._last_good[cell] = entry
+                self._last_good.move_to_end(cell)
+                self._stale_retry_at.pop(cell, None)
+
+                while len(self._last_good) > self.max_entries:
+                    self._stale_retry_at.pop(self._last_good.popitem(last=False)[0], None)
+
+    def _load(self, cell: tuple[float, float], loader: HourlyLoader, now: float) -> ForecastEntry:
+        key = (*cell, int(now // 3600))
+
+        # Запись могла сохранить предыдущая загрузка, завершившаяся после промаха в lookup,
+        # или другой процесс - тогда она берется из общего хранилища без повторной записи в него
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None and entry.expires_at > now:
+            return entry
+
+        entry = self._lookup_shared(key, now)
+
+        if entry is not None:
+            return entry
+
+        return self.put(cell, loader(*cell), now)
+
+    @staticmethod
+    def _shared_key(key: tuple) -> str:
+        return 'forecast:{}:{}:{}'.format(*key)
+
+    def _lookup_shared(self, key: tuple, now: float) -> ForecastEntry | None:
+        if self.backend is None:
+            return None
+
+        data = self.backend.get(self._shared_key(key), now)
+
+        if data is None:
+            return None
+
+        entry = ForecastEntry.from_bytes(data)
+        self._store(key, entry)
+
+        with self._lock:
+            self._stats['shared_hits'] += 1
+
+        return entry
+
+    def _schedule_refresh(self, cell: tuple[float, float], target_time: float, loader: HourlyLoader) -> None:
+        key = (*cell, int(target_time // 3600))
+
+        with self._lock:
+            fresh = self._entries.get(key)
+            if key in self._refreshing or (fresh is not None and fresh.expires_at - target_time > 0):
+                return
+            self._refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self._flight.do(key, self._load, cell, loader, target_time)
+                with self._lock:
+                    self._stats['refreshes'] += 1
+            except Exception as e:
+                logger.error('Error refreshing forecast for %s: %s', cell, e)
+                with self._lock:
+                    self._stats['refresh_errors'] += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='forecast-cache-refresh', daemon=True).start()
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков кэша и текущее количество записей.
+
+        :return: Dict: Счетчики попаданий, промахов, устареваний, вытеснений и фоновых обновлений.
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи из кэша в памяти процесса (общее хранилище не очищается).
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._last_good.clear()
+            self._stale_retry_at.clear()
+
+
+forecast_cache = ForecastCache(backend=shared_cache)
@@ -0,0 +1,93 @@
+import logging.config
+import threading
+from array import array
+
+from config import gazetteer_path
+from logging_config import dict_config
+from utils import normalize_city_name
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('gazetteer')
+
+# Индекс: нормализованное название или синоним -> номер города в массивах координат
+_index: dict[str, int] = {}
+_latitudes = array('d')
+_longitudes = array('d')
+_names: list[str] = []
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def load_gazetteer(path: str = gazetteer_path) -> int:
+    """
+    Загружает офлайн-справочник городов в память.
+
+    Файл содержит строки вида 'название<TAB>широта<TAB>долгота<TAB>синонимы через |',
+    строки, начинающиеся с '#', пропускаются. Повторная загрузка не выполняется.
+
+    :param path: Путь к файлу справочника.
+    :return: Int: Количество городов в справочнике.
+    """
+    global _loaded
+
+    with _load_lock:
+        if _loaded:
+            return len(_latitudes)
+
+        logger.info('Start load_gazetteer')
+
+        try:
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    if not line.strip() or line.startswith('#'):
+                        continue
+
+                    name, lat, long, aliases = line.rstrip('\n').split('\t')
+                    position = len(_latitudes)
+                    _latitudes.append(float(lat))
+                    _longitudes.append(float(long))
+                    _names.append(name)
+
+                    _index.setdefault(normalize_city_name(name), position)
+                    for alias in filter(None, aliases.split('|')):
+                        _index.setdefault(normalize_city_name(alias), position)
+        except (OSError, ValueError) as e:
+            logger.error('Error loading gazetteer: %s', e)
+
+        _loaded = True
+        logger.info('Gazetteer loaded: %s cities, %s names', len(_latitudes), len(_index))
+
+        return len(_latitudes)
+
+
+def lookup_city(city: str) -> tuple[float, float] | None:
+    """
+    Ищет координаты города в офлайн-справочнике без обращения к сети.
+
+    :param city: Название города или его синоним в произвольном написании.
+    :return: Кортеж (широта, долгота) или None, если города нет в справочнике.
+    """
+    if not _loaded:
+        load_gazetteer()
+
+    position = _index.get(normalize_city_name(city))
+
+    if position is None:
+        return None
+
+    return _latitudes[position], _longitudes[position]
+
+
+def get_city_name(city: str) -> str | None:
+    """
+    Возвращает основное название города из офлайн-справочника (например, 'Орёл' для 'орел').
+
+    :param city: Название города или его синоним в произвольном написании.
+    :return: Str: Название из справочника или None, если города нет в справочнике.
+    """
+    if not _loaded:
+        load_gazetteer()
+
+    position = _index.get(normalize_city_name(city))
+
+    return _names[position] if position is not None else None
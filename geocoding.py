@@ -0,0 +1,189 @@
+import logging.config
+import ssl
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from cache_backends import consume_upstream_budget, shared_cache
+from config import (user_agent_api, geocode_cache_ttl, geocode_cache_negative_ttl, nominatim_domain, nominatim_scheme,
+                    nominatim_timeout)
+from gazetteer import lookup_city
+from logging_config import dict_config
+from metrics import StageTimer, timed
+from models import get_geocode_cache_entry, save_geocode_cache_entry
+from resilience import nominatim_upstream
+from singleflight import SingleFlight
+from utils import normalize_city_name
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('geocoding')
+
+# geopy импортируется, а SSL-контекст создается при первом запросе к Nominatim,
+# а не при загрузке модуля, чтобы не замедлять запуск приложения
+if TYPE_CHECKING:
+    from geopy.geocoders import Nominatim
+
+geocode_cache_stats = {
+    'gazetteer_hits': 0,
+    'shared_hits': 0,
+    'hits': 0,
+    'negative_hits': 0,
+    'misses': 0,
+}
+_stats_lock = threading.Lock()
+
+_geolocator: 'Nominatim | None' = None
+_geolocator_lock = threading.Lock()
+
+# Одновременные промахи по одному городу выполняют один запрос к Nominatim
+geocode_flight = SingleFlight()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        geocode_cache_stats[name] += 1
+
+
+def get_geocode_cache_stats() -> dict:
+    """
+    Возвращает копию счетчиков кэша геокодирования.
+
+    :return: Dict: Словарь с количеством найденных в офлайн-справочнике городов ('gazetteer_hits'),
+        попаданий в общее хранилище ('shared_hits'), попаданий в кэш ('hits'), попаданий в отрицательные записи ('negative_hits')
+        и промахов ('misses').
+    """
+    with _stats_lock:
+        return dict(geocode_cache_stats)
+
+
+def get_geolocator() -> 'Nominatim':
+    """
+    Возвращает объект геолокатора Nominatim, создавая его при первом обращении.
+
+    :return: Nominatim: Геолокатор, общий для всех запросов.
+    """
+    global _geolocator
+
+    if _geolocator is None:
+        with _geolocator_lock:
+            if _geolocator is None:
+                import certifi
+                from geopy.geocoders import Nominatim
+
+                logger.info('Create a geolocator object using: Nominatim')
+                ssl_context = ssl.create_default_context(cafile=certifi.where())
+                _geolocator = Nominatim(user_agent=user_agent_api, ssl_context=ssl_context,
+                                        domain=nominatim_domain, scheme=nominatim_scheme, timeout=nominatim_timeout)
+
+    return _geolocator
+
+
+def reset_geolocator() -> None:
+    """
+    Удаляет общий геолокатор. Следующий вызов get_geolocator создаст новый
+    (например, в дочернем процессе, чтобы не использовать соединения родительского).
+
+    :return: None
+    """
+    global _geolocator
+
+    with _geolocator_lock:
+        _geolocator = None
+
+
+@timed('geocode')
+def geocode_city(city: str) -> tuple[float, float] | None:
+    """
+    Получает координаты города. Сначала город ищется в офлайн-справочнике, затем
+    в постоянном кэше в базе данных, и только после этого выполняется запрос к Nominatim.
+
+    Найденные координаты хранятся geocode_cache_ttl секунд, отрицательные результаты
+    (город не найден) - geocode_cache_negative_ttl секунд. Ошибки сети не кэшируются
+    и пробрасываются вызывающему коду как UpstreamUnavailable.
+
+    :param city: Название города.
+    :return: Кортеж (широта, долгота) или None, если город не найден.
+    """
+    logger.info('Start geocode_city')
+
+    city_key = normalize_city_name(city)
+
+    if not city_key:
+        return None
+
+    coordinates = lookup_city(city_key)
+
+    if coordinates is not None:
+        _count('gazetteer_hits')
+        return coordinates
+
+    return geocode_flight.do(city_key, _geocode_uncached, city, city_key)
+
+
+def _geocode_uncached(city: str, city_key: str) -> tuple[float, float] | None:
+    """
+    Ищет координаты города в общем хранилище (если оно задано), затем в кэше в базе данных
+    и при промахе запрашивает их у Nominatim.
+
+    :param city: Название города в том виде, в котором его ввел пользователь.
+    :param city_key: Нормализованное название города.
+    :return: Кортеж (широта, долгота) или None, если город не найден.
+    """
+    if shared_cache is not None:
+        value = shared_cache.get(f'geocode:{city_key}')
+
+        if value is not None:
+            _count('shared_hits')
+            return _decode_coordinates(value)
+
+    entry = get_geocode_cache_entry(city_key)
+
+    if entry is not None and entry[3] > time.time():
+        lat, long, found, expires_at = entry
+        _share(city_key, (lat, long) if found else None, expires_at)
+
+        if found:
+            _count('hits')
+            return lat, long
+
+        _count('negative_hits')
+        logger.info('geocode_city: Negative cache hit')
+        return None
+
+    _count('misses')
+
+    logger.info('Get the coordinates of the city')
+    consume_upstream_budget('nominatim')
+    with StageTimer('nominatim', upstream='nominatim'):
+        location = nominatim_upstream.call(get_geolocator().geocode, city)
+
+    if location is None:
+        logger.error('This location does not exist')
+        expires_at = time.time() + geocode_cache_negative_ttl
+        save_geocode_cache_entry(city_key, None, None, expires_at)
+        _share(city_key, None, expires_at)
+        return None
+
+    logger.info('Location - %s', location)
+
+    expires_at = time.time() + geocode_cache_ttl
+    save_geocode_cache_entry(city_key, location.latitude, location.longitude, expires_at)
+    _share(city_key, (location.latitude, location.longitude), expires_at)
+
+    return location.latitude, location.longitude
+
+
+def _share(city_key: str, coordinates: tuple[float, float] | None, expires_at: float) -> None:
+    # Пустое значение - отрицательная запись (город не найден)
+    if shared_cache is not None:
+        value = b'' if coordinates is None else '{},{}'.format(*coordinates).encode('ascii')
+        shared_cache.set(f'geocode:{city_key}', value, expires_at)
+
+
+def _decode_coordinates(value: bytes) -> tuple[float, float] | None:
+    if not value:
+        return None
+
+    lat, long = value.split(b',')
+
+    return float(lat), float(long)
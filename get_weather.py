@@ -1,20 +1,112 @@
 import logging.config
-import openmeteo_requests
-import pandas as pd
-import requests_cache
-from geopy.geocoders import Nominatim
-from requests import RequestException
-from retry_requests import retry
-from config import user_agent_api
-import certifi
-import ssl
+import time
 
+import numpy as np
+
+from cache_backends import consume_upstream_budget
+from config import open_meteo_url
+from forecast_cache import forecast_cache
+from geocoding import geocode_city
 from logging_config import dict_config
+from metrics import timed
+from openmeteo_client import get_openmeteo_client
+from resilience import UpstreamUnavailable, open_meteo_upstream
+from singleflight import SingleFlight
 
 logging.config.dictConfig(dict_config)
 logger = logging.getLogger('get_weather')
 
-ssl_context = ssl.create_default_context(cafile=certifi.where())
+HOURLY_VARIABLES = ["temperature_2m", "relative_humidity_2m", "wind_speed_10m",
+                    "precipitation_probability", "is_day", "weather_code"]
+
+FORECAST_HOURS = 24
+
+# Прогноз на несколько дней и суточные сводки строятся по почасовому прогнозу из кэша без дополнительных
+# запросов. Ряд Open-Meteo начинается в 00:00 текущих суток, поэтому запрашивается на сутки больше
+# FORECAST_MAX_DAYS: так FORECAST_MAX_HOURS часов вперед доступны в любое время суток
+FORECAST_MAX_DAYS = 7
+FORECAST_MAX_HOURS = FORECAST_MAX_DAYS * 24
+FORECAST_FETCH_DAYS = FORECAST_MAX_DAYS + 1
+
+# Границы суток для суточных сводок - в часовом поясе запроса к Open-Meteo (Europe/Moscow, UTC+3)
+FORECAST_UTC_OFFSET = 3 * 3600
+
+DAILY_VARIABLES = ["temperature_2m_min", "temperature_2m_max", "precipitation_probability_max", "weather_code"]
+
+# Одновременные промахи кэша прогнозов по одной ячейке сетки выполняют один запрос к Open-Meteo
+forecast_flight = SingleFlight()
+
+DEFAULT_WEATHER_ICON = '../static/img/clear_day-1.svg'
+NIGHT_CLEAR_ICON = '../static/img/bedtime-1.svg'
+
+# Иконки для дневного времени суток по кодам погоды WMO
+WEATHER_CODE_ICONS = {
+    0: '../static/img/clear_day-1.svg',
+    1: '../static/img/clear_day-1.svg',
+    2: '../static/img/clear_day-1.svg',
+    3: '../static/img/clear_day-1.svg',
+    45: '../static/img/fog-1.svg',
+    48: '../static/img/fog-1.svg',
+    51: '../static/img/cloud-1.svg',
+    53: '../static/img/cloud-1.svg',
+    55: '../static/img/cloud-1.svg',
+    56: '../static/img/rainy-1.svg',
+    57: '../static/img/rainy-1.svg',
+    61: '../static/img/rainy-1.svg',
+    63: '../static/img/rainy-1.svg',
+    65: '../static/img/rainy-1.svg',
+    66: '../static/img/rainy-1.svg',
+    67: '../static/img/rainy-1.svg',
+    71: '../static/img/cloudy_snowing-1.svg',
+    73: '../static/img/cloudy_snowing-1.svg',
+    75: '../static/img/cloudy_snowing-1.svg',
+    77: '../static/img/cloudy_snowing-1.svg',
+    80: '../static/img/rainy-1.svg',
+    81: '../static/img/rainy-1.svg',
+    82: '../static/img/rainy-1.svg',
+    85: '../static/img/cloudy_snowing-1.svg',
+    86: '../static/img/ac_unit-1.svg',
+    95: '../static/img/thunderstorm-1.svg',
+    96: '../static/img/thunderstorm-1.svg',
+    99: '../static/img/thunderstorm-1.svg'
+}
+
+
+def _build_icon_table() -> np.ndarray:
+    """
+    Строит таблицу иконок размером 2x100: строка 0 - ночь, строка 1 - день,
+    столбец - код погоды WMO. Для ясной погоды (коды 0-3) ночью используется иконка луны.
+
+    :return: Np.ndarray: Таблица путей к SVG-изображениям (только для чтения).
+    """
+    table = np.full((2, 100), DEFAULT_WEATHER_ICON, dtype=object)
+
+    for code, icon in WEATHER_CODE_ICONS.items():
+        table[:, code] = icon
+
+    table[0, :4] = NIGHT_CLEAR_ICON
+    table.flags.writeable = False
+
+    return table
+
+
+_icon_table = _build_icon_table()
+_is_day_labels = np.array([None, "темно", "светло"], dtype=object)
+
+
+def get_weather_icons(weather_codes: np.ndarray, is_day: np.ndarray) -> np.ndarray:
+    """
+    Возвращает пути к SVG-изображениям для массивов кодов погоды и признаков дня/ночи.
+
+    :param weather_codes: Массив целых кодов погоды WMO.
+    :param is_day: Массив целых чисел, где 0 означает ночь, остальные значения - день.
+    :return: Np.ndarray: Массив путей к SVG-изображениям; для неизвестных кодов - DEFAULT_WEATHER_ICON.
+    """
+    known_code = (weather_codes >= 0) & (weather_codes < 100)
+    icons = _icon_table[(is_day != 0).astype(np.intp), np.where(known_code, weather_codes, 0)]
+    icons[~known_code] = DEFAULT_WEATHER_ICON
+
+    return icons
 
 
 def get_is_day(is_day: int) -> str:
@@ -41,56 +133,287 @@ def get_weather_code(weather_cod: int, is_day: int) -> str:
     :param is_day: Целое число, где 0 означает ночь, а 1 означает день.
     :return: Str: Путь к SVG-изображению, соответствующему заданному коду погоды и времени суток.
     """
-    logger.info('Start get_weather_code')
-
-    weather_codes = {
-        0: '../static/img/clear_day-1.svg',
-        1: '../static/img/clear_day-1.svg',
-        2: '../static/img/clear_day-1.svg',
-        3: '../static/img/clear_day-1.svg',
-        45: '../static/img/fog-1.svg',
-        48: '../static/img/fog-1.svg',
-        51: '../static/img/cloud-1.svg',
-        53: '../static/img/cloud-1.svg',
-        55: '../static/img/cloud-1.svg',
-        56: '../static/img/rainy-1.svg',
-        57: '../static/img/rainy-1.svg',
-        61: '../static/img/rainy-1.svg',
-        63: '../static/img/rainy-1.svg',
-        65: '../static/img/rainy-1.svg',
-        66: '../static/img/rainy-1.svg',
-        67: '../static/img/rainy-1.svg',
-        71: '../static/img/cloudy_snowing-1.svg',
-        73: '../static/img/cloudy_snowing-1.svg',
-        75: '../static/img/cloudy_snowing-1.svg',
-        77: '../static/img/cloudy_snowing-1.svg',
-        80: '../static/img/rainy-1.svg',
-        81: '../static/img/rainy-1.svg',
-        82: '../static/img/rainy-1.svg',
-        85: '../static/img/cloudy_snowing-1.svg',
-        86: '../static/img/ac_unit-1.svg',
-        95: '../static/img/thunderstorm-1.svg',
-        96: '../static/img/thunderstorm-1.svg',
-        99: '../static/img/thunderstorm-1.svg'
+    if 0 <= weather_cod < 100:
+        return _icon_table[int(is_day != 0), weather_cod]
+
+    return DEFAULT_WEATHER_ICON
+
+
+def decode_hourly(response) -> dict:
+    """
+    Извлекает почасовые данные из ответа Open-Meteo в виде массивов NumPy.
+
+    :param response: Ответ Open-Meteo (WeatherApiResponse), запрошенный с переменными HOURLY_VARIABLES.
+    :return: Dict: Словарь, где ключ 'time' содержит время начала каждого часа (unix time, UTC),
+        а остальные ключи совпадают с HOURLY_VARIABLES.
+    """
+    hourly = response.Hourly()
+
+    hourly_data = {"time": np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), dtype=np.int64)}
+
+    for index, name in enumerate(HOURLY_VARIABLES):
+        hourly_data[name] = hourly.Variables(index).ValuesAsNumpy()
+
+    return hourly_data
+
+
+def _to_int(values: np.ndarray) -> np.ndarray:
+    """
+    Отбрасывает дробную часть значений так же, как int(), и проверяет отсутствие пропусков.
+
+    :param values: Массив значений с плавающей точкой.
+    :return: Np.ndarray: Массив целых чисел.
+    """
+    if not np.isfinite(values).all():
+        raise ValueError("cannot convert float NaN to integer")
+
+    return values.astype(np.int64)
+
+
+@timed('build_weather_data')
+def build_weather_data(hourly: dict, now: float | None = None) -> dict:
+    """
+    Формирует словарь с погодой на ближайшие 24 часа из почасовых массивов за один проход.
+
+    Значения выбираются маской по времени, иконки берутся из таблицы по коду погоды и
+    признаку дня/ночи, строки формируются только для попавших в интервал часов.
+
+    :param hourly: Словарь с почасовыми массивами, полученный из decode_hourly.
+    :param now: Текущее время (unix time). По умолчанию используется time.time().
+    :return: Словарь с данными о погоде, где ключ - час в формате '%H' (UTC).
+    """
+    if now is None:
+        now = time.time()
+
+    times = hourly["time"]
+    mask = (times >= now) & (times <= now + FORECAST_HOURS * 3600)
+
+    temperature = _to_int(hourly["temperature_2m"][mask])
+    relative_humidity = _to_int(hourly["relative_humidity_2m"][mask])
+    wind_speed = _to_int(hourly["wind_speed_10m"][mask])
+    precipitation_probability = _to_int(hourly["precipitation_probability"][mask])
+    is_day = _to_int(hourly["is_day"][mask])
+    weather_code = _to_int(hourly["weather_code"][mask])
+
+    hours = (times[mask] // 3600) % 24
+
+    icons = get_weather_icons(weather_code, is_day)
+    day_labels = _is_day_labels[np.where((is_day == 0) | (is_day == 1), is_day + 1, 0)]
+
+    weather_data = {}
+
+    for hour, temp, humidity, wind, precipitation, day_label, icon in zip(
+            hours.tolist(), temperature.tolist(), relative_humidity.tolist(), wind_speed.tolist(),
+            precipitation_probability.tolist(), day_labels.tolist(), icons.tolist()):
+        weather_data[f"{hour:02d}"] = {
+            "Temperature": f"{temp}°",
+            "Relative Humidity": f"{humidity}%",
+            "Wind Speed": f"{wind} m/s",
+            "Precipitation Probability": f"{precipitation}%",
+            "Is Day": day_label,
+            'weather_code': icon
+        }
+
+    return weather_data
+
+
+@timed('build_forecast_columns')
+def build_forecast_columns(hourly: dict, fields: list[str] | None = None, now: float | None = None,
+                           hours: int = FORECAST_HOURS) -> dict:
+    """
+    Формирует прогноз на ближайшие hours часов в колоночном виде: один массив на переменную и база времени.
+
+    Выбираются часы из интервала [now, now + hours часов), то есть не больше hours значений.
+    Значения округляются так же, как в build_weather_data, но передаются числами,
+    а не отформатированными строками.
+
+    :param hourly: Словарь с почасовыми массивами, полученный из decode_hourly.
+    :param fields: Список переменных из HOURLY_VARIABLES. По умолчанию - все переменные.
+    :param now: Текущее время (unix time). По умолчанию используется time.time().
+    :param hours: Количество часов (не больше FORECAST_MAX_HOURS). По умолчанию - FORECAST_HOURS.
+    :return: Dict: {"start": время первого часа (unix time, UTC) или None, "interval": шаг в секундах,
+        "count": количество часов, "fields": {переменная: список значений}}.
+    """
+    if now is None:
+        now = time.time()
+
+    if fields is None:
+        fields = HOURLY_VARIABLES
+
+    times = hourly["time"]
+    mask = (times >= now) & (times < now + hours * 3600)
+    selected_times = times[mask]
+
+    return {
+        "start": int(selected_times[0]) if len(selected_times) else None,
+        "interval": int(selected_times[1] - selected_times[0]) if len(selected_times) > 1 else 3600,
+        "count": len(selected_times),
+        "fields": {name: _to_int(hourly[name][mask]).tolist() for name in fields},
+    }
+
+
+@timed('build_daily_summary')
+def build_daily_summary(hourly: dict, days: int, now: float | None = None) -> dict:
+    """
+    Формирует суточные сводки на days дней начиная с текущих суток по почасовым массивам.
+
+    Часы группируются по суткам в часовом поясе FORECAST_UTC_OFFSET. Минимум и максимум
+    температуры и максимум вероятности осадков считаются по группам одним вызовом reduceat,
+    преобладающий код погоды - по таблице частот (сутки x код WMO), построенной одним
+    bincount; при равной частоте выбирается больший код (более значимое явление).
+
+    :param hourly: Словарь с почасовыми массивами, полученный из decode_hourly.
+    :param days: Количество суток (не больше FORECAST_MAX_DAYS).
+    :param now: Текущее время (unix time). По умолчанию используется time.time().
+    :return: Dict: {"dates": список дат 'YYYY-MM-DD', "count": количество суток,
+        "fields": {переменная из DAILY_VARIABLES: список значений}}.
+    """
+    if now is None:
+        now = time.time()
+
+    local_days = (hourly["time"] + FORECAST_UTC_OFFSET) // 86400
+    day_index = local_days - int((now + FORECAST_UTC_OFFSET) // 86400)
+    mask = (day_index >= 0) & (day_index < days)
+
+    if not mask.any():
+        return {"dates": [], "count": 0, "fields": {name: [] for name in DAILY_VARIABLES}}
+
+    # Массивы упорядочены по времени, поэтому часы одних суток идут подряд
+    day_index = day_index[mask]
+    day_changed = np.diff(day_index, prepend=day_index[0] - 1) != 0
+    starts = np.flatnonzero(day_changed)
+    group = np.cumsum(day_changed) - 1
+
+    temperature = hourly["temperature_2m"][mask]
+    weather_code = np.clip(_to_int(hourly["weather_code"][mask]), 0, 99)
+
+    code_counts = np.bincount(group * 100 + weather_code, minlength=len(starts) * 100).reshape(len(starts), 100)
+
+    return {
+        "dates": local_days[mask][starts].astype('datetime64[D]').astype(str).tolist(),
+        "count": len(starts),
+        "fields": {
+            "temperature_2m_min": _to_int(np.minimum.reduceat(temperature, starts)).tolist(),
+            "temperature_2m_max": _to_int(np.maximum.reduceat(temperature, starts)).tolist(),
+            "precipitation_probability_max": _to_int(
+                np.maximum.reduceat(hourly["precipitation_probability"][mask], starts)).tolist(),
+            "weather_code": (99 - code_counts[:, ::-1].argmax(axis=1)).tolist(),
+        },
+    }
+
+
+@timed('open_meteo', upstream='open_meteo')
+def fetch_hourly(lat: float, long: float) -> dict:
+    """
+    Запрашивает почасовой прогноз у Open-Meteo и декодирует его в массивы.
+
+    :param lat: Широта в градусах.
+    :param long: Долгота в градусах.
+    :return: Dict: Почасовые данные в формате decode_hourly.
+    """
+    logger.info('Start fetch_hourly')
+
+    params = {
+        "latitude": lat,
+        "longitude": long,
+        "timezone": "Europe/Moscow",
+        "hourly": HOURLY_VARIABLES,
+        "forecast_days": FORECAST_FETCH_DAYS
+    }
+    consume_upstream_budget('open_meteo')
+    responses = open_meteo_upstream.call(get_openmeteo_client().weather_api, open_meteo_url, params=params)
+
+    return decode_hourly(responses[0])
+
+
+def fetch_hourly_coalesced(lat: float, long: float) -> dict:
+    """
+    Запрашивает почасовой прогноз так же, как fetch_hourly, но одновременные запросы
+    для одной ячейки сетки выполняются одним запросом к Open-Meteo.
+
+    :param lat: Широта центра ячейки в градусах.
+    :param long: Долгота центра ячейки в градусах.
+    :return: Dict: Почасовые данные в формате decode_hourly.
+    """
+    return forecast_flight.do((lat, long), fetch_hourly, lat, long)
+
+
+@timed('open_meteo_batch', upstream='open_meteo')
+def fetch_hourly_batch(coordinates: list[tuple[float, float]]) -> list[dict]:
+    """
+    Запрашивает почасовые прогнозы для нескольких точек одним запросом к Open-Meteo.
+
+    :param coordinates: Список кортежей (широта, долгота).
+    :return: List: Почасовые данные в формате decode_hourly в том же порядке, что и координаты.
+    """
+    logger.info('Start fetch_hourly_batch: %s locations', len(coordinates))
+
+    params = {
+        "latitude": [lat for lat, _ in coordinates],
+        "longitude": [long for _, long in coordinates],
+        "timezone": "Europe/Moscow",
+        "hourly": HOURLY_VARIABLES,
+        "forecast_days": FORECAST_FETCH_DAYS
     }
+    consume_upstream_budget('open_meteo')
+    responses = open_meteo_upstream.call(get_openmeteo_client().weather_api, open_meteo_url, params=params)
+
+    if len(responses) != len(coordinates):
+        raise KeyError(f'Expected {len(coordinates)} responses, got {len(responses)}')
+
+    return [decode_hourly(response) for response in responses]
+
+
+def get_weather_batch(coordinates: list[tuple[float, float]]) -> list[dict]:
+    """
+    Получает данные о погоде на ближайшие 24 часа для нескольких точек.
+
+    Точки, которые уже есть в кэше прогнозов, берутся из него, остальные запрашиваются
+    у Open-Meteo одним запросом (по одному разу на ячейку сетки кэша).
+
+    :param coordinates: Список кортежей (широта, долгота).
+    :return: List: Словари с данными о погоде в формате get_weather в том же порядке, что и координаты.
+    """
+    logger.info('Start get_weather_batch')
 
-    if weather_cod in weather_codes:
-        if weather_cod < 4 and is_day == 0:
-            for i in range(4):
-                weather_codes[i] = '../static/img/bedtime-1.svg'
-        elif weather_cod < 4 and is_day == 1:
-            for i in range(4):
-                weather_codes[i] = '../static/img/clear_day-1.svg'
+    for lat, long in coordinates:
+        if not (-90 <= lat <= 90 and -180 <= long <= 180):
+            logger.error('Invalid latitude or longitude')
+            raise ValueError("Invalid latitude or longitude")
 
-        return weather_codes[weather_cod]
-    else:
-        return '../static/img/clear_day-1.svg'
+    cells = [forecast_cache.cell(lat, long) for lat, long in coordinates]
+    hourly_by_cell = {}
 
+    for cell in cells:
+        if cell not in hourly_by_cell:
+            hourly_by_cell[cell] = forecast_cache.lookup(*cell, loader=fetch_hourly_coalesced)
 
+    missing = [cell for cell, hourly in hourly_by_cell.items() if hourly is None]
+
+    if missing:
+        try:
+            hourly_list = fetch_hourly_batch(missing)
+        except UpstreamUnavailable:
+            # Если для всех недостающих точек есть последние загруженные прогнозы, отдаем их
+            stale = {cell: forecast_cache.get_stale(cell, loader=fetch_hourly_coalesced) for cell in missing}
+            if any(hourly is None for hourly in stale.values()):
+                raise
+            hourly_by_cell.update(stale)
+        else:
+            for cell, hourly in zip(missing, hourly_list):
+                hourly_by_cell[cell] = forecast_cache.put(cell, hourly).as_hourly()
+
+    return [build_weather_data(hourly_by_cell[cell]) for cell in cells]
+
+
+@timed('get_weather')
 def get_weather(lat: float, long: float) -> dict:
     """
     Получает данные о погоде для заданных координат (широта и долгота) на ближайшие 24 часа.
 
+    Почасовые массивы берутся из кэша прогнозов (forecast_cache), запрос к Open-Meteo
+    выполняется только при промахе.
+
     :param lat: Широта в градусах (-90 до 90).
     :param long: Долгота в градусах (-180 до 180).
     :return: Словарь с данными о погоде на каждый час на ближайшие 24 часа.
@@ -99,7 +422,8 @@ def get_weather(lat: float, long: float) -> dict:
 
     Raises:
         ValueError: Если значения широты или долготы находятся вне допустимых диапазонов.
-        RequestException: Если произошла ошибка при запросе к API Open-Meteo.
+        UpstreamUnavailable: Если Open-Meteo недоступен, а последний загруженный прогноз
+            отсутствует или старше FORECAST_CACHE_MAX_STALE секунд.
         KeyError: Если произошла ошибка при обработке данных.
         Exception: Если произошла другая непредвиденная ошибка.
     """
@@ -110,103 +434,36 @@ def get_weather(lat: float, long: float) -> dict:
         logger.error('Invalid latitude or longitude')
         raise ValueError("Invalid latitude or longitude")
     try:
-        cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        openmeteo = openmeteo_requests.Client(session=retry_session)
-
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": lat,
-            "longitude": long,
-            "timezone": "Europe/Moscow",
-            "hourly": ["temperature_2m", "relative_humidity_2m", "wind_speed_10m",
-                       "precipitation_probability", "is_day", "weather_code"]
-        }
-        responses = openmeteo.weather_api(url, params=params)
-
-        response = responses[0]
-
-        hourly = response.Hourly()
-        hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-        hourly_relative_humidity_2m = hourly.Variables(1).ValuesAsNumpy()
-        hourly_wind_speed_10m = hourly.Variables(2).ValuesAsNumpy()
-        hourly_precipitation_probability = hourly.Variables(3).ValuesAsNumpy()
-        hourly_is_day = hourly.Variables(4).ValuesAsNumpy()
-        hourly_weather_code = hourly.Variables(5).ValuesAsNumpy()
-
-        hourly_data = {"date": pd.date_range(
-            start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
-            end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
-            freq=pd.Timedelta(seconds=hourly.Interval()),
-            inclusive="left"
-        )}
-
-        hourly_data["temperature_2m"] = hourly_temperature_2m
-        hourly_data["relative_humidity_2m"] = hourly_relative_humidity_2m
-        hourly_data["wind_speed_10m"] = hourly_wind_speed_10m
-        hourly_data["precipitation_probability"] = hourly_precipitation_probability
-        hourly_data["is_day"] = hourly_is_day
-        hourly_data["weather_code"] = hourly_weather_code
-
-        hourly_dataframe = pd.DataFrame(data=hourly_data)
-
-        current_time = pd.Timestamp.now(tz="UTC")
-        end_time = current_time + pd.DateOffset(hours=24)
-
-        filtered_data = hourly_dataframe[
-            (hourly_dataframe['date'] >= current_time) & (hourly_dataframe['date'] <= end_time)]
-
-        weather_data = {}
+        hourly = forecast_cache.get(lat, long, fetch_hourly_coalesced)
 
         logger.info('We form a dictionary with the received data')
 
-        for index, row in filtered_data.iterrows():
-            time_str = row['date'].strftime('%H')
-            temperature = int(row['temperature_2m'])
-            relative_humidity = int(row['relative_humidity_2m'])
-            wind_speed = int(row['wind_speed_10m'])
-            precipitation_probability = int(row['precipitation_probability'])
-            is_day = int(row['is_day'])
-            weather_code = (int(row['weather_code']))
-
-            weather_code = get_weather_code(weather_code, is_day)
-            is_day = get_is_day(is_day)
-
-            hourly_data = {
-                "Temperature": f"{temperature}°",
-                "Relative Humidity": f"{relative_humidity}%",
-                "Wind Speed": f"{wind_speed} m/s",
-                "Precipitation Probability": f"{precipitation_probability}%",
-                "Is Day": is_day,
-                'weather_code': weather_code
-            }
-
-            weather_data.update({time_str: hourly_data})
-
-        return weather_data
+        return build_weather_data(hourly)
     except ValueError as ve:
-        logger.error(f'Invalid input: {ve}')
+        logger.error('Invalid input: %s', ve)
         raise
 
-    except RequestException as e:
-        logger.error(f'Error when requesting Open-Meteo API: {str(e)}')
+    except KeyError as e:
+        logger.error('Error while processing data: %s', e)
         raise
 
-    except KeyError as e:
-        logger.error(f'Error while processing data: {str(e)}')
+    except UpstreamUnavailable as e:
+        logger.error('Error when requesting Open-Meteo API: %s', e)
         raise
 
     except Exception as e:
-        logger.error(f'An error has occurred: {str(e)}')
+        logger.error('An error has occurred: %s', e)
         raise
 
 
+@timed('get_weather_data')
 def get_weather_data(city: str) -> dict | None:
     """
     Получает широту и долготу по названию города и вызывает функцию для получения погоды.
 
     :param city: Название города, для которого нужно получить данные о погоде.
     :return: Dict: Словарь с данными о погоде или None, если город не найден или произошла ошибка.
+    :raises UpstreamUnavailable: Если Nominatim или Open-Meteo недоступны (а не город не найден).
     """
 
     logger.info('Start get_weather_data')
@@ -215,27 +472,112 @@ def get_weather_data(city: str) -> dict | None:
         logger.error('City name is empty or None')
         return None
     try:
-        user_agent = user_agent_api
+        coordinates = geocode_city(city)
+
+        if coordinates is None:
+            return None
+
+        lat, long = coordinates
 
-        logger.info('Create a geolocator object using: Nominatim')
-        geolocator = Nominatim(user_agent=user_agent, ssl_context=ssl_context)
+        weather_data = get_weather(lat, long)
+
+        return weather_data
 
-        logger.info('Get the coordinates of the city')
-        location = geolocator.geocode(city)
+    except UpstreamUnavailable:
+        raise
 
-        if location is None:
-            logger.error('This location does not exist')
+    except Exception as e:
+        logger.error('Error get_weather_data: %s', e)
+        return None
+
+
+@timed('get_weather_data_batch')
+def get_weather_data_batch(cities: list[str]) -> dict[str, dict | None]:
+    """
+    Получает данные о погоде для нескольких городов за один запрос к Open-Meteo.
+
+    :param cities: Список названий городов.
+    :return: Dict: Словарь, где ключ - название города из запроса, а значение - данные о погоде
+        в формате get_weather_data или None, если город не найден или произошла ошибка.
+    :raises UpstreamUnavailable: Если Nominatim или Open-Meteo недоступны (а не город не найден).
+    """
+    logger.info('Start get_weather_data_batch')
+
+    result: dict[str, dict | None] = {city: None for city in cities}
+    coordinates = {}
+
+    for city in result:
+        try:
+            city_coordinates = geocode_city(city)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            logger.error('Error geocoding %s: %s', city, e)
+            continue
+
+        if city_coordinates is not None:
+            coordinates[city] = city_coordinates
+
+    if not coordinates:
+        return result
+
+    try:
+        weather = get_weather_batch(list(coordinates.values()))
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        logger.error('Error get_weather_data_batch: %s', e)
+        return result
+
+    result.update(zip(coordinates, weather))
+
+    return result
+
+
+def get_forecast_columns(city: str, fields: list[str] | None = None, hours: int = FORECAST_HOURS,
+                         days: int = 0) -> dict | None:
+    """
+    Получает прогноз для города в колоночном виде (см. build_forecast_columns).
+
+    Почасовой прогноз и суточные сводки строятся по одним и тем же почасовым массивам
+    из кэша прогнозов, поэтому длина прогноза не влияет на количество запросов к Open-Meteo.
+
+    :param city: Название города.
+    :param fields: Список переменных из HOURLY_VARIABLES. По умолчанию - все переменные.
+    :param hours: Количество часов почасового прогноза (не больше FORECAST_MAX_HOURS).
+    :param days: Количество суток для суточных сводок (не больше FORECAST_MAX_DAYS).
+        Если больше 0, в результат добавляется ключ "daily" (см. build_daily_summary).
+    :return: Dict: Колоночный прогноз или None, если город не найден или произошла ошибка.
+    :raises UpstreamUnavailable: Если Nominatim или Open-Meteo недоступны.
+    """
+    logger.info('Start get_forecast_columns')
+
+    if not city:
+        logger.error('City name is empty or None')
+        return None
+    try:
+        coordinates = geocode_city(city)
+
+        if coordinates is None:
             return None
 
-        logger.info(f'Location - {location}')
+        lat, long = coordinates
 
-        lat = location.latitude
-        long = location.longitude
+        if not (-90 <= lat <= 90 and -180 <= long <= 180):
+            logger.error('Invalid latitude or longitude')
+            return None
 
-        weather_data = get_weather(lat, long)
+        hourly = forecast_cache.get(lat, long, fetch_hourly_coalesced)
+        forecast = build_forecast_columns(hourly, fields, hours=hours)
 
-        return weather_data
+        if days:
+            forecast["daily"] = build_daily_summary(hourly, days)
+
+        return forecast
+
+    except UpstreamUnavailable:
+        raise
 
     except Exception as e:
-        logger.error(f'Error get_weather_data: {e}')
+        logger.error('Error get_forecast_columns: %s', e)
         return None
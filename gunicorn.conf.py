@@ -0,0 +1,93 @@
+"""
+Настройки gunicorn для запуска приложения в production:
+    gunicorn --config gunicorn.conf.py wsgi:app
+
+Несколько процессов (WEB_WORKERS) с потоками в каждом (WEB_THREADS), режим отладки выключен.
+Все параметры задаются переменными окружения, см. config.py. Схема базы данных проверяется
+один раз в главном процессе до запуска рабочих процессов. По SIGTERM рабочие процессы
+завершают текущие запросы (не дольше WEB_GRACEFUL_TIMEOUT секунд), записывают историю поиска
+из очереди и журнал и только после этого завершаются.
+
+Кэши прогнозов и геокодирования процессов дополняются общим хранилищем (CACHE_BACKEND=sqlite
+по умолчанию), чтобы процессы не загружали одни и те же данные каждый сам.
+Журнал пишется в stderr (LOG_FILE=- по умолчанию): файл с ротацией нельзя разделять между процессами.
+"""
+import os
+
+# Рабочие процессы используют общий кэш прогнозов и геокодирования и общий бюджет запросов
+# к внешним API (файл SQLite), если в окружении не задано другое хранилище
+os.environ.setdefault('CACHE_BACKEND', 'sqlite')
+
+# Файл журнала с ротацией не поддерживает запись из нескольких процессов, поэтому рабочие процессы
+# пишут журнал в stderr (его собирает gunicorn или Docker), если в окружении не задан файл
+os.environ.setdefault('LOG_FILE', '-')
+
+from config import (web_bind, web_workers, web_threads, web_timeout, web_graceful_timeout, web_keepalive,
+                    web_max_requests, web_max_requests_jitter, web_preload_app)
+
+bind = web_bind
+workers = web_workers
+threads = web_threads
+worker_class = 'gthread'
+timeout = web_timeout
+graceful_timeout = web_graceful_timeout
+keepalive = web_keepalive
+max_requests = web_max_requests
+max_requests_jitter = web_max_requests_jitter
+preload_app = web_preload_app
+
+
+def on_starting(server):
+    """
+    Проверяет схему базы данных в главном процессе до запуска рабочих процессов.
+    Соединения закрываются, чтобы рабочие процессы не унаследовали открытые соединения SQLite.
+    """
+    from models import close_pool, main_models
+
+    main_models()
+    close_pool()
+
+
+def post_fork(server, worker):
+    """
+    Сбрасывает в рабочем процессе объекты, которые могли быть созданы в главном процессе
+    (при WEB_PRELOAD_APP=1): соединения с базой, HTTP-сессию Open-Meteo и геолокатор.
+    Поток записи журнала создается заново при первой записи в рабочем процессе.
+    """
+    from geocoding import reset_geolocator
+    from models import close_pool
+    from openmeteo_client import reset_openmeteo_client
+
+    close_pool()
+    reset_openmeteo_client()
+    reset_geolocator()
+
+
+def post_worker_init(worker):
+    """
+    Запускает фоновый прогрев кэша прогнозов в рабочем процессе после загрузки приложения.
+    """
+    from prefetch import prefetch_scheduler
+
+    if prefetch_scheduler is not None:
+        prefetch_scheduler.start()
+
+
+def worker_exit(server, worker):
+    """
+    Останавливает фоновые потоки рабочего процесса: прогрев кэша, запись истории поиска
+    (с записью оставшихся в очереди событий) и запись журнала.
+    """
+    from history_writer import search_history_writer
+    from logging_config import stop_log_listener
+    from models import close_pool
+    from prefetch import prefetch_scheduler
+
+    if prefetch_scheduler is not None:
+        prefetch_scheduler.stop(5)
+
+    if search_history_writer is not None:
+        search_history_writer.stop(10)
+
+    close_pool()
+    stop_log_listener()
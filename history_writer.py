@@ -0,0 +1,189 @@
+import atexit
+import logging.config
+import os
+import queue
+import threading
+import time
+from typing import Callable
+
+from config import (search_history_write_behind, search_history_queue_size, search_history_batch_size,
+                    search_history_flush_interval, search_history_overflow_policy)
+from logging_config import dict_config
+from models import save_search_history_batch
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('history_writer')
+
+OVERFLOW_POLICIES = ('block', 'drop', 'sync')
+
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class SearchHistoryWriter:
+    """
+    Отложенная запись истории поиска.
+
+    События поиска складываются в ограниченную очередь в памяти, а фоновый поток
+    записывает их в базу пачками - одной транзакцией на пачку. Пачка записывается,
+    когда в ней набралось batch_size событий или прошло flush_interval секунд с момента
+    появления первого события. При заполненной очереди действует политика overflow_policy:
+    'block' - ждать освобождения места (не дольше flush_interval, затем событие отбрасывается),
+    'drop' - сразу отбросить событие, 'sync' - записать событие в вызывающем потоке.
+    """
+
+    def __init__(self, write_batch: Callable[[list[tuple[str, str, str]]], bool] = save_search_history_batch,
+                 max_queue: int = search_history_queue_size, batch_size: int = search_history_batch_size,
+                 flush_interval: float = search_history_flush_interval,
+                 overflow_policy: str = search_history_overflow_policy):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy: {overflow_policy}')
+
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'sync_writes': 0, 'failed': 0}
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _ensure_started(self) -> None:
+        # Поток запускается при первом событии и перезапускается в дочернем процессе после fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='search-history-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id: str, city: str, timestamp: str) -> bool:
+        """
+        Ставит событие поиска в очередь на запись.
+
+        :param user_id: Идентификатор пользователя.
+        :param city: Название города.
+        :param timestamp: Временная метка поиска.
+        :return: Bool: True, если событие принято (в очередь или записано сразу), False, если отброшено.
+        """
+        self._ensure_started()
+        event = (user_id, city, timestamp)
+
+        try:
+            if self.overflow_policy == 'block':
+                self._queue.put(event, timeout=self.flush_interval)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            if self.overflow_policy == 'sync':
+                self._count('sync_writes')
+                self._write([event])
+                return True
+
+            logger.error('Search history queue is full, event dropped')
+            self._count('dropped')
+            return False
+
+        self._count('submitted')
+        return True
+
+    def _write(self, batch: list[tuple[str, str, str]]) -> None:
+        if not batch:
+            return
+
+        if self.write_batch(batch):
+            self._count('written', len(batch))
+            self._count('batches')
+        else:
+            self._count('failed', len(batch))
+
+    def _run(self) -> None:
+        batch: list[tuple[str, str, str]] = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+
+            if isinstance(item, _FlushRequest):
+                self._write(batch)
+                batch, deadline = [], None
+                item.done.set()
+                continue
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if len(batch) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                self._write(batch)
+                batch, deadline = [], None
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Записывает все события, поставленные в очередь до вызова.
+
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: Bool: True, если запись завершилась за отведенное время.
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+
+        request = _FlushRequest()
+        self._queue.put(request)
+
+        return request.done.wait(timeout)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Записывает оставшиеся события и останавливает фоновый поток.
+
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: None
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid() or not thread.is_alive():
+                return
+
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            self._thread = None
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков и текущую длину очереди.
+
+        :return: Dict: Количество принятых, записанных, отброшенных событий, пачек и т.д.
+        """
+        with self._stats_lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+
+search_history_writer = SearchHistoryWriter() if search_history_write_behind else None
+
+if search_history_writer is not None:
+    atexit.register(search_history_writer.stop, 10)
@@ -0,0 +1,152 @@
+import logging.config
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+
+from cache_backends import CacheBackend, shared_cache
+from config import last_city_cache_size, last_city_cache_ttl
+from logging_config import dict_config
+from models import get_last_searched_city
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('last_city')
+
+_MISSING = object()
+
+
+class LastCityCache:
+    """
+    LRU-кэш последнего искомого города по идентификатору пользователя.
+
+    Хранит результат get_last_searched_city (в том числе None для пользователей без истории)
+    и обновляется при сохранении нового поиска. Записи устаревают через ttl секунд.
+
+    Если задано общее хранилище (backend), записи хранятся в нем, а не в памяти процесса:
+    поиск, сохраненный одним рабочим процессом, сразу виден остальным, даже если сама
+    запись истории еще ждет в очереди search_history_writer.
+    """
+
+    def __init__(self, max_entries: int = last_city_cache_size, ttl: float = last_city_cache_ttl,
+                 backend: CacheBackend | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: OrderedDict[str, tuple[float, list[tuple[str]] | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, user_id: str):
+        """
+        Возвращает сохраненный результат для пользователя.
+
+        :param user_id: (str): Уникальный идентификатор пользователя.
+        :return: Результат get_last_searched_city или _MISSING, если записи нет или она устарела.
+        """
+        if self.backend is not None:
+            value = self.backend.get(self._shared_key(user_id))
+            self._count('hits' if value is not None else 'misses')
+
+            if value is None:
+                return _MISSING
+
+            # Пустое значение - пользователь без истории поиска
+            return [(value.decode('utf-8'),)] if value else None
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+
+            if entry is None or entry[0] <= time.monotonic():
+                self._stats['misses'] += 1
+                return _MISSING
+
+            self._entries.move_to_end(user_id)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def set(self, user_id: str, records: list[tuple[str]] | None) -> None:
+        """
+        Сохраняет результат get_last_searched_city для пользователя.
+
+        :param user_id: (str): Уникальный идентификатор пользователя.
+        :param records: Результат get_last_searched_city.
+        :return: None
+        """
+        if self.backend is not None:
+            value = records[0][0].encode('utf-8') if records else b''
+            self.backend.set(self._shared_key(user_id), value, time.time() + self.ttl)
+            return
+
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, records)
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _shared_key(user_id: str) -> str:
+        return f'last_city:{user_id}'
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков попаданий и промахов и текущее количество записей.
+
+        :return: Dict: Счетчики кэша.
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи из кэша.
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+last_city_cache = LastCityCache(backend=shared_cache)
+
+
+def get_last_city_records(user_id: str) -> list[tuple[str]] | None:
+    """
+    Возвращает последний искомый город пользователя в формате get_last_searched_city.
+
+    В рамках одного HTTP-запроса результат запоминается в flask.g, между запросами
+    берется из LastCityCache, и только при промахе выполняется запрос к базе.
+
+    :param user_id: (str): Уникальный идентификатор пользователя.
+    :return: Список с кортежем последнего искомого города или None, если истории нет.
+    """
+    memo = g.setdefault('last_city_records', {}) if has_app_context() else {}
+
+    if user_id in memo:
+        return memo[user_id]
+
+    records = last_city_cache.get(user_id)
+
+    if records is _MISSING:
+        records = get_last_searched_city(user_id)
+        last_city_cache.set(user_id, records)
+
+    memo[user_id] = records
+
+    return records
+
+
+def remember_last_city(user_id: str, city: str) -> None:
+    """
+    Обновляет кэш последнего искомого города после сохранения нового поиска.
+
+    :param user_id: (str): Уникальный идентификатор пользователя.
+    :param city: (str): Название города.
+    :return: None
+    """
+    last_city_cache.set(user_id, [(city,)])
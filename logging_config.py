@@ -1,18 +1,186 @@
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+from config import log_file, log_max_bytes, log_backup_count, log_queue_size, log_level, log_levels
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+LOGGER_NAMES = ["weather_logger", "main", "models", "get_weather", "geocoding", "gazetteer", "openmeteo_client",
+                "forecast_cache", "history_writer", "last_city", "prefetch", "cache_backends",
+                "resilience"]
+
+_log_queue: queue.Queue | None = None
+_listener: logging.handlers.QueueListener | None = None
+_listener_pid: int | None = None
+_listener_lock = threading.Lock()
+_stats = {'dropped': 0}
+
+
+def parse_log_levels(value: str) -> dict[str, str]:
+    """
+    Разбирает уровни логгеров из строки вида 'main=WARNING,models=ERROR'.
+
+    :param value: Строка с парами логгер=уровень через запятую.
+    :return: Dict: Уровень для каждого упомянутого логгера.
+    """
+    levels = {}
+
+    for item in value.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+
+    return levels
+
+
+def create_file_handler(filename: str = log_file, max_bytes: int = log_max_bytes,
+                        backup_count: int = log_backup_count) -> logging.handlers.RotatingFileHandler:
+    """
+    Создает обработчик, записывающий журнал в файл с ротацией по размеру.
+
+    :param filename: Путь к файлу журнала.
+    :param max_bytes: Размер файла, после которого он переименовывается в архивный.
+    :param backup_count: Количество архивных файлов.
+    :return: RotatingFileHandler: Обработчик с форматом LOG_FORMAT.
+    """
+    handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                   encoding='utf-8', delay=True)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    return handler
+
+
+def create_log_handler(filename: str = log_file) -> logging.Handler:
+    """
+    Создает обработчик для потока QueueListener: запись в файл с ротацией или,
+    если filename равен '-', в stderr.
+
+    Файл с ротацией нельзя использовать из нескольких процессов (например, рабочих процессов
+    gunicorn): ротации конкурируют и записи теряются. Поэтому под gunicorn журнал
+    по умолчанию пишется в stderr, который собирает главный процесс или Docker.
+
+    :param filename: Путь к файлу журнала или '-'.
+    :return: Handler: Обработчик с форматом LOG_FORMAT.
+    """
+    if filename == '-':
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        return handler
+
+    return create_file_handler(filename)
+
+
+def get_log_queue() -> queue.Queue:
+    """
+    Возвращает очередь записей журнала, запуская в текущем процессе поток QueueListener,
+    который пишет записи в файл или stderr (см. create_log_handler). После fork поток и очередь создаются в дочернем процессе заново.
+
+    :return: Queue: Очередь записей.
+    """
+    global _log_queue, _listener, _listener_pid
+
+    if _listener_pid == os.getpid():
+        return _log_queue
+
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            _log_queue = queue.Queue(maxsize=log_queue_size)
+            _listener = logging.handlers.QueueListener(_log_queue, create_log_handler(),
+                                                       respect_handler_level=True)
+            _listener.start()
+            _listener_pid = os.getpid()
+
+    return _log_queue
+
+
+def stop_log_listener() -> None:
+    """
+    Записывает оставшиеся в очереди записи и останавливает поток QueueListener.
+
+    :return: None
+    """
+    global _listener, _listener_pid
+
+    with _listener_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+        _listener_pid = None
+
+
+def get_logging_stats() -> dict:
+    """
+    Возвращает количество отброшенных записей и текущую длину очереди.
+
+    :return: Dict: Счетчики журнала.
+    """
+    with _listener_lock:
+        return dict(_stats, queued=_log_queue.qsize() if _log_queue is not None else 0)
+
+
+_exception_formatter = logging.Formatter()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Обработчик, который только кладет запись в очередь - запись в файл выполняет поток QueueListener.
+
+    В вызывающем потоке в копию записи подставляются только аргументы сообщения и текст
+    исключения (изменяемые аргументы не успеют измениться, а исключение с трассировкой
+    не удерживается в очереди), строку по LOG_FORMAT форматирует поток QueueListener.
+    При переполненной очереди запись отбрасывается, а не блокирует запрос.
+    """
+
+    def __init__(self, log_queue: queue.Queue | None = None):
+        super().__init__(log_queue)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        target = self.queue if self.queue is not None else get_log_queue()
+
+        try:
+            target.put_nowait(record)
+        except queue.Full:
+            with _listener_lock:
+                _stats['dropped'] += 1
+
+
+atexit.register(stop_log_listener)
+
+_levels = parse_log_levels(log_levels)
+
 dict_config = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
         "base": {
-            "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+            "format": LOG_FORMAT
         }
     },
     "handlers": {
+        # Запись в файл (с ротацией) или stderr выполняет поток QueueListener, см. get_log_queue
         "file": {
-            "class": "logging.FileHandler",
+            "class": "logging_config.NonBlockingQueueHandler",
             "level": "DEBUG",
-            "formatter": "base",
-            "filename": "weather_log.log",
-            "mode": "a"
         },
         # "file2": {
         #     "class": "logging.FileHandler",
@@ -23,26 +191,12 @@ dict_config = {
         # }
     },
     "loggers": {
-        "weather_logger": {
-            "level": "DEBUG",
-            "handlers": ["file"],
-            # "propagate": False,
-        },
-        "main": {
-            "level": "DEBUG",
-            "handlers": ["file"],
-            # "propagate": False,
-        },
-        "models": {
-            "level": "DEBUG",
-            "handlers": ["file"],
-            # "propagate": False,
-        },
-        "get_weather": {
-            "level": "DEBUG",
+        name: {
+            "level": _levels.get(name, log_level),
             "handlers": ["file"],
             # "propagate": False,
         }
+        for name in LOGGER_NAMES
     },
 
     # "filters": {},
@@ -1,18 +1,136 @@
+import asyncio
+import hashlib
+import json
+import time
 from datetime import datetime
-from flask import Flask, render_template, request
+import flask
+from flask import Flask, Response, g, request, jsonify, make_response
+from markupsafe import Markup
 from typing import Optional, Dict, Any
-from get_weather import get_weather_data
+from cache_backends import shared_cache
+from compression import compress_body
+from config import batch_max_cities, async_views, eager_imports, flask_debug, debug_headers
+from forecast_cache import forecast_cache
+from gazetteer import get_city_name, load_gazetteer
+from geocoding import geocode_flight, get_geocode_cache_stats
+from get_weather import (get_weather_data, get_weather_data_batch, get_forecast_columns, forecast_flight,
+                         HOURLY_VARIABLES, FORECAST_HOURS, FORECAST_MAX_HOURS, FORECAST_MAX_DAYS)
+from history_writer import search_history_writer
+import last_city
+from last_city import get_last_city_records, remember_last_city
+from metrics import StageTimer, cache_metrics, register_collector, render_metrics, stage_duration, stats_metrics
+from page_cache import ForecastFragment, forecast_page_cache
+from prefetch import prefetch_scheduler
+from resilience import (UpstreamUnavailable, get_stale_age, nominatim_upstream, open_meteo_upstream,
+                        start_stale_tracking)
+from utils import import_heavy_modules
 import logging.config
 
-from models import insert_search_history, update_city_count, get_last_searched_city, main_models
+from models import (insert_search_history, update_city_count, main_models,
+                    start_round_trip_count, get_round_trip_count)
 
-from logging_config import dict_config
+from logging_config import dict_config, get_logging_stats
 
 logging.config.dictConfig(dict_config)
 logger = logging.getLogger('main')
 
+# Заголовок ответа, построенного по устаревшему прогнозу (Open-Meteo был недоступен)
+STALE_WARNING = '110 - "Response is Stale"'
+
 app: Flask = Flask(__name__)
 
+load_gazetteer()
+
+if eager_imports:
+    import_heavy_modules()
+
+
+@app.before_request
+def count_db_round_trips() -> None:
+    """
+    Начинает подсчет обращений к базе данных, отслеживание устаревших прогнозов
+    и измерение времени обработки текущего запроса.
+    """
+    start_round_trip_count()
+    start_stale_tracking()
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def report_db_round_trips(response):
+    """
+    Добавляет в ответ заголовок X-DB-Round-Trips с количеством обращений к базе данных за запрос,
+    включая общее хранилище кэшей SQLite (только если включены отладочные заголовки,
+    DEBUG_HEADERS=1 или FLASK_DEBUG=1).
+    """
+    round_trips = get_round_trip_count()
+    if debug_headers:
+        response.headers['X-DB-Round-Trips'] = str(round_trips)
+    logger.debug('%s %s: %s DB round trips', request.method, request.path, round_trips)
+
+    request_started = g.pop('request_started', None)
+    if request_started is not None:
+        stage_duration.observe(time.perf_counter() - request_started, 'request')
+
+    return response
+
+
+def render_template(template_name: str, **context: Any) -> str:
+    """
+    Отрисовывает шаблон через flask.render_template, измеряя время как этап render.<шаблон>.
+
+    :param template_name: (str): Имя шаблона.
+    :param context: Переменные шаблона.
+    :return: Str: HTML-контент.
+    """
+    with StageTimer(f'render.{template_name}'):
+        return flask.render_template(template_name, **context)
+
+
+def collect_component_metrics() -> list[str]:
+    """
+    Собирает метрики кэшей и фоновых компонентов из их счетчиков get_stats().
+
+    :return: List: Строки в текстовом формате Prometheus.
+    """
+    geocode_stats = get_geocode_cache_stats()
+    forecast_stats = forecast_cache.get_stats()
+    page_stats = forecast_page_cache.get_stats()
+    last_city_stats = last_city.last_city_cache.get_stats()
+
+    caches = {
+        'gazetteer': (geocode_stats['gazetteer_hits'], geocode_stats['shared_hits'] + geocode_stats['hits'] +
+                      geocode_stats['negative_hits'] + geocode_stats['misses']),
+        'geocode': (geocode_stats['shared_hits'] + geocode_stats['hits'] + geocode_stats['negative_hits'],
+                    geocode_stats['misses']),
+        'forecast': (forecast_stats['hits'] + forecast_stats['shared_hits'], forecast_stats['misses']),
+        'page': (page_stats['hits'], page_stats['misses']),
+        'last_city': (last_city_stats['hits'], last_city_stats['misses']),
+    }
+
+    components = {
+        'forecast_cache': forecast_stats,
+        'page_cache': page_stats,
+        'last_city_cache': last_city_stats,
+        'geocode_flight': geocode_flight.get_stats(),
+        'forecast_flight': forecast_flight.get_stats(),
+        'open_meteo_upstream': open_meteo_upstream.get_stats(),
+        'nominatim_upstream': nominatim_upstream.get_stats(),
+        'logging': get_logging_stats(),
+    }
+    if search_history_writer is not None:
+        components['history_writer'] = search_history_writer.get_stats()
+    if prefetch_scheduler is not None:
+        components['prefetch'] = prefetch_scheduler.get_stats()
+    if shared_cache is not None:
+        components['shared_cache'] = shared_cache.get_stats()
+
+    return cache_metrics(caches) + stats_metrics('weather_component_stats', 'Счетчики кэшей и фоновых компонентов',
+                                                 components)
+
+
+register_collector(collect_component_metrics)
+
 
 def save_search_history(user_id: str, city: str, timestamp: str) -> None:
     """
@@ -26,8 +144,14 @@ def save_search_history(user_id: str, city: str, timestamp: str) -> None:
     """
     logger.info('Start save_search_history')
 
-    insert_search_history(user_id, city, timestamp)
-    update_city_search_count(city)
+    if search_history_writer is not None:
+        # Запись выполняется фоновым потоком пачками, запрос не ждет обращения к диску
+        search_history_writer.submit(user_id, city, timestamp)
+    else:
+        insert_search_history(user_id, city, timestamp)
+        update_city_search_count(city)
+
+    remember_last_city(user_id, city)
 
 
 def update_city_search_count(city: str) -> None:
@@ -40,45 +164,38 @@ def update_city_search_count(city: str) -> None:
     update_city_count(city)
 
 
-def weather_get_post(weather_result: dict, city: str) -> tuple:
+def get_last_city(user_id: str, city: str) -> str:
     """
-    Получает текущую погоду для заданного города и возвращает данные о погоде
-    и последнем искомом городе.
+    Возвращает последний искомый город пользователя или переданный город, если истории нет.
 
-    Функция принимает результат погодного запроса и название города,
-    извлекает текущие погодные данные на основе времени и возвращает их вместе
-    с информацией о последнем искомом городе.
-    :param weather_result: (dict): Словарь с результатами погодного запроса, где ключом является час
-        (в формате строки), а значением - информация о погоде.
-    :param city: (str): Название города, для которого запрашивается информация о погоде.
-    :return: (tuple):
-        Кортеж, содержащий:
-        - словарь с текущей погодой для указанного часа
-        - исходный словарь с результатами погодного запроса
-        - название последнего искомого города.
-
-    Возможно возникновение исключений, связанных с обращением к данным,
-    если структура `weather_result` не соответствует ожидаемой,
-    или если возникли проблемы с получением последнего искомого города.
+    :param user_id: (str): Уникальный идентификатор пользователя.
+    :param city: (str): Город текущего запроса.
+    :return: Str: Название последнего искомого города.
     """
-    logger.info('Start weather_get_post')
-
-    now_date_time = datetime.now()
-    now_time_hour = str(now_date_time.time().hour)
-    user_id = request.remote_addr
-
-    last_city_records = get_last_searched_city(user_id)
+    last_city_records = get_last_city_records(user_id)
 
     last_city = last_city_records[0][0] if last_city_records else None
 
     if last_city is None:
-        logger.info('weather_get_post: No cities in the database')
+        logger.info('get_last_city: No cities in the database')
         last_city = city
 
+    return last_city
+
+
+def get_weather_now(weather_result: dict) -> dict:
+    """
+    Возвращает погоду на текущий час с крупной иконкой.
+
+    :param weather_result: (dict): Словарь с результатами погодного запроса, где ключом является час.
+    :return: Dict: Копия данных о погоде для текущего часа.
+    """
+    now_time_hour = str(datetime.now().time().hour)
+
     weather_now = weather_result[now_time_hour].copy()
     weather_now['weather_code'] = weather_now['weather_code'].replace('-1', '')
 
-    return weather_now, last_city
+    return weather_now
 
 
 def get_last_city_link(user_id: str) -> dict:
@@ -96,7 +213,16 @@ def get_last_city_link(user_id: str) -> dict:
         Если последний город не найден, возвращается пустой словарь.
     """
 
-    last_city_db = get_last_searched_city(user_id)
+    return make_last_city_link(get_last_city_records(user_id))
+
+
+def make_last_city_link(last_city_db: list[tuple[str]] | None) -> dict:
+    """
+    Формирует ссылку на последний искомый город по результату get_last_searched_city.
+
+    :param last_city_db: Результат get_last_searched_city.
+    :return: Dict: Словарь с ключами 'text' и 'href' или пустой словарь, если города нет.
+    """
     link_data = {}
 
     if last_city_db:
@@ -150,6 +276,135 @@ def handle_post_request(user_id: str, link_data: dict) -> str:
     return fetch_weather_data(city_request, link_data, user_id)
 
 
+def get_forecast_fragment(city_request: str) -> ForecastFragment | None:
+    """
+    Возвращает отрисованный фрагмент с прогнозом для города.
+
+    Фрагмент не зависит от пользователя, поэтому берется из кэша forecast_page_cache
+    (ключ - нормализованное название города и текущий час) и отрисовывается только при промахе.
+    Фрагмент, отрисованный по устаревшему прогнозу, не кэшируется, чтобы после восстановления
+    Open-Meteo страница сразу показала свежий прогноз.
+    :param city_request: (str): Название города.
+    :return: ForecastFragment или None, если город не найден или произошла ошибка.
+    :raises UpstreamUnavailable: Если Nominatim или Open-Meteo недоступны.
+    """
+    fragment = forecast_page_cache.get(city_request)
+
+    if fragment is not None:
+        logger.info('get_forecast_fragment: Fragment found in cache')
+        return fragment
+
+    result = get_weather_data(city_request)
+
+    if result is None:
+        return None
+
+    # Фрагмент общий для всех написаний названия, поэтому отрисовывается название из справочника,
+    # а для города не из справочника - запрос без лишних пробелов
+    city = get_city_name(city_request) or ' '.join(city_request.split()).capitalize()
+    stale = get_stale_age() is not None
+    fragment = ForecastFragment(render_template('forecast.html', city=city,
+                                                weather_now=get_weather_now(result), weather_data=result,
+                                                stale=stale), stale=stale)
+
+    if not stale:
+        forecast_page_cache.set(city_request, fragment)
+
+    return fragment
+
+
+def render_city_not_found(link_data: Dict[str, str]) -> str:
+    """
+    Возвращает страницу с сообщением о том, что город не найден.
+
+    :param link_data: (Dict[str, str]): Данные для ссылки на последний искомый город.
+    :return: Str: HTML-контент.
+    """
+    logger.info('City not found')
+
+    forecast_html = Markup(render_template('forecast.html', error_message="Город не найден"))
+
+    return render_template('get_weather.html', forecast_html=forecast_html, link_data=link_data)
+
+
+def render_service_unavailable(link_data: Dict[str, str], error: UpstreamUnavailable) -> Any:
+    """
+    Возвращает страницу с сообщением о временной недоступности сервиса погоды (503).
+
+    :param link_data: (Dict[str, str]): Данные для ссылки на последний искомый город.
+    :param error: (UpstreamUnavailable): Ошибка внешнего API.
+    :return: Объект ответа с кодом 503 и заголовком Retry-After.
+    """
+    logger.warning('Upstream unavailable: %s', error)
+
+    forecast_html = Markup(render_template('forecast.html', unavailable=True))
+    response = make_response(render_template('get_weather.html', forecast_html=forecast_html,
+                                             link_data=link_data), 503)
+    set_retry_after(response, error)
+
+    return response
+
+
+def set_retry_after(response: Response, error: UpstreamUnavailable) -> None:
+    """
+    Добавляет в ответ заголовок Retry-After, если известно, когда повторить запрос.
+
+    :param response: (Response): Ответ.
+    :param error: (UpstreamUnavailable): Ошибка внешнего API.
+    :return: None
+    """
+    if error.retry_after is not None:
+        response.retry_after = max(1, round(error.retry_after))
+
+
+def service_unavailable_json(error: UpstreamUnavailable) -> Response:
+    """
+    Возвращает JSON-ответ API о временной недоступности сервиса погоды (503).
+
+    :param error: (UpstreamUnavailable): Ошибка внешнего API.
+    :return: Объект ответа с кодом 503 и заголовком Retry-After.
+    """
+    logger.warning('Upstream unavailable: %s', error)
+
+    response = jsonify({'error': 'Сервис погоды временно недоступен'})
+    response.status_code = 503
+    set_retry_after(response, error)
+
+    return response
+
+
+def render_forecast_page(fragment: ForecastFragment, link_data: Dict[str, str], conditional: bool = False) -> Any:
+    """
+    Собирает страницу прогноза из закэшированного фрагмента и персональной ссылки на последний город.
+
+    :param fragment: (ForecastFragment): Фрагмент с прогнозом.
+    :param link_data: (Dict[str, str]): Данные для ссылки на последний искомый город.
+    :param conditional: (bool): Если True, ответ получает ETag и Last-Modified и может быть
+        заменен на 304 Not Modified для условного GET-запроса.
+    :return: HTML-контент или объект ответа.
+    """
+    html = render_template('get_weather.html', forecast_html=fragment.html, link_data=link_data)
+
+    if not conditional and not fragment.stale:
+        return html
+
+    response = make_response(html)
+
+    if fragment.stale:
+        response.headers['Warning'] = STALE_WARNING
+
+    if not conditional:
+        return response
+
+    link_key = f"{link_data.get('text', '')}|{link_data.get('href', '')}"
+    response.set_etag(hashlib.sha1(f'{fragment.etag}|{link_key}'.encode('utf-8')).hexdigest())
+    response.last_modified = fragment.last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
+
+
 def fetch_weather_data(city_request: str, link_data: Dict[str, str], user_id: Optional[str] = None) -> Any:
     """
     Получает данные о погоде для указанного города и возвращает HTML-страницу с результатами.
@@ -159,31 +414,30 @@ def fetch_weather_data(city_request: str, link_data: Dict[str, str], user_id: Op
         Должен содержать ключи 'text' и 'href'.
     :param user_id: (Необязательный): Идентификатор пользователя для сохранения истории поиска.
     :return: HTML-шаблон с данными о погоде или сообщение об ошибке, если город не найден.
+        Ответ на GET-запрос поддерживает условные запросы (ETag/Last-Modified).
     """
 
     logger.info('Start fetch_weather_data')
 
-    result = get_weather_data(city_request)
-
-    if result is None:
-        logger.info('City not found')
-
-        return render_template('get_weather.html', error_message="Город не найден", link_data=link_data)
+    try:
+        fragment = get_forecast_fragment(city_request)
+    except UpstreamUnavailable as e:
+        return render_service_unavailable(link_data, e)
 
-    weather_now, last_city = weather_get_post(result, city_request)
+    if fragment is None:
+        return render_city_not_found(link_data)
 
     if user_id:
+        last_city = get_last_city(user_id, city_request)
         save_search_history(user_id, city_request, datetime.now().isoformat())  # Сохраняем историю поиска
         link_data['text'] = last_city.capitalize()
         link_data['href'] = f'/?city={last_city}'
 
     logger.info('fetch_weather_data: Render get_weather.html')
 
-    return render_template('get_weather.html', city=city_request.capitalize(),
-                           weather_now=weather_now, weather_data=result, link_data=link_data)
+    return render_forecast_page(fragment, link_data, conditional=user_id is None)
 
 
-@app.route('/', methods=["GET", "POST"])
 def weather():
     try:
         user_id = request.remote_addr
@@ -200,10 +454,198 @@ def weather():
         return render_template('base.html', link_data=link_data)
 
     except Exception as e:
-        logger.error(f"An error occurred: {str(e)}, code: 500")
+        logger.error("An error occurred: %s, code: 500", e)
+        return f"An error occurred: {str(e)}", 500
+
+
+async def weather_async():
+    """
+    Асинхронный вариант weather().
+
+    Независимые шаги выполняются одновременно в потоках: поиск последнего города
+    пользователя в БД идет параллельно с геокодированием и запросом прогноза,
+    а последний город запрашивается из БД один раз на запрос.
+    :return: HTML-контент, который будет возвращен в ответ на запрос.
+    """
+    try:
+        user_id = request.remote_addr
+
+        if request.method == 'POST':
+            logger.info('Start processing async POST request')
+            city_request = request.form['city']
+        else:
+            logger.info('Start processing async GET request')
+            city_request = request.args.get('city')
+
+        if city_request is None:
+            link_data = await asyncio.to_thread(get_last_city_link, user_id)
+            return render_template('base.html', link_data=link_data)
+
+        last_city_records, fragment = await asyncio.gather(
+            asyncio.to_thread(get_last_city_records, user_id),
+            asyncio.to_thread(get_forecast_fragment, city_request),
+        )
+        link_data = make_last_city_link(last_city_records)
+
+        if fragment is None:
+            return render_city_not_found(link_data)
+
+        if request.method == 'POST':
+            last_city = last_city_records[0][0] if last_city_records else city_request
+            await asyncio.to_thread(save_search_history, user_id, city_request, datetime.now().isoformat())
+            link_data['text'] = last_city.capitalize()
+            link_data['href'] = f'/?city={last_city}'
+
+        return render_forecast_page(fragment, link_data, conditional=request.method == 'GET')
+
+    except UpstreamUnavailable as e:
+        link_data = await asyncio.to_thread(get_last_city_link, user_id)
+        return render_service_unavailable(link_data, e)
+
+    except Exception as e:
+        logger.error("An error occurred: %s, code: 500", e)
         return f"An error occurred: {str(e)}", 500
 
 
+app.add_url_rule('/', 'weather', weather_async if async_views else weather, methods=["GET", "POST"])
+
+
+@app.route('/api/weather/batch', methods=["GET", "POST"])
+def weather_batch():
+    """
+    Возвращает прогнозы для нескольких городов в формате JSON, получая их одним запросом к Open-Meteo.
+
+    Города передаются параметрами запроса (?city=Москва&city=Казань) или в теле POST-запроса
+    в виде JSON {"cities": ["Москва", "Казань"]}.
+    :return: JSON-список объектов {"city": название, "weather": прогноз или null};
+        503 с заголовком Retry-After, если Nominatim или Open-Meteo недоступны.
+    """
+    logger.info('Start weather_batch')
+
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        cities = payload.get('cities')
+    else:
+        cities = request.args.getlist('city')
+
+    if not cities or not isinstance(cities, list) or not all(isinstance(city, str) for city in cities):
+        return jsonify({'error': 'Не переданы города'}), 400
+
+    if len(cities) > batch_max_cities:
+        return jsonify({'error': f'Не более {batch_max_cities} городов за один запрос'}), 400
+
+    try:
+        result = get_weather_data_batch(cities)
+    except UpstreamUnavailable as e:
+        return service_unavailable_json(e)
+
+    response = jsonify([{'city': city, 'weather': weather} for city, weather in result.items()])
+
+    if get_stale_age() is not None:
+        response.headers['Warning'] = STALE_WARNING
+
+    return response
+
+
+def get_int_arg(name: str, default: int, low: int, high: int) -> int | None:
+    """
+    Возвращает целочисленный параметр запроса из диапазона [low, high].
+
+    :param name: (str): Название параметра.
+    :param default: (int): Значение, если параметр не передан.
+    :param low: (int): Минимальное допустимое значение.
+    :param high: (int): Максимальное допустимое значение.
+    :return: Int или None, если значение не является целым числом или вне диапазона.
+    """
+    value = request.args.get(name)
+
+    if value is None:
+        return default
+
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+
+    return value if low <= value <= high else None
+
+
+@app.route('/api/forecast')
+def forecast_api():
+    """
+    Возвращает прогноз для города в формате JSON в колоночном виде.
+
+    Параметры запроса: city - название города, fields - необязательный список переменных через
+    запятую (по умолчанию все переменные HOURLY_VARIABLES), hours - необязательное количество часов
+    почасового прогноза (по умолчанию 24, не больше FORECAST_MAX_HOURS), days - необязательное
+    количество суток для суточных сводок (не больше FORECAST_MAX_DAYS). Ответ сжимается gzip
+    или brotli в зависимости от заголовка Accept-Encoding.
+    :return: JSON {"city": название, "start": время первого часа, "interval": шаг в секундах,
+        "count": количество часов, "fields": {переменная: список значений}}; если передан days,
+        также "daily": {"dates": даты, "count": количество суток, "fields": {переменная: список значений}}.
+    """
+    logger.info('Start forecast_api')
+
+    city = request.args.get('city', '').strip()
+
+    if not city:
+        return jsonify({'error': 'Не передан город'}), 400
+
+    fields = [name for value in request.args.getlist('fields') for name in value.split(',') if name]
+    unknown_fields = [name for name in fields if name not in HOURLY_VARIABLES]
+
+    if unknown_fields:
+        return jsonify({'error': f'Неизвестные поля: {", ".join(unknown_fields)}'}), 400
+
+    hours = get_int_arg('hours', FORECAST_HOURS, 1, FORECAST_MAX_HOURS)
+
+    if hours is None:
+        return jsonify({'error': f'Параметр hours должен быть от 1 до {FORECAST_MAX_HOURS}'}), 400
+
+    days = get_int_arg('days', 0, 0, FORECAST_MAX_DAYS)
+
+    if days is None:
+        return jsonify({'error': f'Параметр days должен быть от 0 до {FORECAST_MAX_DAYS}'}), 400
+
+    try:
+        forecast = get_forecast_columns(city, list(dict.fromkeys(fields)) or None, hours=hours, days=days)
+    except UpstreamUnavailable as e:
+        return service_unavailable_json(e)
+
+    if forecast is None:
+        return jsonify({'error': 'Город не найден'}), 404
+
+    stale = get_stale_age() is not None
+    if stale:
+        forecast['stale'] = True
+
+    body = json.dumps({'city': city, **forecast}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    body, encoding = compress_body(body, request.accept_encodings)
+
+    response = Response(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+
+    if stale:
+        response.headers['Warning'] = STALE_WARNING
+
+    if encoding is not None:
+        response.content_encoding = encoding
+
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Возвращает метрики приложения в текстовом формате Prometheus: гистограммы времени
+    выполнения этапов, ошибки внешних API, попадания в кэши и счетчики фоновых компонентов.
+    :return: Текст метрик.
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
     main_models()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if prefetch_scheduler is not None:
+        prefetch_scheduler.start()
+    app.run(debug=flask_debug, host='0.0.0.0', port=5000)
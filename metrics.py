@@ -0,0 +1,263 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from config import metrics_enabled
+
+# Границы корзин гистограмм времени выполнения (сек)
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    """
+    Формирует набор меток в формате Prometheus.
+
+    :param names: Имена меток.
+    :param values: Значения меток в том же порядке.
+    :param extra: Дополнительная метка в готовом виде (например, 'le="0.5"').
+    :return: Str: Строка вида '{stage="geocode",le="0.5"}' или пустая строка, если меток нет.
+    """
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+
+    if extra:
+        labels.append(extra)
+
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Histogram:
+    """
+    Гистограмма значений с фиксированными корзинами, разделенная по значениям меток.
+    """
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        """
+        Добавляет значение в гистограмму.
+
+        :param value: Наблюдаемое значение.
+        :param label_values: Значения меток.
+        :return: None
+        """
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(label_values)
+
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> list[str]:
+        """
+        Возвращает гистограмму в текстовом формате Prometheus.
+
+        :return: List: Строки с корзинами (накопительно), суммой и количеством значений.
+        """
+        with self._lock:
+            snapshot = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+
+        for label_values, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                labels = format_labels(self.label_names, label_values, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+
+        return lines
+
+
+class Counter:
+    """
+    Монотонно растущий счетчик, разделенный по значениям меток.
+    """
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        """
+        Увеличивает счетчик.
+
+        :param label_values: Значения меток.
+        :param amount: Величина увеличения.
+        :return: None
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        """
+        Возвращает текущее значение счетчика.
+
+        :param label_values: Значения меток.
+        :return: Float: Значение счетчика (0, если он еще не увеличивался).
+        """
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def collect(self) -> list[str]:
+        """
+        Возвращает счетчик в текстовом формате Prometheus.
+
+        :return: List: Строки со значениями счетчика.
+        """
+        with self._lock:
+            snapshot = dict(self._values)
+
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{format_labels(self.label_names, labels)} {value}'
+                     for labels, value in sorted(snapshot.items()))
+
+        return lines
+
+
+stage_duration = Histogram('weather_stage_duration_seconds', 'Время выполнения этапа обработки запроса',
+                           ('stage',))
+upstream_errors = Counter('weather_upstream_errors_total', 'Количество ошибок запросов к внешним API',
+                          ('upstream',))
+
+_collectors: list[Callable[[], list[str]]] = []
+
+
+class StageTimer:
+    """
+    Контекстный менеджер, измеряющий время выполнения блока как этап stage.
+
+    Если задан upstream, исключение внутри блока считается ошибкой этого внешнего API.
+    """
+
+    __slots__ = ('stage', 'upstream', 'started')
+
+    def __init__(self, stage: str, upstream: str | None = None):
+        self.stage = stage
+        self.upstream = upstream
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stage_duration.observe(time.perf_counter() - self.started, self.stage)
+
+        if exc_type is not None and self.upstream is not None:
+            upstream_errors.inc(self.upstream)
+
+        return False
+
+
+def timed(stage: str, upstream: str | None = None) -> Callable:
+    """
+    Декоратор, измеряющий время выполнения функции как этап stage.
+
+    :param stage: Название этапа (значение метки stage).
+    :param upstream: Название внешнего API, исключения функции считаются его ошибками.
+    :return: Декоратор. Если метрики отключены (METRICS_ENABLED=0), функция не оборачивается.
+    """
+    def decorator(func: Callable) -> Callable:
+        if not metrics_enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if upstream is not None:
+                    upstream_errors.inc(upstream)
+                raise
+            finally:
+                stage_duration.observe(time.perf_counter() - started, stage)
+
+        return wrapper
+
+    return decorator
+
+
+def register_collector(collector: Callable[[], list[str]]) -> None:
+    """
+    Регистрирует функцию, которая при каждом запросе /metrics возвращает дополнительные метрики.
+
+    :param collector: Функция без аргументов, возвращающая строки в текстовом формате Prometheus.
+    :return: None
+    """
+    _collectors.append(collector)
+
+
+def cache_metrics(caches: dict[str, tuple[int, int]]) -> list[str]:
+    """
+    Формирует метрики попаданий, промахов и доли попаданий для нескольких кэшей.
+
+    :param caches: Словарь {название кэша: (количество попаданий, количество промахов)}.
+    :return: List: Строки в текстовом формате Prometheus.
+    """
+    lines = ['# HELP weather_cache_requests_total Количество обращений к кэшу',
+             '# TYPE weather_cache_requests_total counter']
+    ratios = ['# HELP weather_cache_hit_ratio Доля попаданий в кэш',
+              '# TYPE weather_cache_hit_ratio gauge']
+
+    for cache, (hits, misses) in caches.items():
+        lines.append(f'weather_cache_requests_total{{cache="{cache}",result="hit"}} {hits}')
+        lines.append(f'weather_cache_requests_total{{cache="{cache}",result="miss"}} {misses}')
+        ratios.append(f'weather_cache_hit_ratio{{cache="{cache}"}} {hits / (hits + misses) if hits + misses else 0}')
+
+    return lines + ratios
+
+
+def stats_metrics(name: str, description: str, stats: dict[str, dict]) -> list[str]:
+    """
+    Формирует метрику из счетчиков get_stats() нескольких компонентов.
+
+    :param name: Имя метрики.
+    :param description: Описание метрики.
+    :param stats: Словарь {название компонента: результат его get_stats()}.
+    :return: List: Строки в текстовом формате Prometheus с метками component и counter.
+    """
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} gauge']
+
+    for component, component_stats in stats.items():
+        for counter, value in component_stats.items():
+            lines.append(f'{name}{{component="{component}",counter="{counter}"}} {value}')
+
+    return lines
+
+
+def render_metrics() -> str:
+    """
+    Возвращает все метрики в текстовом формате Prometheus.
+
+    :return: Str: Текст для ответа на запрос /metrics.
+    """
+    lines = stage_duration.collect() + upstream_errors.collect()
+
+    for collector in _collectors:
+        lines.extend(collector())
+
+    return '\n'.join(lines) + '\n'
@@ -1,9 +1,17 @@
+import atexit
+import contextvars
+import queue
 import sqlite3
 import logging.config
+import threading
+from contextlib import contextmanager
 from sqlite3 import Cursor
-from typing import Optional, List, Tuple
+from typing import Callable, Optional, List, Tuple, Iterator
 
+from config import db_pool_size, db_busy_timeout, db_cached_statements
 from logging_config import dict_config
+from metrics import timed
+from utils import normalize_city_name
 
 logging.config.dictConfig(dict_config)
 logger = logging.getLogger('models')
@@ -11,6 +19,258 @@ logger = logging.getLogger('models')
 db_path = 'table_weather_history.db'
 
 
+class ConnectionPool:
+    """
+    Пул соединений SQLite для одного файла базы данных.
+
+    Соединения открываются в режиме WAL с synchronous=NORMAL и кэшем подготовленных
+    выражений, создаются по мере необходимости и возвращаются в пул после использования.
+    Схема базы данных проверяется один раз при создании пула.
+
+    :param path: Путь к файлу базы данных.
+    :param size: Максимальное количество свободных соединений.
+    :param init: Функция, создающая схему базы данных. По умолчанию - init_schema.
+    """
+
+    def __init__(self, path: str, size: int = db_pool_size,
+                 init: Callable[[sqlite3.Connection], None] | None = None):
+        self.path = path
+        self.size = size
+        self._connections: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=size)
+        self._closed = False
+
+        conn = self._connect()
+        try:
+            (init or init_schema)(conn)
+        finally:
+            self._release(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=db_busy_timeout, check_same_thread=False,
+                               cached_statements=db_cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if self._closed:
+            conn.close()
+            return
+
+        try:
+            self._connections.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Выдает соединение из пула. Транзакция фиксируется при успешном выходе из блока
+        и откатывается при исключении.
+        """
+        try:
+            conn = self._connections.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._release(conn)
+
+    def close(self) -> None:
+        """
+        Закрывает все свободные соединения пула.
+        """
+        self._closed = True
+
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Возвращает пул соединений для текущего db_path, создавая его при первом обращении.
+
+    :return: ConnectionPool: Пул соединений.
+    """
+    global _pool
+
+    pool = _pool
+    if pool is not None and pool.path == db_path:
+        return pool
+
+    with _pool_lock:
+        if _pool is None or _pool.path != db_path:
+            if _pool is not None:
+                _pool.close()
+            logger.info('Create connection pool for %s', db_path)
+            _pool = ConnectionPool(db_path)
+
+        return _pool
+
+
+# Счетчик обращений к базе в рамках текущего запроса (список из одного элемента,
+# чтобы его разделяли потоки, в которые копируется контекст запроса)
+_round_trips: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar('db_round_trips', default=None)
+
+
+def start_round_trip_count() -> None:
+    """
+    Начинает подсчет обращений к базе для текущего контекста (например, HTTP-запроса).
+
+    :return: None
+    """
+    _round_trips.set([0])
+
+
+def get_round_trip_count() -> int:
+    """
+    Возвращает количество обращений к базе с момента вызова start_round_trip_count.
+
+    :return: Int: Количество выданных соединений или 0, если подсчет не начат.
+    """
+    counter = _round_trips.get()
+
+    return counter[0] if counter is not None else 0
+
+
+def count_round_trip() -> None:
+    """
+    Учитывает одно обращение к базе в текущем контексте. Вызывается при выдаче соединения
+    как с основной базой, так и с общим хранилищем кэшей (cache_backends).
+
+    :return: None
+    """
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def get_connection():
+    """
+    Возвращает контекстный менеджер с соединением из общего пула.
+
+    :return: Контекстный менеджер, выдающий sqlite3.Connection.
+    """
+    count_round_trip()
+
+    return get_pool().connection()
+
+
+def close_pool() -> None:
+    """
+    Закрывает общий пул соединений. Следующее обращение к базе создаст новый пул.
+
+    :return: None
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+
+
+atexit.register(close_pool)
+
+
+def init_schema(conn: sqlite3.Connection) -> None:
+    """
+    Создает все таблицы приложения, если они еще не существуют, и применяет миграции схемы.
+
+    :return: None
+    """
+    with conn:
+        cursor = conn.cursor()
+        ensure_search_history_table_exists(cursor)
+        ensure_city_counts_table_exists(cursor)
+        ensure_geocode_cache_table_exists(cursor)
+
+    migrate_schema(conn)
+
+
+def migrate_city_counts_unique_key(cursor: sqlite3.Cursor) -> None:
+    """
+    Миграция 1: добавляет в city_counts нормализованное название города city_key
+    с уникальным индексом. Строки, которые отличались только написанием города
+    (регистр, пробелы, ё/е), объединяются в одну с суммарным счетчиком.
+
+    :return: None
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(city_counts)")]
+
+    if 'city_key' not in columns:
+        cursor.execute("ALTER TABLE city_counts ADD COLUMN city_key TEXT")
+
+    merged: dict[str, list[int]] = {}
+
+    for row_id, city, count in cursor.execute("SELECT id, city, count FROM city_counts ORDER BY id").fetchall():
+        city_key = normalize_city_name(city)
+
+        if city_key in merged:
+            merged[city_key][1] += count or 0
+            cursor.execute("DELETE FROM city_counts WHERE id = ?", (row_id,))
+        else:
+            merged[city_key] = [row_id, count or 0]
+
+    cursor.executemany("UPDATE city_counts SET city_key = ?, count = ? WHERE id = ?",
+                       [(city_key, count, row_id) for city_key, (row_id, count) in merged.items()])
+
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_city_counts_city_key ON city_counts (city_key)")
+
+
+def migrate_search_history_user_index(cursor: sqlite3.Cursor) -> None:
+    """
+    Миграция 2: добавляет составной индекс (user_id, id) в search_history, чтобы поиск
+    последнего города пользователя (WHERE user_id = ? ORDER BY id DESC LIMIT 1)
+    выполнялся за O(log n) независимо от размера истории.
+
+    :return: None
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_history_user_id ON search_history (user_id, id)")
+
+
+# Миграции схемы по порядку; номер миграции хранится в PRAGMA user_version
+SCHEMA_MIGRATIONS = [
+    migrate_city_counts_unique_key,
+    migrate_search_history_user_index,
+]
+
+
+def migrate_schema(conn: sqlite3.Connection) -> None:
+    """
+    Применяет еще не выполненные миграции схемы. Каждая миграция выполняется
+    в отдельной транзакции с блокировкой на запись, поэтому несколько процессов
+    могут запускать ее одновременно.
+
+    :return: None
+    """
+    for version, migration in enumerate(SCHEMA_MIGRATIONS, start=1):
+        if conn.in_transaction:
+            conn.commit()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < version:
+                logger.info('Apply schema migration %s: %s', version, migration.__name__)
+                migration(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+@timed('db.create_search_history_table')
 def create_search_history_table() -> None:
     """
     Создает таблицу с именем 'search_history' в базе данных SQLite, если она еще не существует.
@@ -19,7 +279,7 @@ def create_search_history_table() -> None:
     """
 
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection() as conn:
             cursor: Cursor = conn.cursor()
 
             create_table_query = """
@@ -31,11 +291,12 @@ def create_search_history_table() -> None:
             """
             cursor.execute(create_table_query)
     except sqlite3.Error as e:
-        logger.error(f'Error creating table city_counts: {e}')
+        logger.error('Error creating table city_counts: %s', e)
     except Exception as e:
-        logger.error(f'Unexpected error: {e}')
+        logger.error('Unexpected error: %s', e)
 
 
+@timed('db.create_city_counts_table')
 def create_city_counts_table() -> None:
     """
     Создает таблицу для хранения количества вводов городов в базе данных SQLite, если она еще не существует.
@@ -43,7 +304,7 @@ def create_city_counts_table() -> None:
     :return: None
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection() as conn:
             cursor: Cursor = conn.cursor()
 
             create_table_query = """
@@ -54,9 +315,9 @@ def create_city_counts_table() -> None:
                 """
             cursor.execute(create_table_query)
     except sqlite3.Error as e:
-        logger.error(f'Error creating table city_counts: {e}')
+        logger.error('Error creating table city_counts: %s', e)
     except Exception as e:
-        logger.error(f'Unexpected error: {e}')
+        logger.error('Unexpected error: %s', e)
 
 
 def ensure_search_history_table_exists(cursor: sqlite3.Cursor) -> None:
@@ -108,34 +369,34 @@ def ensure_city_counts_table_exists(cursor: sqlite3.Cursor) -> None:
         cursor.execute(create_table_query)
 
 
+@timed('db.insert_search_history')
 def insert_search_history(user_id: str, city: str, timestamp: str):
     logger.info('Start insert_search_history')
 
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
 
-            ensure_search_history_table_exists(cursor)
-
             insert_query = """
                 INSERT INTO search_history (user_id, city, search_date) VALUES (?, ?, ?)
             """
             cursor.execute(insert_query, (user_id, city, timestamp))
 
-            conn.commit()
-            logger.info(f'Successfully inserted search history for user {user_id} in city {city} at {timestamp}')
+            logger.info('Successfully inserted search history for user %s in city %s at %s', user_id, city, timestamp)
     except sqlite3.Error as e:
-        logger.error(f'Database error: {e}')
+        logger.error('Database error: %s', e)
     except Exception as e:
-        logger.error(f'Unexpected error: {e}')
+        logger.error('Unexpected error: %s', e)
 
 
+@timed('db.update_city_count')
 def update_city_count(city: str) -> None:
     """
     Обновляет счетчик вводов города в базе данных.
 
     Если город уже существует в таблице city_counts, увеличивает счетчик на 1.
-    Если города нет в таблице, добавляет его со счетчиком 1.
+    Если города нет в таблице, добавляет его со счетчиком 1. Города сравниваются
+    по нормализованному названию, обновление выполняется одним атомарным запросом.
 
     :param city: Название города.
     :return: None
@@ -144,28 +405,61 @@ def update_city_count(city: str) -> None:
     logger.info('Start update_city_count')
 
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
 
-            ensure_city_counts_table_exists(cursor)
+            cursor.execute(
+                """
+                INSERT INTO city_counts (city, city_key, count) VALUES (?, ?, 1)
+                ON CONFLICT(city_key) DO UPDATE SET count = count + 1
+                """,
+                (city, normalize_city_name(city))
+            )
+
+            logger.info('Successfully updated city count for %s', city)
+    except sqlite3.Error as e:
+        logger.error('Database error: %s', e)
+    except Exception as e:
+        logger.error('Unexpected error: %s', e)
 
-            cursor.execute("SELECT count FROM city_counts WHERE city = ?", (city,))
-            result = cursor.fetchone()
 
-            if result:
-                count = result[0] + 1
-                cursor.execute("UPDATE city_counts SET count = ? WHERE city = ?", (count, city))
-            else:
-                cursor.execute("INSERT INTO city_counts (city, count) VALUES (?, 1)", (city,))
+@timed('db.save_search_history_batch')
+def save_search_history_batch(events: list[tuple[str, str, str]]) -> bool:
+    """
+    Сохраняет пачку событий поиска одной транзакцией: добавляет записи в search_history
+    и обновляет счетчики городов в city_counts.
 
-            conn.commit()
-            logger.info(f'Successfully updated city count for {city}')
+    :param events: Список кортежей (идентификатор пользователя, город, временная метка).
+    :return: Bool: True, если пачка сохранена, False при ошибке.
+    """
+    logger.info('Start save_search_history_batch: %s events', len(events))
+
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.executemany(
+                "INSERT INTO search_history (user_id, city, search_date) VALUES (?, ?, ?)",
+                events
+            )
+            cursor.executemany(
+                """
+                INSERT INTO city_counts (city, city_key, count) VALUES (?, ?, 1)
+                ON CONFLICT(city_key) DO UPDATE SET count = count + 1
+                """,
+                [(city, normalize_city_name(city)) for _, city, _ in events]
+            )
+
+        return True
     except sqlite3.Error as e:
-        logger.error(f'Database error: {e}')
+        logger.error('Database error: %s', e)
     except Exception as e:
-        logger.error(f'Unexpected error: {e}')
+        logger.error('Unexpected error: %s', e)
 
+    return False
 
+
+@timed('db.get_last_searched_city')
 def get_last_searched_city(user_id: str) -> list[tuple[str]] | None:
     """
     Получить последний искомый город из истории поиска для данного пользователя.
@@ -181,11 +475,9 @@ def get_last_searched_city(user_id: str) -> list[tuple[str]] | None:
     """
     logger.info('Start get_last_searched_city')
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection() as conn:
             cursor: Cursor = conn.cursor()
 
-            ensure_search_history_table_exists(cursor)
-
             select_query = """
                 SELECT city FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT 1
             """
@@ -194,22 +486,144 @@ def get_last_searched_city(user_id: str) -> list[tuple[str]] | None:
             result: List[Tuple[str]] = cursor.fetchall()
 
             if result:
-                logger.info(f'get_last_searched_city: Last city: {result[0][0]}')
+                logger.info('get_last_searched_city: Last city: %s', result[0][0])
                 return result
             else:
                 logger.info('get_last_searched_city: No cities found')
                 return None
     except sqlite3.Error as e:
-        logger.error(f'Database error: {e}')
+        logger.error('Database error: %s', e)
         return None
     except Exception as e:
-        logger.error(f'Unexpected error: {e}')
+        logger.error('Unexpected error: %s', e)
         return None
 
 
+@timed('db.get_top_cities')
+def get_top_cities(limit: int) -> list[str]:
+    """
+    Получить самые популярные города по количеству запросов из таблицы city_counts.
+
+    :param limit: (int): Максимальное количество городов.
+    :return: List[str]: Названия городов в порядке убывания количества запросов
+        или пустой список, если городов нет или произошла ошибка.
+    """
+    logger.info('Start get_top_cities')
+    try:
+        with get_connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            select_query = """
+                SELECT city FROM city_counts ORDER BY count DESC, id LIMIT ?
+            """
+            cursor.execute(select_query, (limit,))
+
+            return [city for city, in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error('Database error: %s', e)
+        return []
+    except Exception as e:
+        logger.error('Unexpected error: %s', e)
+        return []
+
+
+@timed('db.create_geocode_cache_table')
+def create_geocode_cache_table() -> None:
+    """
+    Создает таблицу для кэша геокодирования в базе данных SQLite, если она еще не существует.
+
+    :return: None
+    """
+    try:
+        with get_connection() as conn:
+            cursor: Cursor = conn.cursor()
+            ensure_geocode_cache_table_exists(cursor)
+    except sqlite3.Error as e:
+        logger.error('Error creating table geocode_cache: %s', e)
+    except Exception as e:
+        logger.error('Unexpected error: %s', e)
+
+
+def ensure_geocode_cache_table_exists(cursor: sqlite3.Cursor) -> None:
+    """
+    Создает таблицу geocode_cache, если она не существует.
+
+    :return: None
+    """
+    create_table_query = """
+        CREATE TABLE IF NOT EXISTS geocode_cache
+        (city_key TEXT PRIMARY KEY,
+        latitude REAL,
+        longitude REAL,
+        found INTEGER,
+        expires_at REAL)
+    """
+    cursor.execute(create_table_query)
+
+
+@timed('db.get_geocode_cache_entry')
+def get_geocode_cache_entry(city_key: str) -> tuple[float | None, float | None, int, float] | None:
+    """
+    Получает запись кэша геокодирования для нормализованного названия города.
+
+    :param city_key: (str): Нормализованное название города.
+    :return: Кортеж (широта, долгота, найден ли город, время истечения записи)
+        или None, если записи нет или произошла ошибка.
+    """
+    try:
+        with get_connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            cursor.execute(
+                "SELECT latitude, longitude, found, expires_at FROM geocode_cache WHERE city_key = ?",
+                (city_key,)
+            )
+            return cursor.fetchone()
+    except sqlite3.Error as e:
+        logger.error('Database error: %s', e)
+        return None
+    except Exception as e:
+        logger.error('Unexpected error: %s', e)
+        return None
+
+
+@timed('db.save_geocode_cache_entry')
+def save_geocode_cache_entry(city_key: str, lat: float | None, long: float | None, expires_at: float) -> None:
+    """
+    Сохраняет результат геокодирования в кэш. Если координаты не заданы,
+    сохраняется отрицательный результат (город не найден).
+
+    :param city_key: (str): Нормализованное название города.
+    :param lat: Широта или None, если город не найден.
+    :param long: Долгота или None, если город не найден.
+    :param expires_at: Время истечения записи (unix time).
+    :return: None
+    """
+    try:
+        with get_connection() as conn:
+            cursor: Cursor = conn.cursor()
+
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO geocode_cache (city_key, latitude, longitude, found, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (city_key, lat, long, int(lat is not None), expires_at)
+            )
+    except sqlite3.Error as e:
+        logger.error('Database error: %s', e)
+    except Exception as e:
+        logger.error('Unexpected error: %s', e)
+
+
 def main_models():
-    create_city_counts_table()
-    create_city_counts_table()
+    """
+    Подготавливает базу данных при запуске приложения: создает пул соединений
+    и один раз проверяет схему.
+
+    :return: None
+    """
+    get_pool()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,108 @@
+import functools
+import logging.config
+import threading
+from typing import TYPE_CHECKING
+
+from config import (open_meteo_pool_size, open_meteo_connect_timeout, open_meteo_read_timeout,
+                    open_meteo_retries, open_meteo_backoff_factor, open_meteo_http_cache_path,
+                    open_meteo_http_cache_expire)
+from logging_config import dict_config
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('openmeteo_client')
+
+# openmeteo_requests, requests_cache и requests импортируются при создании клиента,
+# а не при загрузке модуля, чтобы не замедлять запуск приложения
+if TYPE_CHECKING:
+    import openmeteo_requests
+    import requests_cache
+
+_client: 'openmeteo_requests.Client | None' = None
+_client_lock = threading.Lock()
+
+
+@functools.cache
+def get_session_class() -> type['requests_cache.CachedSession']:
+    """
+    Возвращает класс TimeoutCachedSession - кэширующую сессию requests, которая подставляет
+    таймаут по умолчанию во все запросы. Класс создается при первом обращении.
+
+    :return: Type: Класс TimeoutCachedSession.
+    """
+    import requests_cache
+
+    class TimeoutCachedSession(requests_cache.CachedSession):
+
+        def __init__(self, *args, timeout: tuple[float, float], **kwargs):
+            super().__init__(*args, **kwargs)
+            self.timeout = timeout
+
+        def request(self, method, url, *args, **kwargs):
+            kwargs.setdefault('timeout', self.timeout)
+            return super().request(method, url, *args, **kwargs)
+
+    return TimeoutCachedSession
+
+
+def create_session(pool_size: int = open_meteo_pool_size,
+                   timeout: tuple[float, float] = (open_meteo_connect_timeout, open_meteo_read_timeout),
+                   retries: int = open_meteo_retries,
+                   backoff_factor: float = open_meteo_backoff_factor) -> 'requests_cache.CachedSession':
+    """
+    Создает сессию с пулом keep-alive соединений, HTTP-кэшем и политикой повторов.
+
+    :param pool_size: Максимальное количество соединений в пуле для одного хоста.
+    :param timeout: Таймауты (подключение, чтение) в секундах.
+    :param retries: Количество повторов при ошибках соединения и ответах 500/502/504.
+    :param backoff_factor: Множитель экспоненциальной задержки между повторами.
+    :return: TimeoutCachedSession: Настроенная сессия.
+    """
+    import requests_cache
+    from requests.adapters import HTTPAdapter
+    from urllib3 import Retry
+
+    backend = requests_cache.SQLiteCache(open_meteo_http_cache_path, wal=True)
+    session = get_session_class()(backend=backend, expire_after=open_meteo_http_cache_expire, timeout=timeout)
+
+    retry_policy = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(500, 502, 504))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry_policy)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def get_openmeteo_client() -> 'openmeteo_requests.Client':
+    """
+    Возвращает общий для процесса клиент Open-Meteo, создавая его при первом обращении.
+
+    Клиент использует одну сессию с пулом соединений и одним кэшем, поэтому его можно
+    вызывать одновременно из нескольких потоков.
+
+    :return: Openmeteo_requests.Client: Клиент Open-Meteo.
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import openmeteo_requests
+
+                logger.info('Create a shared Open-Meteo client')
+                _client = openmeteo_requests.Client(session=create_session())
+
+    return _client
+
+
+def reset_openmeteo_client() -> None:
+    """
+    Закрывает общий клиент Open-Meteo. Следующий вызов get_openmeteo_client создаст новый.
+
+    :return: None
+    """
+    global _client
+
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from markupsafe import Markup
+
+from config import page_cache_size
+from utils import normalize_city_name
+
+
+class ForecastFragment:
+    """
+    Отрисованный фрагмент страницы с прогнозом для одного города.
+
+    :ivar html: HTML-разметка фрагмента.
+    :ivar etag: Хэш разметки, используется для формирования ETag страницы.
+    :ivar last_modified: Время отрисовки фрагмента (UTC).
+    :ivar stale: Фрагмент отрисован по устаревшему прогнозу (Open-Meteo был недоступен).
+    """
+
+    __slots__ = ('html', 'etag', 'last_modified', 'stale')
+
+    def __init__(self, html: str, stale: bool = False):
+        self.html = Markup(html)
+        self.etag = hashlib.sha1(html.encode('utf-8')).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.stale = stale
+
+
+class ForecastPageCache:
+    """
+    LRU-кэш отрисованных фрагментов прогноза с ключом (нормализованное название города, текущий час).
+
+    Прогноз одного города одинаков для всех пользователей в течение часа, поэтому фрагмент
+    отрисовывается один раз, а с наступлением следующего часа ключ меняется и фрагмент
+    отрисовывается заново.
+    """
+
+    def __init__(self, max_entries: int = page_cache_size):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, int], ForecastFragment] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(city: str, now: float | None = None) -> tuple[str, int]:
+        """
+        Формирует ключ кэша.
+
+        :param city: Название города в произвольном написании.
+        :param now: Текущее время (unix time). По умолчанию используется time.time().
+        :return: Кортеж (нормализованное название города, номер часа).
+        """
+        if now is None:
+            now = time.time()
+
+        return normalize_city_name(city), int(now // 3600)
+
+    def get(self, city: str, now: float | None = None) -> ForecastFragment | None:
+        """
+        Возвращает фрагмент для города на текущий час.
+
+        :param city: Название города.
+        :param now: Текущее время (unix time).
+        :return: ForecastFragment или None, если фрагмента нет.
+        """
+        key = self.key(city, now)
+
+        with self._lock:
+            fragment = self._entries.get(key)
+
+            if fragment is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return fragment
+
+    def set(self, city: str, fragment: ForecastFragment, now: float | None = None) -> None:
+        """
+        Сохраняет фрагмент для города на текущий час.
+
+        :param city: Название города.
+        :param fragment: Отрисованный фрагмент.
+        :param now: Текущее время (unix time).
+        :return: None
+        """
+        key = self.key(city, now)
+
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков попаданий и промахов и текущее количество записей.
+
+        :return: Dict: Счетчики кэша.
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи из кэша.
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+forecast_page_cache = ForecastPageCache()
@@ -0,0 +1,193 @@
+import atexit
+import logging.config
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from config import (prefetch_enabled, prefetch_top_n, prefetch_interval, prefetch_jitter, prefetch_concurrency,
+                    prefetch_batch_size, prefetch_budget)
+from forecast_cache import forecast_cache
+from geocoding import geocode_city
+from get_weather import fetch_hourly_batch
+from logging_config import dict_config
+from models import get_top_cities
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('prefetch')
+
+
+class PrefetchScheduler:
+    """
+    Фоновый прогрев кэша прогнозов для самых популярных городов.
+
+    Раз в interval секунд (плюс случайная добавка до jitter секунд, чтобы запуски разных
+    процессов не совпадали) берет top_n городов из city_counts, геокодирует их и загружает
+    прогнозы для ячеек, запись которых отсутствует или устареет до следующего запуска.
+    Ячейки запрашиваются у Open-Meteo пачками по batch_size, не более concurrency запросов
+    одновременно и не более budget запросов за один запуск - остальные ячейки откладываются
+    до следующего запуска.
+    """
+
+    def __init__(self, top_n: int = prefetch_top_n, interval: float = prefetch_interval,
+                 jitter: float = prefetch_jitter, concurrency: int = prefetch_concurrency,
+                 batch_size: int = prefetch_batch_size, budget: int = prefetch_budget,
+                 get_cities: Callable[[int], list[str]] = get_top_cities,
+                 fetch_batch: Callable[[list[tuple[float, float]]], list[dict]] = fetch_hourly_batch):
+        self.top_n = top_n
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.budget = budget
+        self.get_cities = get_cities
+        self.fetch_batch = fetch_batch
+
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'runs': 0, 'cities': 0, 'fresh': 0, 'warmed': 0, 'deferred': 0, 'requests': 0,
+                       'geocode_errors': 0, 'request_errors': 0}
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _collect_stale_cells(self, cities: list[str], now: float) -> dict[tuple[float, float], list[float]]:
+        # Для каждой ячейки - моменты времени (текущий и следующего запуска), на которые записи нет
+        horizon = now + self.interval + self.jitter
+        stale: dict[tuple[float, float], list[float]] = {}
+
+        for city in cities:
+            try:
+                coordinates = geocode_city(city)
+            except Exception as e:
+                logger.error('Error geocoding %s: %s', city, e)
+                self._count('geocode_errors')
+                continue
+
+            if coordinates is None:
+                continue
+
+            cell = forecast_cache.cell(*coordinates)
+
+            if cell in stale:
+                continue
+
+            targets = [at for at in (now, horizon) if not forecast_cache.is_fresh(cell, at)]
+
+            if targets:
+                stale[cell] = targets
+            else:
+                self._count('fresh')
+
+        return stale
+
+    def _warm_batch(self, cells: list[tuple[float, float]], targets: dict[tuple[float, float], list[float]]) -> None:
+        self._count('requests')
+
+        try:
+            hourly_list = self.fetch_batch(cells)
+        except Exception as e:
+            logger.error('Error prefetching %s locations: %s', len(cells), e)
+            self._count('request_errors')
+            return
+
+        for cell, hourly in zip(cells, hourly_list):
+            for at in targets[cell]:
+                forecast_cache.put(cell, hourly, at)
+
+        self._count('warmed', len(cells))
+
+    def run_once(self, now: float | None = None) -> None:
+        """
+        Выполняет один запуск прогрева.
+
+        :param now: Текущее время (unix time). По умолчанию используется time.time().
+        :return: None
+        """
+        if now is None:
+            now = time.time()
+
+        cities = self.get_cities(self.top_n)
+        self._count('runs')
+        self._count('cities', len(cities))
+
+        stale = self._collect_stale_cells(cities, now)
+        cells = list(stale)
+        batches = [cells[i:i + self.batch_size] for i in range(0, len(cells), self.batch_size)]
+
+        if len(batches) > self.budget:
+            deferred = sum(len(batch) for batch in batches[self.budget:])
+            logger.info('Prefetch budget exceeded, %s locations deferred', deferred)
+            self._count('deferred', deferred)
+            batches = batches[:self.budget]
+
+        if not batches:
+            return
+
+        logger.info('Prefetching %s locations in %s requests', sum(len(batch) for batch in batches), len(batches))
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='prefetch') as executor:
+            list(executor.map(lambda batch: self._warm_batch(batch, stale), batches))
+
+    def _run(self) -> None:
+        delay = random.uniform(0, self.jitter)
+
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error('Prefetch run failed: %s', e)
+
+            delay = self.interval + random.uniform(0, self.jitter)
+
+    def start(self) -> None:
+        """
+        Запускает фоновый поток прогрева (в дочернем процессе после fork - заново).
+
+        :return: None
+        """
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='forecast-prefetch', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Останавливает фоновый поток прогрева.
+
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: None
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None or self._pid != os.getpid():
+                return
+
+            self._stop.set()
+            thread.join(timeout)
+            self._thread = None
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков прогрева.
+
+        :return: Dict: Количество запусков, городов, прогретых и отложенных ячеек, запросов и ошибок.
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+prefetch_scheduler = PrefetchScheduler() if prefetch_enabled else None
+
+if prefetch_scheduler is not None:
+    atexit.register(prefetch_scheduler.stop, 5)
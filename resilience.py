@@ -0,0 +1,217 @@
+import contextvars
+import logging.config
+import threading
+import time
+from typing import Any, Callable
+
+from config import (circuit_breaker_failures, circuit_breaker_reset_timeout, open_meteo_concurrency,
+                    nominatim_concurrency, upstream_queue_timeout)
+from logging_config import dict_config
+
+logging.config.dictConfig(dict_config)
+logger = logging.getLogger('resilience')
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Внешний API недоступен: ошибка запроса, разомкнутый предохранитель или превышение
+    количества одновременных запросов. В отличие от "город не найден" это временная ошибка.
+
+    :ivar upstream: Название внешнего API.
+    :ivar retry_after: Через сколько секунд имеет смысл повторить запрос (или None).
+    """
+
+    def __init__(self, upstream: str, reason: str = 'request failed', retry_after: float | None = None):
+        super().__init__(f'{upstream} unavailable: {reason}')
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failure_threshold ошибок подряд размыкается, и в течение reset_timeout
+    секунд запросы к внешнему API не выполняются. Затем пропускается один пробный запрос:
+    при успехе предохранитель замыкается, при ошибке снова размыкается.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = circuit_breaker_failures,
+                 reset_timeout: float = circuit_breaker_reset_timeout, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'failures': 0, 'opened': 0, 'rejected': 0}
+
+    def before_call(self) -> None:
+        """
+        Проверяет, можно ли выполнить запрос.
+
+        :return: None
+        :raises UpstreamUnavailable: Если предохранитель разомкнут или пробный запрос уже выполняется.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            remaining = self._opened_at + self.reset_timeout - self.clock()
+
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                logger.info('Circuit breaker %s is half-open, probing', self.name)
+                return
+
+            self._stats['rejected'] += 1
+
+        raise UpstreamUnavailable(self.name, 'circuit breaker is open', max(remaining, 1))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info('Circuit breaker %s is closed', self.name)
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._stats['failures'] += 1
+
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning('Circuit breaker %s is open after %s failures', self.name, self._failures)
+                    self._stats['opened'] += 1
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков и текущее состояние (0 - замкнут, 1 - пробный запрос, 2 - разомкнут).
+
+        :return: Dict: Количество ошибок, размыканий и отклоненных запросов.
+        """
+        with self._lock:
+            return dict(self._stats, state=(self.CLOSED, self.HALF_OPEN, self.OPEN).index(self.state))
+
+
+class Upstream:
+    """
+    Обертка вызовов внешнего API: предохранитель и ограничение одновременных запросов.
+
+    Не более max_concurrent запросов выполняются одновременно; остальные ждут свободного места
+    не дольше queue_timeout секунд и завершаются ошибкой, чтобы при медленном API потоки
+    обработки запросов не накапливались в ожидании. Любая ошибка запроса превращается
+    в UpstreamUnavailable и учитывается предохранителем.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, queue_timeout: float = upstream_queue_timeout,
+                 breaker: CircuitBreaker | None = None):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker if breaker is not None else CircuitBreaker(name)
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'errors': 0, 'queue_timeouts': 0, 'in_flight': 0}
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Выполняет запрос fn(*args, **kwargs) к внешнему API.
+
+        :param fn: Функция, выполняющая запрос.
+        :return: Результат fn.
+        :raises UpstreamUnavailable: Если предохранитель разомкнут, нет свободного места
+            за queue_timeout секунд или запрос завершился ошибкой.
+        """
+        self.breaker.before_call()
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('queue_timeouts')
+            # Пробный запрос не состоялся - предохранитель пропустит следующий
+            if self.breaker.state == CircuitBreaker.HALF_OPEN:
+                self.breaker.record_failure()
+            raise UpstreamUnavailable(self.name, 'too many concurrent requests', 1)
+
+        self._count('calls')
+        self._count('in_flight')
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._count('errors')
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(self.name, str(e) or type(e).__name__) from e
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+        self.breaker.record_success()
+
+        return result
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков вызовов и состояния предохранителя.
+
+        :return: Dict: Количество запросов, ошибок, отказов по очереди и выполняющихся запросов,
+            а также счетчики предохранителя с префиксом 'breaker_'.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+
+        stats.update((f'breaker_{name}', value) for name, value in self.breaker.get_stats().items())
+
+        return stats
+
+
+open_meteo_upstream = Upstream('open_meteo', open_meteo_concurrency)
+nominatim_upstream = Upstream('nominatim', nominatim_concurrency)
+
+# Возраст (сек) самого старого устаревшего прогноза, показанного в рамках текущего запроса
+# (список из одного элемента, чтобы его разделяли потоки, в которые копируется контекст запроса)
+_stale_age: contextvars.ContextVar[list[float | None] | None] = contextvars.ContextVar('stale_age', default=None)
+
+
+def start_stale_tracking() -> None:
+    """
+    Начинает отслеживание устаревших прогнозов для текущего контекста (например, HTTP-запроса).
+
+    :return: None
+    """
+    _stale_age.set([None])
+
+
+def mark_stale(age: float) -> None:
+    """
+    Отмечает, что в текущем контексте вместо свежего прогноза использован устаревший.
+
+    :param age: Возраст прогноза в секундах.
+    :return: None
+    """
+    holder = _stale_age.get()
+
+    if holder is not None:
+        holder[0] = age if holder[0] is None else max(holder[0], age)
+
+
+def get_stale_age() -> float | None:
+    """
+    Возвращает возраст самого старого устаревшего прогноза, использованного в текущем контексте.
+
+    :return: Float: Возраст в секундах или None, если устаревшие прогнозы не использовались.
+    """
+    holder = _stale_age.get()
+
+    return holder[0] if holder is not None else None
@@ -0,0 +1,78 @@
+import threading
+from typing import Any, Callable, Hashable
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов с одинаковым ключом.
+
+    Первый вызов с ключом выполняет функцию, а вызовы с тем же ключом, пришедшие
+    до его завершения, ждут и получают тот же результат (или то же исключение).
+    После завершения ключ освобождается, следующий вызов снова выполняет функцию -
+    кэширование результатов остается за вызывающим кодом.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {'executions': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """
+        Выполняет fn(*args) или дожидается уже выполняющегося вызова с тем же ключом.
+
+        :param key: Ключ вызова (например, нормализованное название города или ячейка координат).
+        :param fn: Функция, выполняющая запрос.
+        :param args: Аргументы функции.
+        :return: Результат fn.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+
+            if call is not None:
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает копию счетчиков и количество выполняющихся вызовов.
+
+        :return: Dict: Количество выполненных ('executions'), объединенных ('coalesced')
+            и завершившихся ошибкой ('errors') вызовов.
+        """
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import runpy
+import time
+import unittest
+from urllib.parse import urlencode
+from unittest.mock import patch
+
+import main
+
+ASGI_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'asgi.py')
+
+
+async def get(asgi_app, path: str, query_string: bytes = b'') -> int:
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query_string,
+             'root_path': '', 'headers': [], 'client': ('127.0.0.1', 1234), 'server': ('testserver', 80)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(scope, receive, send)
+
+    return messages[0]['status']
+
+
+class TestAsgi(unittest.TestCase):
+
+    def setUp(self):
+        with patch.dict(os.environ), patch('main.main_models'), patch('prefetch.prefetch_scheduler', None):
+            self.asgi_app = runpy.run_path(ASGI_PATH)['asgi_app']
+
+    def test_requests_are_processed_concurrently(self):
+        def slow_fragment(city):
+            time.sleep(0.3)
+            return None
+
+        async def run():
+            query_string = urlencode({'city': 'Москва'}).encode()
+            return await asyncio.gather(*(get(self.asgi_app, '/', query_string) for _ in range(4)))
+
+        with patch('main.get_forecast_fragment', side_effect=slow_fragment), \
+                patch('main.get_last_city_records', return_value=None):
+            started = time.perf_counter()
+            statuses = asyncio.run(run())
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(statuses, [200] * 4)
+        self.assertLess(elapsed, 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
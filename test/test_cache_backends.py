@@ -0,0 +1,158 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from cache_backends import (MemoryCacheBackend, SQLiteCacheBackend, UpstreamBudgetExceeded,
+                            consume_upstream_budget)
+from forecast_cache import ForecastCache, ForecastEntry
+from models import get_round_trip_count, start_round_trip_count
+from test_forecast_cache import CountingLoader, make_hourly
+
+
+class TestMemoryCacheBackend(unittest.TestCase):
+
+    def test_get_returns_value_until_expiry(self):
+        backend = MemoryCacheBackend(max_entries=10)
+        backend.set('key', b'value', expires_at=100)
+
+        self.assertEqual(backend.get('key', now=99), b'value')
+        self.assertIsNone(backend.get('key', now=100))
+        self.assertIsNone(backend.get('missing', now=0))
+
+    def test_evicts_least_recently_used(self):
+        backend = MemoryCacheBackend(max_entries=2)
+        backend.set('a', b'1', expires_at=100)
+        backend.set('b', b'2', expires_at=100)
+        backend.get('a', now=0)
+        backend.set('c', b'3', expires_at=100)
+
+        self.assertIsNone(backend.get('b', now=0))
+        self.assertEqual(backend.get('a', now=0), b'1')
+
+    def test_budget_resets_in_next_window(self):
+        backend = MemoryCacheBackend()
+
+        self.assertEqual([backend.acquire('api', 2, window=60, now=120 + i) for i in range(3)], [True, True, False])
+        self.assertTrue(backend.acquire('api', 2, window=60, now=180))
+
+
+class TestSQLiteCacheBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'shared_cache.db')
+        # Два объекта с одним файлом - как два рабочих процесса
+        self.first = SQLiteCacheBackend(self.path)
+        self.second = SQLiteCacheBackend(self.path)
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+        self.tmp_dir.cleanup()
+
+    def test_entries_are_shared(self):
+        self.first.set('key', b'\x00value', expires_at=time.time() + 60)
+
+        self.assertEqual(self.second.get('key'), b'\x00value')
+        self.assertIsNone(self.second.get('key', now=time.time() + 120))
+        self.assertEqual(self.second.get_stats()['hits'], 1)
+
+    def test_budget_is_shared_and_not_exceeded_concurrently(self):
+        now = time.time()
+        results = []
+
+        def worker(backend):
+            for _ in range(10):
+                results.append(backend.acquire('open_meteo', 15, now=now))
+
+        threads = [threading.Thread(target=worker, args=(backend,)) for backend in (self.first, self.second) * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 15)
+
+    def test_round_trips_are_counted(self):
+        start_round_trip_count()
+
+        self.first.set('key', b'value', expires_at=time.time() + 60)
+        self.second.get('key')
+        self.second.acquire('nominatim', 10)
+
+        self.assertEqual(get_round_trip_count(), 3)
+
+    def test_forecast_loaded_by_one_cache_is_used_by_another(self):
+        now = 1_700_000_000 // 3600 * 3600 + 60
+        loader = CountingLoader()
+        worker_a = ForecastCache(refresh_margin=0, backend=self.first)
+        worker_b = ForecastCache(refresh_margin=0, backend=self.second)
+
+        with patch('forecast_cache.time.time', return_value=now):
+            expected = worker_a.get(55.75, 37.62, loader, now=now)
+            hourly = worker_b.get(55.75, 37.62, loader, now=now)
+
+        self.assertEqual(len(loader.calls), 1)
+        self.assertEqual(worker_b.get_stats()['shared_hits'], 1)
+        np.testing.assert_array_equal(hourly['temperature_2m'], expected['temperature_2m'])
+        self.assertTrue(worker_b.is_fresh(worker_b.cell(55.75, 37.62), now))
+
+    def test_only_the_loading_worker_writes_to_shared_store(self):
+        now = 1_700_000_000 // 3600 * 3600 + 60
+        loader = CountingLoader()
+        worker_a = ForecastCache(refresh_margin=0, backend=self.first)
+        worker_b = ForecastCache(refresh_margin=0, backend=self.second)
+        worker_c = ForecastCache(refresh_margin=0, backend=self.second)
+
+        with patch('forecast_cache.time.time', return_value=now):
+            worker_a.get(55.75, 37.62, loader, now=now)
+            worker_b.get(55.75, 37.62, loader, now=now)
+            # Промах в lookup до того, как запись появилась в хранилище: загрузка находит ее там
+            with patch.object(worker_c, 'lookup', return_value=None):
+                worker_c.get(55.75, 37.62, loader, now=now)
+
+        self.assertEqual(len(loader.calls), 1)
+        self.assertEqual(self.first.get_stats()['sets'], 1)
+        self.assertEqual(self.second.get_stats()['sets'], 0)
+        self.assertEqual(worker_c.get_stats()['shared_hits'], 1)
+
+
+class TestForecastEntry(unittest.TestCase):
+
+    def test_bytes_round_trip(self):
+        entry = ForecastEntry(make_hourly(1_700_000_000 // 3600 * 3600), fetched_at=10.5, expires_at=3600.0)
+
+        restored = ForecastEntry.from_bytes(entry.to_bytes())
+
+        self.assertEqual(restored.names, entry.names)
+        self.assertEqual((restored.fetched_at, restored.expires_at), (10.5, 3600.0))
+        np.testing.assert_array_equal(restored.times, entry.times)
+        np.testing.assert_array_equal(restored.values, entry.values)
+        self.assertFalse(restored.values.flags.writeable)
+
+
+class TestUpstreamBudget(unittest.TestCase):
+
+    def test_raises_when_budget_exhausted(self):
+        with patch('cache_backends._budget_backend', MemoryCacheBackend()), \
+                patch.dict('cache_backends.UPSTREAM_BUDGETS', {'nominatim': 1}):
+            consume_upstream_budget('nominatim', now=0)
+
+            with self.assertRaises(UpstreamBudgetExceeded):
+                consume_upstream_budget('nominatim', now=1)
+
+            consume_upstream_budget('nominatim', now=60)
+
+    def test_zero_budget_is_unlimited(self):
+        with patch.dict('cache_backends.UPSTREAM_BUDGETS', {'open_meteo': 0}):
+            for _ in range(100):
+                consume_upstream_budget('open_meteo')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from cache_backends import MemoryCacheBackend
+from forecast_cache import ForecastCache
+
+
+def make_hourly(start: int, hours: int = 48) -> dict:
+    return {
+        "time": np.arange(start, start + hours * 3600, 3600, dtype=np.int64),
+        "temperature_2m": np.linspace(-5, 5, hours, dtype=np.float32),
+        "weather_code": np.zeros(hours, dtype=np.float32),
+    }
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = []
+        self.called = threading.Event()
+
+    def __call__(self, lat, long):
+        self.calls.append((lat, long))
+        self.called.set()
+        return make_hourly(int(time.time()) // 3600 * 3600)
+
+
+class TestForecastCache(unittest.TestCase):
+
+    def test_nearby_coordinates_share_one_entry(self):
+        cache = ForecastCache(max_entries=10, ttl=3600, grid_step=0.1, refresh_margin=0)
+        loader = CountingLoader()
+        now = 1_700_000_000 // 3600 * 3600 + 60
+
+        first = cache.get(55.761, 37.617, loader, now=now)
+        second = cache.get(55.779, 37.583, loader, now=now)
+
+        self.assertEqual(loader.calls, [(55.8, 37.6)])
+        np.testing.assert_array_equal(first["temperature_2m"], second["temperature_2m"])
+        self.assertEqual(cache.get_stats()['hits'], 1)
+        self.assertEqual(cache.get_stats()['misses'], 1)
+
+    def test_entries_are_read_only(self):
+        cache = ForecastCache(refresh_margin=0)
+        hourly = cache.get(55.75, 37.62, CountingLoader())
+
+        with self.assertRaises(ValueError):
+            hourly["temperature_2m"][0] = 100
+
+    def test_lru_eviction(self):
+        cache = ForecastCache(max_entries=2, ttl=3600, grid_step=1, refresh_margin=0)
+        loader = CountingLoader()
+        now = 1_700_000_000 // 3600 * 3600
+
+        cache.get(1, 1, loader, now=now)
+        cache.get(2, 2, loader, now=now)
+        cache.get(1, 1, loader, now=now)
+        cache.get(3, 3, loader, now=now)
+        cache.get(1, 1, loader, now=now)
+        cache.get(2, 2, loader, now=now)
+
+        self.assertEqual(loader.calls, [(1, 1), (2, 2), (3, 3), (2, 2)])
+        self.assertEqual(cache.get_stats()['evictions'], 2)
+
+    def test_ttl_and_hour_change_expire_entries(self):
+        cache = ForecastCache(ttl=10, grid_step=1, refresh_margin=0)
+        loader = CountingLoader()
+        now = time.time()
+
+        cache.get(1, 1, loader, now=now)
+        cache.get(1, 1, loader, now=now + 20)
+        cache.get(1, 1, loader, now=now + 3600)
+
+        self.assertEqual(len(loader.calls), 3)
+
+    def test_background_refresh_near_expiry(self):
+        cache = ForecastCache(ttl=60, grid_step=1, refresh_margin=55)
+        loader = CountingLoader()
+        now = time.time()
+
+        cache.get(1, 1, loader, now=now)
+        loader.called.clear()
+
+        # Запись устареет через 60 секунд - до границы обновления осталось меньше refresh_margin
+        cache.get(1, 1, loader, now=now + 10)
+
+        self.assertTrue(loader.called.wait(2))
+        deadline = time.time() + 2
+        while cache.get_stats()['refreshes'] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(cache.get_stats()['refreshes'], 1)
+        self.assertEqual(len(loader.calls), 2)
+
+    def test_concurrent_misses_load_and_store_once(self):
+        backend = MemoryCacheBackend()
+        cache = ForecastCache(grid_step=1, refresh_margin=0, backend=backend)
+        loader = CountingLoader()
+        count = 8
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def slow_loader(lat, long):
+            time.sleep(0.2)
+            return loader(lat, long)
+
+        def worker(index):
+            barrier.wait()
+            results[index] = cache.get(1, 1, slow_loader)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(loader.calls), 1)
+        self.assertEqual(backend.get_stats()['sets'], 1)
+        for hourly in results:
+            np.testing.assert_array_equal(hourly['temperature_2m'], results[0]['temperature_2m'])
+
+
+if __name__ == '__main__':
+    unittest.main()
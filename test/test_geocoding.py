@@ -0,0 +1,171 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from unittest.mock import patch, MagicMock
+
+import geocoding
+from cache_backends import MemoryCacheBackend
+from gazetteer import get_city_name, lookup_city
+from geocoding import geocode_city, get_geocode_cache_stats
+from models import save_geocode_cache_entry, close_pool
+from utils import normalize_city_name
+
+CITIES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'js', 'cities.txt')
+
+# Города из cities.txt, которых нет в GeoNames cities500 (геокодируются через Nominatim)
+GAZETTEER_GAPS = {'иннополис', 'теберда', 'тельмана'}
+
+
+class TestNormalizeCityName(unittest.TestCase):
+
+    def test_normalize_case_whitespace_and_yo(self):
+        self.assertEqual(normalize_city_name('  Орёл '), 'орел')
+        self.assertEqual(normalize_city_name('Нижний   Новгород'), 'нижний новгород')
+        self.assertEqual(normalize_city_name('МОСКВА'), normalize_city_name('москва'))
+        self.assertEqual(normalize_city_name(None), '')
+
+
+class TestGazetteer(unittest.TestCase):
+
+    def test_known_city_and_aliases(self):
+        moscow = lookup_city('Москва')
+        self.assertIsNotNone(moscow)
+        self.assertAlmostEqual(moscow[0], 55.75, places=1)
+        self.assertAlmostEqual(moscow[1], 37.62, places=1)
+
+        self.assertEqual(lookup_city('  МОСКВА '), moscow)
+        self.assertEqual(lookup_city('Moscow'), moscow)
+        self.assertEqual(lookup_city('Saint Petersburg'), lookup_city('Санкт-Петербург'))
+        self.assertEqual(lookup_city('Орел'), lookup_city('Орёл'))
+
+    def test_unknown_city(self):
+        self.assertIsNone(lookup_city('Несуществующийгород'))
+
+    def test_primary_name(self):
+        self.assertEqual(get_city_name(' ОРЕЛ '), 'Орёл')
+        self.assertEqual(get_city_name('Ялтане'), 'Ялта')
+        self.assertIsNone(get_city_name('Несуществующийгород'))
+
+    def test_covers_autocomplete_list(self):
+        with open(CITIES_PATH, encoding='utf-8') as file:
+            counts = Counter(normalize_city_name(line) for line in file if line.strip())
+
+        missing = {name for name, count in counts.items() if count == 1 and lookup_city(name) is None}
+        # Одно название у нескольких городов - выбор оставлен геокодеру
+        ambiguous = {name for name, count in counts.items() if count > 1 and lookup_city(name) is not None}
+
+        self.assertEqual(missing, GAZETTEER_GAPS)
+        self.assertEqual(ambiguous, set())
+        self.assertAlmostEqual(lookup_city('Ялтане')[0], 44.5, places=1)
+
+    def test_nicknames_and_historical_names_are_not_aliases(self):
+        for name in ('рыбная столица', 'столица Арктики', 'Романов', 'Семёновский'):
+            self.assertIsNone(lookup_city(name), name)
+
+    def test_geocode_city_skips_network_for_known_city(self):
+        with patch('geocoding.get_geolocator') as mock_geolocator:
+            self.assertEqual(geocode_city('Казань'), lookup_city('Казань'))
+            mock_geolocator.assert_not_called()
+
+
+class TestGeocodeCache(unittest.TestCase):
+
+    def setUp(self):
+        # Каждый тест работает со своей временной базой данных
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.db_patch = patch('models.db_path', self.db_path)
+        self.db_patch.start()
+
+        self.geolocator = MagicMock()
+        self.geolocator_patch = patch('geocoding.get_geolocator', return_value=self.geolocator)
+        self.geolocator_patch.start()
+
+        # Офлайн-справочник отключаем, чтобы проверять именно кэш
+        self.gazetteer_patch = patch('geocoding.lookup_city', return_value=None)
+        self.gazetteer_patch.start()
+
+    def tearDown(self):
+        self.gazetteer_patch.stop()
+        self.geolocator_patch.stop()
+        self.db_patch.stop()
+        close_pool()
+        os.remove(self.db_path)
+
+    def test_second_lookup_is_served_from_cache(self):
+        self.geolocator.geocode.return_value = MagicMock(latitude=55.75, longitude=37.62)
+        stats_before = get_geocode_cache_stats()
+
+        self.assertEqual(geocode_city('Москва'), (55.75, 37.62))
+        self.assertEqual(geocode_city('  москва '), (55.75, 37.62))
+
+        self.geolocator.geocode.assert_called_once_with('Москва')
+        stats = get_geocode_cache_stats()
+        self.assertEqual(stats['misses'] - stats_before['misses'], 1)
+        self.assertEqual(stats['hits'] - stats_before['hits'], 1)
+
+    def test_shared_cache_is_used_by_other_workers(self):
+        # Второй рабочий процесс с пустой базой находит координаты в общем хранилище
+        self.geolocator.geocode.return_value = MagicMock(latitude=55.75, longitude=37.62)
+        shared = MemoryCacheBackend()
+
+        with patch('geocoding.shared_cache', shared):
+            self.assertEqual(geocode_city('Москва'), (55.75, 37.62))
+
+            with patch('geocoding.get_geocode_cache_entry') as get_entry:
+                self.assertEqual(geocode_city('Москва'), (55.75, 37.62))
+                get_entry.assert_not_called()
+
+        self.geolocator.geocode.assert_called_once()
+
+    def test_negative_result_is_cached(self):
+        self.geolocator.geocode.return_value = None
+
+        self.assertIsNone(geocode_city('Несуществующийгород'))
+        self.assertIsNone(geocode_city('несуществующийгород'))
+
+        self.geolocator.geocode.assert_called_once()
+
+    def test_expired_entry_is_refreshed(self):
+        save_geocode_cache_entry('орел', 1.0, 2.0, time.time() - 1)
+        self.geolocator.geocode.return_value = MagicMock(latitude=52.97, longitude=36.06)
+
+        self.assertEqual(geocode_city('Орёл'), (52.97, 36.06))
+        self.geolocator.geocode.assert_called_once()
+
+    def test_network_errors_are_not_cached(self):
+        self.geolocator.geocode.side_effect = [Exception('timeout'),
+                                               MagicMock(latitude=59.94, longitude=30.31)]
+
+        with self.assertRaises(Exception):
+            geocode_city('Санкт-Петербург')
+
+        self.assertEqual(geocoding.geocode_city('Санкт-Петербург'), (59.94, 30.31))
+
+    def test_concurrent_misses_share_one_request(self):
+        def slow_geocode(city):
+            time.sleep(0.2)
+            return MagicMock(latitude=56.84, longitude=60.61)
+
+        self.geolocator.geocode.side_effect = slow_geocode
+        results = []
+        spellings = ['Екатеринбург', 'екатеринбург', ' ЕКАТЕРИНБУРГ']
+
+        with patch('geocoding.geocode_flight', geocoding.SingleFlight()) as flight:
+            threads = [threading.Thread(target=lambda i=i: results.append(geocode_city(spellings[i % 3])))
+                       for i in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(results, [(56.84, 60.61)] * 6)
+        self.geolocator.geocode.assert_called_once()
+        self.assertEqual(flight.get_stats()['coalesced'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,333 @@
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+from forecast_cache import ForecastCache
+from resilience import Upstream, UpstreamUnavailable
+from get_weather import (build_weather_data, build_forecast_columns, build_daily_summary, decode_hourly,
+                         get_weather_code, get_is_day, get_weather_data_batch, get_weather_icons, HOURLY_VARIABLES,
+                         WEATHER_CODE_ICONS, DEFAULT_WEATHER_ICON, NIGHT_CLEAR_ICON, FORECAST_FETCH_DAYS,
+                         FORECAST_MAX_DAYS, FORECAST_MAX_HOURS, FORECAST_UTC_OFFSET, _icon_table)
+
+
+class FakeVariable:
+    def __init__(self, values):
+        self.values = values
+
+    def ValuesAsNumpy(self):
+        return self.values
+
+
+class FakeHourly:
+    def __init__(self, start, hours, variables):
+        self.start = start
+        self.hours = hours
+        self.variables = variables
+
+    def Time(self):
+        return self.start
+
+    def TimeEnd(self):
+        return self.start + self.hours * 3600
+
+    def Interval(self):
+        return 3600
+
+    def Variables(self, index):
+        return FakeVariable(self.variables[index])
+
+
+class FakeResponse:
+    def __init__(self, hourly):
+        self.hourly = hourly
+
+    def Hourly(self):
+        return self.hourly
+
+
+def make_hourly(start: int, hours: int = 168, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    codes = np.array([0, 1, 2, 3, 45, 48, 51, 61, 71, 80, 85, 86, 95, 99, 4, 100], dtype=np.float32)
+
+    return {
+        "time": np.arange(start, start + hours * 3600, 3600, dtype=np.int64),
+        "temperature_2m": rng.uniform(-30, 30, hours).astype(np.float32),
+        "relative_humidity_2m": rng.uniform(0, 100, hours).astype(np.float32),
+        "wind_speed_10m": rng.uniform(0, 20, hours).astype(np.float32),
+        "precipitation_probability": rng.uniform(0, 100, hours).astype(np.float32),
+        "is_day": rng.integers(0, 2, hours).astype(np.float32),
+        "weather_code": rng.choice(codes, hours),
+    }
+
+
+def reference_weather_data(hourly: dict, now: float) -> dict:
+    # Построчная сборка словаря так же, как это делал цикл по DataFrame.iterrows()
+    weather_data = {}
+
+    for index, timestamp in enumerate(hourly["time"]):
+        if not now <= timestamp <= now + 24 * 3600:
+            continue
+
+        time_str = datetime.fromtimestamp(int(timestamp), tz=timezone.utc).strftime('%H')
+        is_day = int(hourly["is_day"][index])
+
+        weather_data.update({time_str: {
+            "Temperature": f"{int(hourly['temperature_2m'][index])}°",
+            "Relative Humidity": f"{int(hourly['relative_humidity_2m'][index])}%",
+            "Wind Speed": f"{int(hourly['wind_speed_10m'][index])} m/s",
+            "Precipitation Probability": f"{int(hourly['precipitation_probability'][index])}%",
+            "Is Day": get_is_day(is_day),
+            'weather_code': get_weather_code(int(hourly["weather_code"][index]), is_day)
+        }})
+
+    return weather_data
+
+
+class TestWeatherIcons(unittest.TestCase):
+
+    @staticmethod
+    def expected_icon(code: int, is_day: int) -> str:
+        # Поведение прежней get_weather_code: ясная погода (0-3) ночью - луна, неизвестный код - солнце
+        if code < 4 and code in WEATHER_CODE_ICONS and is_day == 0:
+            return NIGHT_CLEAR_ICON
+        return WEATHER_CODE_ICONS.get(code, DEFAULT_WEATHER_ICON)
+
+    def test_scalar_lookup_covers_all_codes(self):
+        for code in range(-5, 105):
+            for is_day in (0, 1):
+                self.assertEqual(get_weather_code(code, is_day), self.expected_icon(code, is_day), (code, is_day))
+
+    def test_vectorized_lookup_matches_scalar(self):
+        codes = np.repeat(np.arange(-5, 105), 2)
+        is_day = np.tile([0, 1], len(codes) // 2)
+
+        icons = get_weather_icons(codes, is_day)
+
+        self.assertEqual(icons.tolist(), [get_weather_code(int(c), int(d)) for c, d in zip(codes, is_day)])
+
+    def test_table_is_read_only(self):
+        with self.assertRaises(ValueError):
+            _icon_table[0, 0] = DEFAULT_WEATHER_ICON
+
+        self.assertEqual(get_weather_code(0, 0), NIGHT_CLEAR_ICON)
+        self.assertEqual(get_weather_code(0, 1), DEFAULT_WEATHER_ICON)
+
+
+class TestBuildWeatherData(unittest.TestCase):
+
+    def test_matches_row_by_row_reference(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+
+        for seed, offset in enumerate([0, 1, 1800, 3599, 3600, 50_000]):
+            hourly = make_hourly(start, seed=seed)
+            now = start + offset
+
+            result = build_weather_data(hourly, now=now)
+            expected = reference_weather_data(hourly, now)
+
+            self.assertEqual(result, expected)
+            self.assertEqual(list(result), list(expected))
+
+    def test_exact_hour_keeps_first_position_for_repeated_key(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+        hourly = make_hourly(start)
+
+        result = build_weather_data(hourly, now=start)
+
+        self.assertEqual(len(result), 24)
+        self.assertEqual(result, reference_weather_data(hourly, start))
+
+    def test_nan_values_raise_value_error(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+        hourly = make_hourly(start)
+        hourly["precipitation_probability"][:] = np.nan
+
+        with self.assertRaises(ValueError):
+            build_weather_data(hourly, now=start)
+
+    def test_decode_hourly(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+        hourly = make_hourly(start, hours=48)
+        response = FakeResponse(FakeHourly(start, 48, [hourly[name] for name in HOURLY_VARIABLES]))
+
+        decoded = decode_hourly(response)
+
+        np.testing.assert_array_equal(decoded["time"], hourly["time"])
+        for name in HOURLY_VARIABLES:
+            np.testing.assert_array_equal(decoded[name], hourly[name])
+
+
+class TestBuildForecastColumns(unittest.TestCase):
+
+    def test_columns_match_weather_data(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+        hourly = make_hourly(start)
+        now = start + 1800
+
+        columns = build_forecast_columns(hourly, now=now)
+        weather_data = build_weather_data(hourly, now=now)
+
+        self.assertEqual(columns['count'], len(weather_data))
+        self.assertEqual(columns['start'], start + 3600)
+        self.assertEqual(columns['interval'], 3600)
+        self.assertEqual(list(columns['fields']), HOURLY_VARIABLES)
+        self.assertEqual([f'{value}°' for value in columns['fields']['temperature_2m']],
+                         [hour['Temperature'] for hour in weather_data.values()])
+        self.assertEqual([f'{value} m/s' for value in columns['fields']['wind_speed_10m']],
+                         [hour['Wind Speed'] for hour in weather_data.values()])
+
+    def test_field_selection(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+        hourly = make_hourly(start)
+
+        columns = build_forecast_columns(hourly, ['weather_code', 'temperature_2m'], now=start)
+
+        self.assertEqual(list(columns['fields']), ['weather_code', 'temperature_2m'])
+        self.assertTrue(all(isinstance(value, int) for value in columns['fields']['weather_code']))
+
+    def test_multi_day_horizon(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+        hourly = make_hourly(start)
+
+        columns = build_forecast_columns(hourly, ['temperature_2m'], now=start, hours=72)
+
+        self.assertEqual(columns['count'], 72)
+        self.assertEqual(columns['fields']['temperature_2m'], hourly['temperature_2m'][:72].astype(int).tolist())
+
+    def test_full_horizon_is_available_late_in_the_day(self):
+        # Ряд Open-Meteo начинается в 00:00 текущих суток по времени запроса
+        midnight = 1_700_000_000 - 1_700_000_000 % 86400 - FORECAST_UTC_OFFSET
+        hourly = make_hourly(midnight, hours=FORECAST_FETCH_DAYS * 24)
+        now = midnight + 23 * 3600 + 1800
+
+        columns = build_forecast_columns(hourly, ['temperature_2m'], now=now, hours=FORECAST_MAX_HOURS)
+        summary = build_daily_summary(hourly, FORECAST_MAX_DAYS, now=now)
+
+        self.assertEqual(columns['count'], FORECAST_MAX_HOURS)
+        self.assertEqual(columns['start'], midnight + 24 * 3600)
+        self.assertEqual(summary['count'], FORECAST_MAX_DAYS)
+
+
+def reference_daily_summary(hourly: dict, days: int, now: float) -> dict:
+    # Построчная группировка по суткам в часовом поясе FORECAST_UTC_OFFSET
+    first_day = datetime.fromtimestamp(now + FORECAST_UTC_OFFSET, timezone.utc).date()
+    groups = {}
+
+    for index, timestamp in enumerate(hourly["time"].tolist()):
+        day = datetime.fromtimestamp(timestamp + FORECAST_UTC_OFFSET, timezone.utc).date()
+        if 0 <= (day - first_day).days < days:
+            groups.setdefault(day.isoformat(), []).append(index)
+
+    fields = {"temperature_2m_min": [], "temperature_2m_max": [], "precipitation_probability_max": [],
+              "weather_code": []}
+
+    for indexes in groups.values():
+        temperature = [float(hourly["temperature_2m"][i]) for i in indexes]
+        codes = [min(max(int(hourly["weather_code"][i]), 0), 99) for i in indexes]
+        fields["temperature_2m_min"].append(int(min(temperature)))
+        fields["temperature_2m_max"].append(int(max(temperature)))
+        fields["precipitation_probability_max"].append(
+            int(max(float(hourly["precipitation_probability"][i]) for i in indexes)))
+        fields["weather_code"].append(max(set(codes), key=lambda code: (codes.count(code), code)))
+
+    return {"dates": list(groups), "count": len(groups), "fields": fields}
+
+
+class TestBuildDailySummary(unittest.TestCase):
+
+    def test_matches_reference(self):
+        start = 1_700_000_000 - 1_700_000_000 % 86400 - FORECAST_UTC_OFFSET
+
+        for seed, (offset, days) in enumerate([(0, 7), (1800, 1), (20 * 3600, 3), (3 * 86400, 7)]):
+            hourly = make_hourly(start, seed=seed)
+            now = start + offset
+
+            self.assertEqual(build_daily_summary(hourly, days, now=now),
+                             reference_daily_summary(hourly, days, now))
+
+    def test_days_are_local_calendar_days(self):
+        start = 1_700_000_000 - 1_700_000_000 % 86400 - FORECAST_UTC_OFFSET
+        hourly = make_hourly(start, hours=48)
+
+        summary = build_daily_summary(hourly, 3, now=start)
+
+        self.assertEqual(summary['dates'], ['2023-11-14', '2023-11-15'])
+        self.assertEqual(summary['fields']['temperature_2m_max'][0], int(hourly['temperature_2m'][:24].max()))
+
+    def test_dominant_weather_code_prefers_more_significant_on_tie(self):
+        start = 1_700_000_000 - 1_700_000_000 % 86400 - FORECAST_UTC_OFFSET
+        hourly = make_hourly(start, hours=24)
+        hourly["weather_code"][:] = 3
+        hourly["weather_code"][:12] = 61
+
+        summary = build_daily_summary(hourly, 1, now=start)
+
+        self.assertEqual(summary['fields']['weather_code'], [61])
+
+    def test_no_data_for_requested_days(self):
+        start = 1_700_000_000 - 1_700_000_000 % 3600
+
+        summary = build_daily_summary(make_hourly(start, hours=24), 2, now=start + 10 * 86400)
+
+        self.assertEqual(summary['count'], 0)
+        self.assertEqual(summary['fields']['weather_code'], [])
+
+
+class TestWeatherBatch(unittest.TestCase):
+
+    def setUp(self):
+        start = int(time.time()) // 3600 * 3600 - 3600
+        self.hourly = make_hourly(start)
+        self.client = MagicMock()
+        self.client.weather_api.side_effect = lambda url, params: [
+            FakeResponse(FakeHourly(start, 168, [self.hourly[name] for name in HOURLY_VARIABLES]))
+            for _ in params["latitude"]
+        ]
+
+        self.patches = [
+            patch('get_weather.get_openmeteo_client', return_value=self.client),
+            patch('get_weather.forecast_cache', ForecastCache(refresh_margin=0)),
+            patch('get_weather.open_meteo_upstream', Upstream('open_meteo', 1)),
+            patch('get_weather.geocode_city', side_effect=lambda city: {
+                'Москва': (55.75, 37.62), 'Казань': (55.79, 49.12), 'Химки': (55.89, 37.44)}.get(city)),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in self.patches:
+            item.stop()
+
+    def test_one_upstream_request_for_all_cities(self):
+        result = get_weather_data_batch(['Москва', 'Казань', 'Несуществующийгород', 'Химки'])
+
+        self.client.weather_api.assert_called_once()
+        params = self.client.weather_api.call_args.kwargs['params']
+        self.assertEqual(len(params['latitude']), 3)
+
+        expected = build_weather_data(self.hourly)
+        self.assertEqual(list(result), ['Москва', 'Казань', 'Несуществующийгород', 'Химки'])
+        self.assertEqual(result['Москва'], expected)
+        self.assertEqual(result['Казань'], expected)
+        self.assertIsNone(result['Несуществующийгород'])
+
+    def test_cached_cities_are_not_requested_again(self):
+        get_weather_data_batch(['Москва'])
+        get_weather_data_batch(['Москва', 'Казань'])
+
+        self.assertEqual(self.client.weather_api.call_count, 2)
+        params = self.client.weather_api.call_args.kwargs['params']
+        self.assertEqual(params['latitude'], [55.8])
+
+    def test_upstream_error_is_not_reported_as_unknown_cities(self):
+        self.client.weather_api.side_effect = Exception('upstream error')
+
+        with self.assertRaises(UpstreamUnavailable):
+            get_weather_data_batch(['Москва', 'Казань'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import runpy
+import unittest
+from unittest.mock import MagicMock, patch
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+class TestGunicornConf(unittest.TestCase):
+
+    def setUp(self):
+        with patch.dict(os.environ):
+            self.conf = runpy.run_path(CONF_PATH)
+
+    def test_settings(self):
+        self.assertEqual(self.conf['worker_class'], 'gthread')
+        self.assertGreaterEqual(self.conf['workers'], 1)
+        self.assertGreaterEqual(self.conf['graceful_timeout'], 1)
+
+    def test_workers_share_cache_and_log_to_stderr_by_default(self):
+        with patch.dict(os.environ, clear=True):
+            runpy.run_path(CONF_PATH)
+
+            self.assertEqual(os.environ['CACHE_BACKEND'], 'sqlite')
+            self.assertEqual(os.environ['LOG_FILE'], '-')
+
+    def test_on_starting_prepares_schema_and_closes_pool(self):
+        with patch('models.main_models') as main_models, patch('models.close_pool') as close_pool:
+            self.conf['on_starting'](MagicMock())
+
+        main_models.assert_called_once_with()
+        close_pool.assert_called_once_with()
+
+    def test_post_fork_resets_inherited_clients(self):
+        with patch('models.close_pool') as close_pool, \
+                patch('openmeteo_client.reset_openmeteo_client') as reset_client, \
+                patch('geocoding.reset_geolocator') as reset_geolocator:
+            self.conf['post_fork'](MagicMock(), MagicMock())
+
+        close_pool.assert_called_once_with()
+        reset_client.assert_called_once_with()
+        reset_geolocator.assert_called_once_with()
+
+    def test_worker_exit_flushes_history_and_logs(self):
+        writer = MagicMock()
+
+        with patch('history_writer.search_history_writer', writer), \
+                patch('prefetch.prefetch_scheduler', None), \
+                patch('models.close_pool') as close_pool, \
+                patch('logging_config.stop_log_listener') as stop_log_listener:
+            self.conf['worker_exit'](MagicMock(), MagicMock())
+
+        writer.stop.assert_called_once_with(10)
+        close_pool.assert_called_once_with()
+        stop_log_listener.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
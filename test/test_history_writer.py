@@ -0,0 +1,126 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from history_writer import SearchHistoryWriter
+from models import close_pool, get_connection, save_search_history_batch
+
+
+class RecordingWriter:
+    def __init__(self, block: threading.Event | None = None):
+        self.batches = []
+        self.block = block
+
+    def __call__(self, batch):
+        if self.block is not None:
+            self.block.wait(5)
+        self.batches.append(list(batch))
+        return True
+
+
+class TestSearchHistoryWriter(unittest.TestCase):
+
+    def test_batch_is_written_when_full(self):
+        recorder = RecordingWriter()
+        writer = SearchHistoryWriter(recorder, max_queue=100, batch_size=3, flush_interval=60)
+
+        for i in range(3):
+            writer.submit(f'user{i}', 'Москва', '2024')
+
+        deadline = time.time() + 2
+        while not recorder.batches and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(len(recorder.batches), 1)
+        self.assertEqual(len(recorder.batches[0]), 3)
+        writer.stop(2)
+
+    def test_batch_is_written_after_interval(self):
+        recorder = RecordingWriter()
+        writer = SearchHistoryWriter(recorder, max_queue=100, batch_size=100, flush_interval=0.05)
+
+        writer.submit('user', 'Казань', '2024')
+        time.sleep(0.3)
+
+        self.assertEqual(recorder.batches, [[('user', 'Казань', '2024')]])
+        writer.stop(2)
+
+    def test_flush_and_stop_write_pending_events(self):
+        recorder = RecordingWriter()
+        writer = SearchHistoryWriter(recorder, max_queue=100, batch_size=100, flush_interval=60)
+
+        writer.submit('user1', 'Москва', '2024')
+        self.assertTrue(writer.flush(2))
+        writer.submit('user2', 'Казань', '2024')
+        writer.stop(2)
+
+        self.assertEqual(recorder.batches, [[('user1', 'Москва', '2024')], [('user2', 'Казань', '2024')]])
+        self.assertEqual(writer.get_stats()['written'], 2)
+
+    def fill_queue(self, policy):
+        # Фоновый поток занят первой пачкой, второе событие занимает единственное место в очереди
+        block = threading.Event()
+        recorder = RecordingWriter(block)
+        writer = SearchHistoryWriter(recorder, max_queue=1, batch_size=1, flush_interval=60,
+                                     overflow_policy=policy)
+
+        writer.submit('user', 'Москва', '2024')
+        time.sleep(0.1)
+        writer.submit('user', 'Москва', '2024')
+
+        return writer, recorder, block
+
+    def test_drop_policy(self):
+        writer, recorder, block = self.fill_queue('drop')
+
+        self.assertFalse(writer.submit('user', 'Казань', '2024'))
+        self.assertEqual(writer.get_stats()['dropped'], 1)
+
+        block.set()
+        writer.stop(2)
+        self.assertEqual(sum(len(batch) for batch in recorder.batches), 2)
+
+    def test_sync_policy(self):
+        writer, recorder, block = self.fill_queue('sync')
+        recorder.block = None
+
+        self.assertTrue(writer.submit('user', 'Казань', '2024'))
+        self.assertEqual(writer.get_stats()['sync_writes'], 1)
+        self.assertIn([('user', 'Казань', '2024')], recorder.batches)
+
+        block.set()
+        writer.stop(2)
+        self.assertEqual(sum(len(batch) for batch in recorder.batches), 3)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            SearchHistoryWriter(RecordingWriter(), overflow_policy='ignore')
+
+
+class TestSaveSearchHistoryBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_patch = patch('models.db_path', os.path.join(self.tmp_dir.name, 'history.db'))
+        self.db_patch.start()
+
+    def tearDown(self):
+        self.db_patch.stop()
+        close_pool()
+        self.tmp_dir.cleanup()
+
+    def test_history_and_counts_are_saved_together(self):
+        self.assertTrue(save_search_history_batch([('user1', 'Москва', '2024'), ('user2', 'москва', '2024'),
+                                                   ('user1', 'Казань', '2024')]))
+
+        with get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM search_history").fetchone()[0], 3)
+            self.assertEqual(conn.execute("SELECT city_key, count FROM city_counts ORDER BY city_key").fetchall(),
+                             [('казань', 1), ('москва', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
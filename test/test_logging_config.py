@@ -0,0 +1,124 @@
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import threading
+import unittest
+
+from logging_config import (NonBlockingQueueHandler, create_file_handler, create_log_handler, get_logging_stats,
+                            parse_log_levels)
+
+
+class ThreadRecorder:
+    # Запоминает поток, в котором значение было подставлено в сообщение
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return 'recorded'
+
+
+class TestLoggingConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'weather.log')
+        self.queue = queue.Queue(maxsize=1000)
+        # Отдельный логгер вне иерархии logging, чтобы записи не попадали в обработчики pytest
+        self.logger = logging.Logger('test_logging_config', logging.DEBUG)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.tmp_dir.cleanup()
+
+    def test_parse_log_levels(self):
+        self.assertEqual(parse_log_levels('main=warning, models = ERROR,,broken'),
+                         {'main': 'WARNING', 'models': 'ERROR'})
+        self.assertEqual(parse_log_levels(''), {})
+
+    def test_args_are_substituted_in_caller_and_line_is_written_by_listener_thread(self):
+        file_handler = create_file_handler(self.path, max_bytes=10_000, backup_count=1)
+        format_threads = []
+        format_record = file_handler.formatter.format
+
+        def recording_format(record):
+            format_threads.append(threading.current_thread().name)
+            return format_record(record)
+
+        file_handler.formatter.format = recording_format
+        listener = logging.handlers.QueueListener(self.queue, file_handler)
+        value = ThreadRecorder()
+
+        self.logger.info('City %s: %s', 'Москва', value)
+        self.assertEqual(value.threads, [threading.current_thread().name])
+        self.assertEqual(format_threads, [])
+
+        listener.start()
+        listener.stop()
+        file_handler.close()
+
+        with open(self.path, encoding='utf-8') as file:
+            self.assertIn('test_logging_config - INFO - City Москва: recorded', file.read())
+        self.assertTrue(format_threads)
+        self.assertNotIn(threading.current_thread().name, format_threads)
+
+    def test_mutable_args_are_logged_as_they_were(self):
+        params = {'city': 'Москва'}
+
+        self.logger.info('Params: %s', params)
+        params['city'] = 'Казань'
+
+        record = self.queue.get_nowait()
+        self.assertEqual(record.getMessage(), "Params: {'city': 'Москва'}")
+        self.assertIsNone(record.args)
+
+    def test_exception_is_not_kept_in_queue(self):
+        try:
+            raise ValueError('upstream error')
+        except ValueError:
+            self.logger.exception('Request failed')
+
+        record = self.queue.get_nowait()
+        self.assertIsNone(record.exc_info)
+        self.assertIn('ValueError: upstream error', record.exc_text)
+        self.assertIn('ValueError: upstream error', logging.Formatter().format(record))
+
+    def test_file_is_rotated_by_size(self):
+        file_handler = create_file_handler(self.path, max_bytes=500, backup_count=2)
+        listener = logging.handlers.QueueListener(self.queue, file_handler)
+        listener.start()
+
+        for i in range(100):
+            self.logger.info('Message number %s', i)
+
+        listener.stop()
+        file_handler.close()
+
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.assertTrue(os.path.exists(self.path + '.2'))
+        self.assertFalse(os.path.exists(self.path + '.3'))
+
+    def test_dash_logs_to_stderr(self):
+        handler = create_log_handler('-')
+
+        self.assertIsInstance(handler, logging.StreamHandler)
+        self.assertNotIsInstance(handler, logging.FileHandler)
+        self.assertIsInstance(create_log_handler(self.path), logging.handlers.RotatingFileHandler)
+
+    def test_full_queue_drops_records_without_blocking(self):
+        self.handler.queue = queue.Queue(maxsize=2)
+        dropped_before = get_logging_stats()['dropped']
+
+        for i in range(5):
+            self.logger.info('Message number %s', i)
+
+        self.assertEqual(self.handler.queue.qsize(), 2)
+        self.assertEqual(get_logging_stats()['dropped'] - dropped_before, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
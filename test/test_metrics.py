@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+
+from main import app
+from metrics import Counter, Histogram, StageTimer, cache_metrics, stage_duration, timed, upstream_errors
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_duration_seconds', 'Тест', ('stage',), buckets=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, 'geocode')
+
+        lines = histogram.collect()
+
+        self.assertIn('# TYPE test_duration_seconds histogram', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="geocode",le="0.1"} 2', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="geocode",le="1.0"} 3', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="geocode",le="+Inf"} 4', lines)
+        self.assertIn('test_duration_seconds_sum{stage="geocode"} 2.65', lines)
+        self.assertIn('test_duration_seconds_count{stage="geocode"} 4', lines)
+
+    def test_counter_escapes_label_values(self):
+        counter = Counter('test_total', 'Тест', ('city',))
+        counter.inc('Нью "Йорк"', amount=2)
+
+        self.assertIn('test_total{city="Нью \\"Йорк\\""} 2', counter.collect())
+
+    def test_timed_counts_upstream_errors(self):
+        @timed('test_upstream', upstream='test_api')
+        def failing():
+            raise ConnectionError('timeout')
+
+        errors_before = upstream_errors.get('test_api')
+
+        with self.assertRaises(ConnectionError):
+            failing()
+        with self.assertRaises(ValueError), StageTimer('test_upstream', upstream='test_api'):
+            raise ValueError('bad response')
+
+        self.assertEqual(upstream_errors.get('test_api') - errors_before, 2)
+        self.assertIn('weather_stage_duration_seconds_count{stage="test_upstream"} 2', stage_duration.collect())
+
+    def test_cache_hit_ratio(self):
+        lines = cache_metrics({'forecast': (3, 1), 'page': (0, 0)})
+
+        self.assertIn('weather_cache_requests_total{cache="forecast",result="hit"} 3', lines)
+        self.assertIn('weather_cache_hit_ratio{cache="forecast"} 0.75', lines)
+        self.assertIn('weather_cache_hit_ratio{cache="page"} 0', lines)
+
+    def test_metrics_route(self):
+        client = app.test_client()
+
+        with patch('main.get_last_city_records', return_value=None):
+            client.get('/')
+        response = client.get('/metrics')
+        body = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn('weather_stage_duration_seconds_bucket{stage="request",le="+Inf"}', body)
+        self.assertIn('weather_stage_duration_seconds_count{stage="render.base.html"}', body)
+        self.assertIn('weather_cache_hit_ratio{cache="forecast"}', body)
+        self.assertIn('weather_component_stats{component="geocode_flight",counter="coalesced"}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
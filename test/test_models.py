@@ -1,8 +1,13 @@
 import os
 import sqlite3
+import tempfile
+import threading
 import unittest
+from unittest.mock import patch
+
+import models
 from models import (create_search_history_table, create_city_counts_table, db_path, insert_search_history,
-                    get_last_searched_city, update_city_count)
+                    get_last_searched_city, update_city_count, close_pool, get_connection, get_pool, get_top_cities)
 from datetime import datetime
 
 
@@ -17,7 +22,11 @@ class TestWeatherHistory(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         # Удаляем временную базу данных после тестов
+        close_pool()
         os.remove(db_path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
 
     def test_insert_and_get_last_searched_city(self):
         user_id = "user1"
@@ -63,5 +72,115 @@ class TestWeatherHistory(unittest.TestCase):
             self.assertEqual(result[0], 2)
 
 
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_patch = patch('models.db_path', os.path.join(self.tmp_dir.name, 'pool.db'))
+        self.db_patch.start()
+
+    def tearDown(self):
+        self.db_patch.stop()
+        close_pool()
+        self.tmp_dir.cleanup()
+
+    def test_connections_use_wal_and_are_reused(self):
+        with get_connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+            first = conn
+
+        with get_connection() as conn:
+            self.assertIs(conn, first)
+
+    def test_schema_is_created_once_with_pool(self):
+        with patch('models.init_schema', wraps=models.init_schema) as mock_init:
+            insert_search_history('user', 'Москва', '2024-01-01T00:00:00')
+            get_last_searched_city('user')
+            update_city_count('Москва')
+
+        self.assertEqual(mock_init.call_count, 1)
+        self.assertEqual(get_last_searched_city('user'), [('Москва',)])
+
+    def test_last_city_lookup_uses_user_index(self):
+        with get_connection() as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT city FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+                ('user',)
+            ).fetchall()
+
+        self.assertIn('idx_search_history_user_id', ' '.join(row[-1] for row in plan))
+        self.assertNotIn('TEMP B-TREE', ' '.join(row[-1] for row in plan))
+
+    def test_concurrent_inserts(self):
+        get_pool()
+        threads = [threading.Thread(target=insert_search_history, args=(f'user{i}', 'Казань', '2024'))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with get_connection() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM search_history').fetchone()[0], 20)
+
+
+class TestCityCounts(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'counts.db')
+        self.db_patch = patch('models.db_path', self.path)
+        self.db_patch.start()
+
+    def tearDown(self):
+        self.db_patch.stop()
+        close_pool()
+        self.tmp_dir.cleanup()
+
+    def get_counts(self):
+        with get_connection() as conn:
+            return conn.execute("SELECT city_key, count FROM city_counts ORDER BY city_key").fetchall()
+
+    def test_concurrent_increments_are_not_lost(self):
+        spellings = ['Москва', 'москва', ' МОСКВА ']
+        threads_count = 16
+        increments = 50
+
+        def worker(index):
+            for _ in range(increments):
+                update_city_count(spellings[index % len(spellings)])
+
+        get_pool()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.get_counts(), [('москва', threads_count * increments)])
+
+    def test_migration_merges_legacy_duplicates(self):
+        # База в старом формате: без city_key и с дублями одного города
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE city_counts (id INTEGER PRIMARY KEY AUTOINCREMENT, city TEXT, count INTEGER)")
+            conn.executemany("INSERT INTO city_counts (city, count) VALUES (?, ?)",
+                             [('Орёл', 3), ('орел', 2), ('Казань', 1), ('ОРЕЛ', 1)])
+        conn.close()
+
+        update_city_count('Орел')
+
+        self.assertEqual(self.get_counts(), [('казань', 1), ('орел', 7)])
+        with get_connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], len(models.SCHEMA_MIGRATIONS))
+
+    def test_top_cities_are_ordered_by_count(self):
+        for city, count in [('Казань', 2), ('Москва', 5), ('Сочи', 1)]:
+            for _ in range(count):
+                update_city_count(city)
+
+        self.assertEqual(get_top_cities(2), ['Москва', 'Казань'])
+        self.assertEqual(get_top_cities(10), ['Москва', 'Казань', 'Сочи'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import openmeteo_client
+from openmeteo_client import get_openmeteo_client, reset_openmeteo_client
+
+
+class TestOpenMeteoClient(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_patch = patch('openmeteo_client.open_meteo_http_cache_path',
+                                 os.path.join(self.tmp_dir.name, 'http_cache'))
+        self.cache_patch.start()
+        reset_openmeteo_client()
+
+    def tearDown(self):
+        reset_openmeteo_client()
+        self.cache_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def test_client_is_shared_between_threads(self):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(get_openmeteo_client())) for _ in range(8)]
+
+        with patch('openmeteo_client.create_session', wraps=openmeteo_client.create_session) as mock_create:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            mock_create.assert_called_once()
+
+        self.assertTrue(all(client is clients[0] for client in clients))
+
+    def test_session_settings(self):
+        session = openmeteo_client.create_session(pool_size=4, timeout=(1, 2), retries=3, backoff_factor=0.5)
+        adapter = session.get_adapter('https://api.open-meteo.com/v1/forecast')
+
+        self.assertEqual(session.timeout, (1, 2))
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertEqual(adapter.max_retries.backoff_factor, 0.5)
+        session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from forecast_cache import ForecastCache
+from prefetch import PrefetchScheduler
+from test_get_weather import make_hourly
+
+COORDINATES = {'Москва': (55.75, 37.62), 'Казань': (55.79, 49.12), 'Химки': (55.89, 37.44), 'Сочи': (43.6, 39.73)}
+
+
+class RecordingFetcher:
+    def __init__(self, start: int):
+        self.start = start
+        self.calls = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, cells):
+        with self.lock:
+            self.calls.append(list(cells))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return [make_hourly(self.start) for _ in cells]
+
+
+class TestPrefetchScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1_700_000_000 - 1_700_000_000 % 3600 + 600
+        self.fetcher = RecordingFetcher(self.now - 600)
+        self.cache = ForecastCache(refresh_margin=0)
+        # Время записи (fetched_at) берется из time.time(), поэтому фиксируем его
+        self.patches = [
+            patch('prefetch.forecast_cache', self.cache),
+            patch('prefetch.geocode_city', side_effect=COORDINATES.get),
+            patch('forecast_cache.time.time', return_value=self.now),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in self.patches:
+            item.stop()
+
+    def make_scheduler(self, cities, **kwargs):
+        options = dict(top_n=10, interval=600, jitter=0, concurrency=2, batch_size=2, budget=10)
+        options.update(kwargs)
+        return PrefetchScheduler(get_cities=lambda limit: cities[:limit], fetch_batch=self.fetcher, **options)
+
+    def test_top_cities_are_warmed_in_batches(self):
+        scheduler = self.make_scheduler(['Москва', 'Казань', 'Химки', 'Несуществующийгород'])
+
+        scheduler.run_once(now=self.now)
+
+        self.assertEqual(sorted(len(batch) for batch in self.fetcher.calls), [1, 2])
+        for city in ['Москва', 'Казань', 'Химки']:
+            self.assertIsNotNone(self.cache.lookup(*COORDINATES[city], now=self.now))
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['warmed'], 3)
+        self.assertEqual(stats['requests'], 2)
+
+    def test_fresh_cells_are_not_requested_again(self):
+        scheduler = self.make_scheduler(['Москва', 'Казань'])
+
+        scheduler.run_once(now=self.now)
+        scheduler.run_once(now=self.now + 60)
+
+        self.assertEqual(len(self.fetcher.calls), 1)
+        self.assertEqual(scheduler.get_stats()['fresh'], 2)
+
+    def test_next_hour_is_warmed_before_it_starts(self):
+        scheduler = self.make_scheduler(['Москва'])
+        near_end_of_hour = self.now + 2700
+
+        scheduler.run_once(now=near_end_of_hour)
+
+        next_hour = near_end_of_hour + 600
+        self.assertIsNotNone(self.cache.lookup(*COORDINATES['Москва'], now=next_hour))
+
+    def test_budget_and_concurrency_are_respected(self):
+        scheduler = self.make_scheduler(list(COORDINATES), batch_size=1, budget=3, concurrency=2)
+
+        scheduler.run_once(now=self.now)
+
+        self.assertEqual(len(self.fetcher.calls), 3)
+        self.assertLessEqual(self.fetcher.max_active, 2)
+        self.assertEqual(scheduler.get_stats()['deferred'], 1)
+
+    def test_request_error_is_counted(self):
+        def failing_fetch(cells):
+            raise Exception('upstream error')
+
+        scheduler = PrefetchScheduler(get_cities=lambda limit: ['Москва'], fetch_batch=failing_fetch,
+                                      interval=600, jitter=0)
+
+        scheduler.run_once(now=self.now)
+
+        self.assertEqual(scheduler.get_stats()['request_errors'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from forecast_cache import ForecastCache
+from resilience import (CircuitBreaker, Upstream, UpstreamUnavailable, get_stale_age, start_stale_tracking)
+from test_forecast_cache import CountingLoader
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise ConnectionError('connection refused')
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.upstream = Upstream('api', 2, breaker=CircuitBreaker('api', 2, reset_timeout=30, clock=self.clock))
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            with self.assertRaises(UpstreamUnavailable):
+                self.upstream.call(fail)
+
+        calls = []
+        with self.assertRaises(UpstreamUnavailable) as ctx:
+            self.upstream.call(calls.append, 1)
+
+        self.assertEqual(calls, [])
+        self.assertEqual(ctx.exception.retry_after, 30)
+        self.assertEqual(self.upstream.get_stats()['breaker_state'], 2)
+        self.assertEqual(self.upstream.get_stats()['breaker_rejected'], 1)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        for _ in range(2):
+            with self.assertRaises(UpstreamUnavailable):
+                self.upstream.call(fail)
+
+        self.clock.now = 31
+        with self.assertRaises(UpstreamUnavailable):
+            self.upstream.call(fail)
+        self.assertEqual(self.upstream.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now = 62
+        self.assertEqual(self.upstream.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.upstream.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_success_resets_failure_count(self):
+        with self.assertRaises(UpstreamUnavailable):
+            self.upstream.call(fail)
+        self.upstream.call(lambda: None)
+        with self.assertRaises(UpstreamUnavailable):
+            self.upstream.call(fail)
+
+        self.assertEqual(self.upstream.breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestUpstream(unittest.TestCase):
+
+    def test_wraps_errors(self):
+        upstream = Upstream('api', 1)
+
+        with self.assertRaises(UpstreamUnavailable) as ctx:
+            upstream.call(fail)
+
+        self.assertIsInstance(ctx.exception.__cause__, ConnectionError)
+        self.assertEqual(ctx.exception.upstream, 'api')
+
+    def test_rejects_calls_over_concurrency_limit(self):
+        upstream = Upstream('api', 1, queue_timeout=0.05)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=upstream.call, args=(slow,))
+        thread.start()
+        started.wait(5)
+
+        try:
+            with self.assertRaises(UpstreamUnavailable):
+                upstream.call(lambda: None)
+        finally:
+            release.set()
+            thread.join()
+
+        stats = upstream.get_stats()
+        self.assertEqual(stats['queue_timeouts'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['breaker_failures'], 0)
+
+
+class TestStaleForecast(unittest.TestCase):
+
+    def setUp(self):
+        start_stale_tracking()
+
+    def test_returns_last_good_forecast_when_upstream_unavailable(self):
+        cache = ForecastCache(refresh_margin=0, max_stale=6 * 3600, stale_retry=60)
+        now = 1_700_000_000 // 3600 * 3600 + 60
+        with patch('forecast_cache.time.time', return_value=now):
+            expected = cache.get(55.75, 37.62, CountingLoader(), now=now)
+
+        def unavailable(lat, long):
+            raise UpstreamUnavailable('open_meteo')
+
+        hourly = cache.get(55.75, 37.62, unavailable, now=now + 2 * 3600)
+
+        self.assertIs(hourly['temperature_2m'].base, expected['temperature_2m'].base)
+        self.assertEqual(get_stale_age(), 2 * 3600)
+        self.assertEqual(cache.get_stats()['stale_hits'], 1)
+
+        with self.assertRaises(UpstreamUnavailable):
+            cache.get(55.75, 37.62, unavailable, now=now + 7 * 3600)
+
+    def test_fresh_forecast_is_not_stale(self):
+        ForecastCache(refresh_margin=0).get(55.75, 37.62, CountingLoader())
+
+        self.assertIsNone(get_stale_age())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from forecast_cache import ForecastCache
+from get_weather import get_weather
+from singleflight import SingleFlight
+from test_get_weather import make_hourly
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def run_concurrently(self, target, count):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def worker(index):
+            barrier.wait()
+            try:
+                results[index] = target()
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        return results
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow_lookup(city):
+            calls.append(city)
+            time.sleep(0.2)
+            return 55.75, 37.62
+
+        results = self.run_concurrently(lambda: flight.do('москва', slow_lookup, 'Москва'), 8)
+
+        self.assertEqual(calls, ['Москва'])
+        self.assertEqual(results, [(55.75, 37.62)] * 8)
+        self.assertEqual(flight.get_stats(), {'executions': 1, 'coalesced': 7, 'errors': 0, 'in_flight': 0})
+
+    def test_error_is_shared_and_key_is_released(self):
+        flight = SingleFlight()
+
+        def failing():
+            time.sleep(0.2)
+            raise ConnectionError('upstream error')
+
+        results = self.run_concurrently(lambda: flight.do('key', failing), 4)
+
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual(flight.do('key', lambda: 'ok'), 'ok')
+        self.assertEqual(flight.get_stats()['executions'], 2)
+
+    def test_different_keys_are_not_coalesced(self):
+        flight = SingleFlight()
+
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+        self.assertEqual(flight.do('b', lambda: 2), 2)
+        self.assertEqual(flight.get_stats()['coalesced'], 0)
+
+    def test_concurrent_cache_misses_fetch_forecast_once(self):
+        start = int(time.time()) // 3600 * 3600
+        calls = []
+
+        def slow_fetch(lat, long):
+            calls.append((lat, long))
+            time.sleep(0.2)
+            return make_hourly(start)
+
+        with patch('get_weather.fetch_hourly', side_effect=slow_fetch), \
+                patch('get_weather.forecast_cache', ForecastCache(refresh_margin=0)), \
+                patch('get_weather.forecast_flight', SingleFlight()):
+            results = self.run_concurrently(lambda: get_weather(55.75, 37.62), 6)
+
+        self.assertEqual(calls, [(55.8, 37.6)])
+        self.assertTrue(all(result == results[0] for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
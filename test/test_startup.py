@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from utils import HEAVY_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Верхняя граница времени импорта main (мс) - с большим запасом, чтобы ловить только заметные регрессии
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', '1500'))
+
+
+def import_time(module: str, env: dict | None = None) -> dict[str, int]:
+    """
+    Импортирует модуль в отдельном процессе с -X importtime.
+
+    :return: Dict: Накопленное время импорта (мкс) по именам загруженных модулей.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=dict(os.environ, **(env or {})),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = int(cumulative)
+
+    return timings
+
+
+def is_imported(timings: dict[str, int], package: str) -> bool:
+    # Строка самого пакета может отсутствовать в выводе, поэтому учитываются и его подмодули
+    return any(name == package or name.startswith(f'{package}.') for name in timings)
+
+
+class TestStartupImports(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Модули, которые загружает сам интерпретатор (site и т.п.), к запуску приложения не относятся
+        cls.interpreter_modules = import_time('sys')
+
+    def test_heavy_modules_are_not_imported_at_startup(self):
+        timings = import_time('main', {'WEATHER_EAGER_IMPORTS': '0'})
+
+        for package in (*HEAVY_MODULES, 'pandas'):
+            if not is_imported(self.interpreter_modules, package):
+                self.assertFalse(is_imported(timings, package), package)
+        self.assertLess(timings['main'] / 1000, IMPORT_TIME_BUDGET_MS)
+
+    def test_eager_mode_imports_heavy_modules(self):
+        timings = import_time('main', {'WEATHER_EAGER_IMPORTS': '1'})
+
+        for package in HEAVY_MODULES:
+            self.assertTrue(is_imported(timings, package), package)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,19 @@
+import contextvars
+import gzip
+import json
 import sqlite3
+import time
 from unittest.mock import patch
 
 import pytest
 import unittest
 from datetime import datetime
-from main import app, save_search_history, weather_get_post, get_last_searched_city
+from cache_backends import MemoryCacheBackend
+from last_city import LastCityCache
+from main import app, save_search_history, weather_async
+from models import close_pool, get_last_searched_city
+from page_cache import ForecastPageCache
+from resilience import UpstreamUnavailable, mark_stale
 
 
 def test_save_search_history_calls_insert_and_update():
@@ -13,7 +22,8 @@ def test_save_search_history_calls_insert_and_update():
     timestamp = "2023-10-01T12:00:00"
 
     with patch('main.insert_search_history') as mock_insert, \
-            patch('main.update_city_search_count') as mock_update:
+            patch('main.update_city_search_count') as mock_update, \
+            patch('main.search_history_writer', None):
         # Включите аргумент conn в вызов функции
         save_search_history(user_id, city, timestamp)
 
@@ -21,6 +31,302 @@ def test_save_search_history_calls_insert_and_update():
         mock_update.assert_called_once_with(city)
 
 
+def test_weather_batch_route():
+    result = {'Москва': {'12': {'Temperature': '5°'}}, 'Атлантида': None}
+
+    with patch('main.get_weather_data_batch', return_value=result) as mock_batch:
+        response = app.test_client().get('/api/weather/batch?city=Москва&city=Атлантида')
+
+    mock_batch.assert_called_once_with(['Москва', 'Атлантида'])
+    assert response.status_code == 200
+    assert response.get_json() == [{'city': 'Москва', 'weather': {'12': {'Temperature': '5°'}}},
+                                   {'city': 'Атлантида', 'weather': None}]
+
+
+def test_weather_batch_route_validates_input():
+    client = app.test_client()
+
+    assert client.get('/api/weather/batch').status_code == 400
+    assert client.post('/api/weather/batch', json={'cities': 'Москва'}).status_code == 400
+
+    with patch('main.batch_max_cities', 2):
+        assert client.post('/api/weather/batch', json={'cities': ['a', 'b', 'c']}).status_code == 400
+
+
+def test_weather_batch_route_reports_unavailable_upstream():
+    error = UpstreamUnavailable('open_meteo', 'circuit breaker is open', retry_after=30)
+
+    with patch('main.get_weather_data_batch', side_effect=error):
+        response = app.test_client().get('/api/weather/batch?city=Москва&city=Казань')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+
+
+def test_forecast_api_returns_selected_columns():
+    forecast = {'start': 1700000000, 'interval': 3600, 'count': 2, 'fields': {'temperature_2m': [5, 6]}}
+    client = app.test_client()
+
+    with patch('main.get_forecast_columns', return_value=forecast) as mock_forecast:
+        response = client.get('/api/forecast?city=Москва&fields=temperature_2m')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'city': 'Москва', **forecast}
+    assert response.headers.get('Content-Encoding') is None
+    mock_forecast.assert_called_once_with('Москва', ['temperature_2m'], hours=24, days=0)
+
+
+def test_forecast_api_passes_horizon_and_daily_summary():
+    forecast = {'start': 1700000000, 'interval': 3600, 'count': 1, 'fields': {'temperature_2m': [5]},
+                'daily': {'dates': ['2023-11-15'], 'count': 1, 'fields': {'temperature_2m_max': [5]}}}
+    client = app.test_client()
+
+    with patch('main.get_forecast_columns', return_value=forecast) as mock_forecast:
+        response = client.get('/api/forecast?city=Москва&hours=72&days=3')
+
+        assert client.get('/api/forecast?city=Москва&hours=0').status_code == 400
+        assert client.get('/api/forecast?city=Москва&hours=169').status_code == 400
+        assert client.get('/api/forecast?city=Москва&days=8').status_code == 400
+        assert client.get('/api/forecast?city=Москва&days=two').status_code == 400
+
+    assert response.status_code == 200
+    assert response.get_json()['daily'] == forecast['daily']
+    mock_forecast.assert_called_once_with('Москва', None, hours=72, days=3)
+
+
+def test_forecast_api_compresses_large_payload():
+    forecast = {'start': 1700000000, 'interval': 3600, 'count': 168,
+                'fields': {'temperature_2m': list(range(168)), 'weather_code': [3] * 168}}
+    client = app.test_client()
+
+    with patch('main.get_forecast_columns', return_value=forecast):
+        response = client.get('/api/forecast?city=Москва', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.get_data())) == {'city': 'Москва', **forecast}
+
+
+def test_forecast_api_validates_input():
+    client = app.test_client()
+
+    with patch('main.get_forecast_columns', return_value=None):
+        assert client.get('/api/forecast').status_code == 400
+        assert client.get('/api/forecast?city=Москва&fields=temperature_2m,pressure').status_code == 400
+        assert client.get('/api/forecast?city=Несуществующийгород').status_code == 404
+
+
+def test_forecast_api_reports_unavailable_upstream():
+    client = app.test_client()
+    error = UpstreamUnavailable('open_meteo', 'circuit breaker is open', retry_after=12.4)
+
+    with patch('main.get_forecast_columns', side_effect=error):
+        response = client.get('/api/forecast?city=Москва')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '12'
+
+
+def test_forecast_api_marks_stale_forecast():
+    forecast = {'start': 1700000000, 'interval': 3600, 'count': 1, 'fields': {'temperature_2m': [5]}}
+    client = app.test_client()
+
+    def stale_forecast(city, fields, **kwargs):
+        mark_stale(7200)
+        return dict(forecast)
+
+    # Отдельный контекст, чтобы отметка об устаревшем прогнозе не попала в другие тесты
+    with patch('main.get_forecast_columns', side_effect=stale_forecast):
+        response = contextvars.copy_context().run(client.get, '/api/forecast?city=Москва')
+
+    assert response.status_code == 200
+    assert response.get_json()['stale'] is True
+    assert response.headers['Warning'] == '110 - "Response is Stale"'
+
+
+def test_unavailable_upstream_is_not_reported_as_unknown_city():
+    client = app.test_client()
+
+    with patch('main.get_weather_data', side_effect=UpstreamUnavailable('nominatim', retry_after=30)), \
+            patch('main.forecast_page_cache', ForecastPageCache()), \
+            patch('main.get_last_city_records', return_value=None):
+        response = client.get('/?city=Москва')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+    assert 'временно недоступен' in response.get_data(as_text=True)
+
+
+def test_stale_forecast_page_is_not_cached():
+    weather_result = {str(hour): {'Temperature': '5°', 'weather_code': '../static/img/fog-1.svg'}
+                      for hour in range(24)}
+
+    def stale_weather(city):
+        mark_stale(7200)
+        return weather_result
+
+    client = app.test_client()
+
+    with patch('main.get_weather_data', side_effect=stale_weather) as mock_weather, \
+            patch('main.forecast_page_cache', ForecastPageCache()), \
+            patch('main.get_last_city_records', return_value=None):
+        first = contextvars.copy_context().run(client.get, '/?city=Москва')
+        contextvars.copy_context().run(client.get, '/?city=Москва')
+
+    assert first.status_code == 200
+    assert first.headers['Warning'] == '110 - "Response is Stale"'
+    assert mock_weather.call_count == 2
+
+
+def test_weather_async_runs_db_lookup_and_forecast_concurrently():
+    weather_result = {str(hour): {'Temperature': '5°', 'weather_code': '../static/img/fog-1.svg'}
+                      for hour in range(24)}
+
+    def slow_last_city(user_id):
+        time.sleep(0.2)
+        return [('казань',)]
+
+    def slow_weather(city):
+        time.sleep(0.2)
+        return weather_result
+
+    with patch('main.get_last_city_records', side_effect=slow_last_city) as mock_last_city, \
+            patch('main.get_weather_data', side_effect=slow_weather), \
+            patch('main.save_search_history') as mock_save, \
+            patch('main.forecast_page_cache', ForecastPageCache()), \
+            patch('main.render_template', return_value='page') as mock_render, \
+            app.test_request_context('/', method='POST', data={'city': 'Москва'}):
+        started = time.perf_counter()
+        assert app.ensure_sync(weather_async)() == 'page'
+        elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.35
+    mock_last_city.assert_called_once()
+    mock_save.assert_called_once()
+    fragment_call, page_call = mock_render.call_args_list
+    assert fragment_call.args == ('forecast.html',)
+    assert fragment_call.kwargs['city'] == 'Москва'
+    assert fragment_call.kwargs['weather_now']['weather_code'] == '../static/img/fog.svg'
+    assert page_call.args == ('get_weather.html',)
+    assert page_call.kwargs['link_data'] == {'text': 'Казань', 'href': '/?city=казань'}
+
+
+def test_forecast_fragment_is_rendered_once_per_city_and_hour():
+    weather_result = {str(hour): {'Temperature': '5°', 'weather_code': '../static/img/fog-1.svg'}
+                      for hour in range(24)}
+    client = app.test_client()
+
+    with patch('main.get_weather_data', return_value=weather_result) as mock_weather, \
+            patch('main.forecast_page_cache', ForecastPageCache()), \
+            patch('main.get_last_city_records', return_value=None):
+        first = client.get('/?city=Москва')
+        second = client.get('/?city=москва ')
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert 'Москва' in first.get_data(as_text=True)
+    mock_weather.assert_called_once()
+
+
+def test_forecast_fragment_renders_display_city_name():
+    weather_result = {str(hour): {'Temperature': '5°', 'weather_code': '../static/img/fog-1.svg'}
+                      for hour in range(24)}
+    client = app.test_client()
+
+    with patch('main.get_weather_data', return_value=weather_result), \
+            patch('main.forecast_page_cache', ForecastPageCache()), \
+            patch('main.get_last_city_records', return_value=None), \
+            patch('main.render_template', return_value='page') as mock_render:
+        for city in ('орел', '  нижний   НОВГОРОД ', ' иннополис '):
+            client.get('/', query_string={'city': city})
+
+    fragment_cities = [call.kwargs['city'] for call in mock_render.call_args_list if call.args == ('forecast.html',)]
+    # Название из справочника (с буквой 'ё'), для города не из справочника - запрос без лишних пробелов
+    assert fragment_cities == ['Орёл', 'Нижний Новгород', 'Иннополис']
+
+
+def test_conditional_get_returns_not_modified():
+    weather_result = {str(hour): {'Temperature': '5°', 'weather_code': '../static/img/fog-1.svg'}
+                      for hour in range(24)}
+    client = app.test_client()
+
+    with patch('main.get_weather_data', return_value=weather_result), \
+            patch('main.forecast_page_cache', ForecastPageCache()), \
+            patch('main.get_last_city_records', return_value=[('казань',)]):
+        first = client.get('/?city=Москва')
+        etag = first.headers['ETag']
+        second = client.get('/?city=Москва', headers={'If-None-Match': etag})
+
+        # Другая ссылка на последний город - другая страница, ETag не совпадает
+        with patch('main.get_last_city_records', return_value=[('сочи',)]):
+            third = client.get('/?city=Москва', headers={'If-None-Match': etag})
+
+    assert first.status_code == 200
+    assert first.headers['Last-Modified']
+    assert 'no-cache' in first.headers['Cache-Control']
+    assert second.status_code == 304
+    assert second.get_data() == b''
+    assert third.status_code == 200
+
+
+def test_save_search_history_uses_write_behind_queue():
+    with patch('main.search_history_writer') as mock_writer, \
+            patch('main.insert_search_history') as mock_insert:
+        save_search_history("test_user", "Moscow", "2023-10-01T12:00:00")
+
+    mock_writer.submit.assert_called_once_with("test_user", "Moscow", "2023-10-01T12:00:00")
+    mock_insert.assert_not_called()
+
+
+def test_last_city_is_read_once_per_request_and_cached_between_requests(tmp_path):
+    weather_result = {str(hour): {'Temperature': '5°', 'weather_code': '../static/img/fog-1.svg'}
+                      for hour in range(24)}
+    client = app.test_client()
+
+    with patch('models.db_path', str(tmp_path / 'weather.db')), \
+            patch('main.search_history_writer', None), \
+            patch('main.debug_headers', True), \
+            patch('main.get_weather_data', return_value=weather_result), \
+            patch('last_city.last_city_cache', LastCityCache()), \
+            patch('last_city.get_last_searched_city', wraps=get_last_searched_city) as mock_last_city:
+        response = client.post('/', data={'city': 'Москва'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+        assert response.status_code == 200
+        assert mock_last_city.call_count == 1
+        # Один поиск последнего города и две записи истории
+        assert response.headers['X-DB-Round-Trips'] == '3'
+
+        response = client.get('/', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+        assert mock_last_city.call_count == 1
+        assert response.headers['X-DB-Round-Trips'] == '0'
+        assert 'Москва' in response.get_data(as_text=True)
+
+    close_pool()
+
+
+def test_last_city_saved_by_one_worker_is_seen_by_another():
+    backend = MemoryCacheBackend()
+    worker_a, worker_b = LastCityCache(backend=backend), LastCityCache(backend=backend)
+
+    worker_b.set('10.0.0.1', None)
+    worker_a.set('10.0.0.1', [('москва',)])
+
+    assert worker_b.get('10.0.0.1') == [('москва',)]
+    # Пользователь без истории поиска
+    worker_a.set('10.0.0.2', None)
+    assert worker_b.get('10.0.0.2') is None
+    assert worker_b.get_stats()['hits'] == 2
+
+
+def test_debug_headers_are_off_by_default():
+    with patch('main.debug_headers', False), patch('main.get_last_city_records', return_value=None):
+        response = app.test_client().get('/')
+
+    assert 'X-DB-Round-Trips' not in response.headers
+
+
 class TestDatabase:
     @pytest.fixture(autouse=True)
     def setup_database(self):
@@ -0,0 +1,30 @@
+import importlib
+
+# Библиотеки, которые загружаются при первом обращении к Open-Meteo и Nominatim
+HEAVY_MODULES = ('requests', 'requests_cache', 'openmeteo_requests', 'certifi', 'geopy.geocoders')
+
+
+def normalize_city_name(city: str | None) -> str:
+    """
+    Приводит название города к нормализованному виду для использования в качестве ключа.
+
+    Название переводится в нижний регистр, буква 'ё' заменяется на 'е',
+    лишние пробелы по краям и внутри названия убираются.
+
+    :param city: Название города в произвольном написании.
+    :return: Str: Нормализованное название города или пустая строка, если название не задано.
+    """
+    if not city:
+        return ''
+
+    return ' '.join(city.lower().replace('ё', 'е').split())
+
+
+def import_heavy_modules() -> None:
+    """
+    Загружает библиотеки из HEAVY_MODULES заранее, а не при первом запросе к внешним API.
+
+    :return: None
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
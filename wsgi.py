@@ -0,0 +1,12 @@
+"""
+WSGI-точка входа приложения.
+
+Запуск в production (несколько процессов, настройки в gunicorn.conf.py):
+    gunicorn --config gunicorn.conf.py wsgi:app
+
+Схема базы данных проверяется в хуке on_starting gunicorn, фоновый прогрев кэша
+запускается в каждом рабочем процессе в хуке post_worker_init.
+"""
+from main import app
+
+application = app